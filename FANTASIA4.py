@@ -9,10 +9,23 @@
 
 # importaciones etc
 import subprocess
+import sqlite3
 from pathlib import Path
 import csv, sys
 import os
 import time
+import shutil
+from dataclasses import replace
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from fasta_utils import (deduplicar_fasta, normalizar_fasta, expandir_directorio, contar_secuencias,
+                         leer_fasta, digest_secuencia)
+from device_pool import PoolDispositivos, leer_dispositivos
+from manifest import Manifiesto, huella_paso, ruta_temporal, publicar
+from instrumentation import ejecutar, medir, saltado
+from executor import Recursos, ejecutor_actual
+from fantasia_worker import TrabajadoresPorDispositivo, LanzadorCompilados
+from length_batching import preparar_lotes, recombinar_directorio, trocear
 
 
 # configuración ===============================================================
@@ -20,7 +33,6 @@ TSV = "/data/users/sgarjua/ann_diamond_test/species.tsv" # archivo con: nombre e
 OUTDIR = Path("/data/users/sgarjua/SofiaFantasia/") # carpeta con las carpetas de las especies con los fastas
 GENERATE_GPSM = "/data/users/sgarjua/00_software/FANTASIA/generate_gopredsim_input_files.sh"
 LAUNCH_GPSM = "/data/users/sgarjua/00_software/FANTASIA/launch_gopredsim_pipeline.sh"
-GPU = "CUDA_VISIBLE_DEVICES=1"
 TOPGO = "/data/users/sgarjua/00_software/FANTASIA/convert_topgo_format.py"
 
 FANTASIA4 = "/data/users/sgarjua/00_software/Fantasia.SuperLite.Cluster/fantasia_pipeline.py"
@@ -28,55 +40,257 @@ LOOKUP = "/data/users/sgarjua/00_software/Fantasia.SuperLite.Cluster/data/lookup
 ANN = "/data/users/sgarjua/00_software/Fantasia.SuperLite.Cluster/data/lookup/annotations.json"
 ACC = "/data/users/sgarjua/00_software/Fantasia.SuperLite.Cluster/data/lookup/accessions.json"
 
+DEDUP_SECUENCIAS = False # colapsar secuencias idénticas y re-expandir las salidas
+MODO_LOTE = False # un worker persistente por dispositivo para todas las especies (modelo y lookup se cargan una vez; sólo en local)
+RECURSOS_FANTASIA = Recursos(cpus=4, mem_gb=64, gpus=1) # lo que pide cada especie al ejecutor (executor.py); en "cpu", sin gpu
+RESULTADO_TOPGO = None # tabla proteína<TAB>GOs dentro de outputs/; None = el único *topgo* que deja el pipeline
+# ANN/ACC compilados llegan al pipeline como vistas de sólo lectura, no como
+# dict/list: sólo vale si el pipeline se limita a indexarlos (ver fantasia_assets.py)
+ASSETS_COMPILADOS = None # directorio para LOOKUP/ANN/ACC compilados y mapeados en memoria (fantasia_assets.py); None = los originales
+
+# almacén de embeddings por secuencia (embedding_cache.py): sólo se calculan las secuencias nuevas.
+# El fantasia_pipeline.py original no lee embeddings precalculados: hace falta uno
+# parcheado que acepte OPCION_EMBEDDINGS (si el script no la menciona, el almacén
+# se desactiva con un aviso) y cuyo embedding por proteína sea exactamente el de
+# EMBEBEDOR ("prott5": media de los residuos del encoder MODELO_PROTT5); si el
+# pipeline usa otro modelo o pooling, hay que añadir su Embebedor en EMBEBEDORES
+CACHE_EMBEDDINGS = None # directorio del almacén; None = FANTASIA calcula todos los embeddings
+CACHE_EMBEDDINGS_MAX_GB = 100 # tamaño máximo (expulsa los menos usados)
+EMBEBEDOR = "prott5" # "prott5" o "prueba" (composición de aminoácidos en CPU, para pruebas)
+OPCION_EMBEDDINGS = "--embeddings-npy" # opción del pipeline parcheado para leer embeddings precalculados (.npy + .ids.txt)
+MIN_LEN = 0 # longitud mínima al limpiar el fasta (0 = sin filtro)
+MAX_LEN = 0 # longitud máxima al limpiar el fasta (0 = sin filtro)
+
+# lotes por longitud (length_batching.py): el fasta se ordena por longitud en lotes
+# con un máximo de tokens y las proteínas largas se parten en ventanas solapadas
+LOTES_POR_LONGITUD = False
+PRESUPUESTO_TOKENS = 16000 # residuos por lote contando el relleno (n secuencias x la más larga)
+MAX_LONGITUD = 5000 # las proteínas más largas se parten en ventanas de este tamaño
+SOLAPE_VENTANA = 500 # residuos compartidos entre ventanas consecutivas
+
+# dispositivos: cada especie en marcha usa uno en exclusiva (FANTASIA_DEVICES="cuda:0,cuda:1" lo sobreescribe)
+DEVICES = ["cuda:0"]
+CPU_WORKERS = 0 # plazas "cpu" extra para proteomas pequeños
+CPU_MAX_SEQS = 2000 # máximo de secuencias para mandar una especie a cpu
+
 # funciones ===================================================================
 # limpiar el fasta
+# (cabecera hasta el primer espacio, sin . ni * en la secuencia, índice .fai)
+# devuelve False si falla
 def fasta_cleaner(fasta: Path, clean_fasta: Path):
+    species = Path(clean_fasta).parent.name
+    inicio = time.perf_counter()
+
+    manifiesto = Manifiesto(Path(clean_fasta).parent / "manifest.json")
+    huella = huella_paso(entradas={"fasta": fasta}, parametros={"min_len": MIN_LEN, "max_len": MAX_LEN})
 
-    cmd = f"sed -r 's/ .+//' {fasta} > {clean_fasta}"
-    
-    if clean_fasta.exists():
+    if manifiesto.al_dia(f"limpieza_{Path(clean_fasta).name}", huella, [clean_fasta]):
+        saltado("fasta_cleaner", species, time.perf_counter() - inicio, [clean_fasta])
         print(f"[ALREADY DONE] El archivo fasta ya estaba limpio")
+        return True
     else:
         print(f"[RUN] Se va a limpiar el fasta")
         try:
-            subprocess.run(cmd, shell=True, check=True)
-            print(f"[DONE] Limpieza del fasta completada")
-        except subprocess.CalledProcessError as e:
+            with medir("fasta_cleaner", species, entradas=[fasta], salidas=[clean_fasta]):
+                escritas, descartadas = normalizar_fasta(fasta, clean_fasta, min_len=MIN_LEN, max_len=MAX_LEN)
+            manifiesto.registrar(f"limpieza_{Path(clean_fasta).name}", huella, [clean_fasta])
+            print(f"[DONE] Limpieza del fasta completada ({escritas} secuencias, {descartadas} descartadas por longitud)")
+            return True
+        except OSError as e:
             print(f"[FAIL] Revisa parámetros/rutas. Detalle: {e}")
+            return False
+
+# huella de una ejecución: contenido del fasta + identidad del pipeline y de la lookup
+def huella_fantasia(fasta: str):
+    # las ventanas cambian el resultado de las proteínas largas; el presupuesto de tokens no
+    parametros = {"ventanas": [MAX_LONGITUD, SOLAPE_VENTANA]} if LOTES_POR_LONGITUD else None
+    return huella_paso(entradas={"fasta": fasta},
+                       bases={"pipeline": FANTASIA4, "lookup": LOOKUP, "ann": ANN, "acc": ACC},
+                       parametros=parametros)
+
+def fantasia_al_dia(fasta: str, fantasia_run: Path):
+    return Manifiesto(fantasia_run / "manifest.json").al_dia("fantasia4", huella_fantasia(fasta), [fantasia_run / "outputs"])
+
+# tabla proteína<TAB>GOs de una ejecución (la que se compara en analysis.py)
+def tabla_topgo(fantasia_run: Path):
+    out_path = Path(fantasia_run) / "outputs"
+    if RESULTADO_TOPGO:
+        tabla = out_path / RESULTADO_TOPGO
+        return tabla if tabla.is_file() else None
+    candidatas = sorted(p for p in out_path.rglob("*") if p.is_file() and "topgo" in p.name.lower())
+    if len(candidatas) != 1:
+        print(f"[WARN] {len(candidatas)} tablas *topgo* en {out_path}: indica cuál en RESULTADO_TOPGO")
+        return None
+    return candidatas[0]
+
+# sustituye `destino` por `origen` (directorios) con el mínimo hueco posible
+def publicar_directorio(origen: Path, destino: Path):
+    if destino.exists():
+        viejo = ruta_temporal(destino)
+        destino.replace(viejo)
+        publicar(origen, destino)
+        shutil.rmtree(viejo, ignore_errors=True)
+    else:
+        publicar(origen, destino)
 
 # ejecutar primer comando
-def run_fantasia(fasta: str, fantasia_run: str):
+def run_fantasia(fasta: str, fantasia_run: str, device: str = "cuda:0", especie=None, trabajador=None):
     out_path = fantasia_run / "outputs"
     print(out_path)
 
-    cmd = ["python3", FANTASIA4, 
-            fasta,
-            "--device", "cuda:0",
-            "--lookup-npz", LOOKUP,
-            "--annotations-json", ANN,
-            "--accessions-json", ACC
-            ]
+    # fantasia_pipeline.py escribe `outputs` en el directorio actual: se ejecuta en
+    # un directorio temporal y `outputs` se publica con rename sólo si termina bien
+    staging = ruta_temporal(fantasia_run / "staging")
 
-    if out_path.exists():
+    especie = especie or Path(fantasia_run).parent.name
+    inicio = time.perf_counter()
+    manifiesto = Manifiesto(fantasia_run / "manifest.json")
+    huella = huella_fantasia(fasta)
+    if manifiesto.al_dia("fantasia4", huella, [out_path]):
+        saltado("run_fantasia", especie, time.perf_counter() - inicio, [out_path])
         print(f"[ALREADY DONE] Ya se había ejecutado FANTASIA4 con esta especie")
-    else:
-        print(f"[RUN] Se va a ejecutar el primer paso de FANTASIA")
+        return True
+
+    print(f"[RUN] Se va a ejecutar el primer paso de FANTASIA en {device}")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    try:
+        # con lotes por longitud, FANTASIA trabaja sobre las piezas ordenadas y
+        # sus salidas se recombinan a las proteínas y el orden originales
+        consulta = Path(fasta)
+        if LOTES_POR_LONGITUD:
+            consulta, mapa_piezas = staging / "lotes.faa", staging / "lotes.tsv"
+            n_prot, n_piezas, n_lotes = preparar_lotes(fasta, consulta, mapa_piezas, PRESUPUESTO_TOKENS,
+                                                       MAX_LONGITUD, SOLAPE_VENTANA)
+            print(f"[INFO] {especie}: {n_prot} proteínas → {n_piezas} piezas en {n_lotes} lotes por longitud")
+
+        cmd = ["python3", FANTASIA4,
+               str(consulta.resolve()),
+               "--device", device,
+               "--lookup-npz", LOOKUP,
+               "--annotations-json", ANN,
+               "--accessions-json", ACC
+               ]
+
+        # embeddings del almacén (+ los nuevos); si no se puede, FANTASIA los calcula
+        embeddings = preparar_embeddings(consulta, staging, device, especie) if CACHE_EMBEDDINGS else None
+        if embeddings is not None:
+            cmd += [OPCION_EMBEDDINGS, str(embeddings)]
+        # en el worker persistente del dispositivo o con los assets compilados (mismo cmd y staging)
+        lanzar = trabajador.ejecutar if trabajador is not None else ejecutar
+        recursos = RECURSOS_FANTASIA if device.startswith("cuda") else replace(RECURSOS_FANTASIA, gpus=0)
+        lanzar(cmd, "run_fantasia", especie, entradas=[fasta], salidas=[staging / "outputs"],
+               n_proteinas=contar_secuencias(fasta), cwd=staging, recursos=recursos)
+        salidas = staging / "outputs"
+        if LOTES_POR_LONGITUD:
+            salidas = staging / "outputs_recombinadas"
+            recombinar_directorio(staging / "outputs", salidas, mapa_piezas)
+        publicar_directorio(salidas, out_path)
+        manifiesto.registrar("fantasia4", huella, [out_path])
+        print(f"[DONE] Primer paso completado; cmd={cmd}")
+        return True
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"[FAIL] Revisa parámetros/rutas. Detalle: {e}")
+        return False
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+# almacén de embeddings (una conexión por llamada: se usa desde varios hilos)
+def abrir_cache_embeddings():
+    if not CACHE_EMBEDDINGS or not pipeline_acepta_embeddings():
+        return None
+    try:
+        from embedding_cache import CacheEmbeddings, EMBEBEDORES  # necesita numpy
+        emb = EMBEBEDORES[EMBEBEDOR]
+        return CacheEmbeddings(CACHE_EMBEDDINGS, emb.modelo, emb.dim, CACHE_EMBEDDINGS_MAX_GB * 1e9), emb
+    except (ImportError, KeyError, ValueError, sqlite3.Error) as e:
+        print(f"[WARN] No se puede usar el almacén de embeddings {CACHE_EMBEDDINGS}. Detalle: {e}")
+        return None
+
+# ¿el pipeline lee embeddings precalculados? (sólo uno parcheado: se busca la opción en el script)
+_acepta_embeddings = {}
+def pipeline_acepta_embeddings() -> bool:
+    if FANTASIA4 not in _acepta_embeddings:
         try:
-            subprocess.run(cmd, check=True)
-            print(f"[DONE] Primer paso completado; cmd={cmd}")
-        except subprocess.CalledProcessError as e:
-            print(f"[FAIL] Revisa parámetros/rutas. Detalle: {e}")
+            acepta = OPCION_EMBEDDINGS in Path(FANTASIA4).read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            acepta = False
+        if not acepta:
+            print(f"[WARN] {FANTASIA4} no acepta {OPCION_EMBEDDINGS} (hace falta un pipeline parcheado); "
+                  f"no se usa el almacén de embeddings")
+        _acepta_embeddings[FANTASIA4] = acepta
+    return _acepta_embeddings[FANTASIA4]
 
+# ¿están ya todos los embeddings del fasta? (entonces la especie no necesita GPU)
+def embeddings_completos(fasta: str) -> bool:
+    abierto = abrir_cache_embeddings()
+    if abierto is None:
+        return False
+    cache, _ = abierto
+    try:
+        registros = leer_fasta(fasta)
+        if LOTES_POR_LONGITUD:  # lo que se embebe son las ventanas de las proteínas largas
+            registros = [(p.id, seq) for p, seq in trocear(registros, MAX_LONGITUD, SOLAPE_VENTANA)]
+        digests = {digest_secuencia(seq) for _, seq in registros}
+        return cache.presentes(digests) == len(digests)
+    finally:
+        cache.close()
 
-# main ========================================================================
-def main():
-    # compruba que existe el TSV con las especies
-    tsv_path = Path(TSV)
-    if not tsv_path.exists():
-        print(f"[ERROR] No encuentro el TSV: {tsv_path}")
-        return
+# embeddings del fasta en destino/embeddings.npy (+ .ids.txt), calculando sólo los que faltan
+def preparar_embeddings(fasta: str, destino: Path, device: str, especie: str):
+    abierto = abrir_cache_embeddings()
+    if abierto is None:
+        return None
+    cache, emb = abierto
+    from embedding_cache import escribir_embeddings
+    try:
+        registros = list(leer_fasta(fasta))
+        with medir("embeddings", especie, entradas=[fasta], n_proteinas=len(registros)):
+            matriz, nuevas = cache.embeddings([seq for _, seq in registros], emb.funcion, device,
+                                              presupuesto_tokens=PRESUPUESTO_TOKENS if LOTES_POR_LONGITUD else None)
+        npy = destino / "embeddings.npy"
+        escribir_embeddings([prot for prot, _ in registros], matriz, npy)
+        print(f"[INFO] Embeddings {especie}: {nuevas} secuencias calculadas en {device}, "
+              f"el resto del almacén ({emb.modelo})")
+        return npy
+    except (ImportError, RuntimeError, OSError, sqlite3.Error) as e:
+        print(f"[WARN] Sin embeddings precalculados para {especie}; los calcula FANTASIA. Detalle: {e}")
+        return None
+    finally:
+        cache.close()
 
-    # abre el TSV y almacena esocies y fasta
+# FANTASIA sobre secuencias únicas y re-expansión de las salidas a todos los IDs
+def run_fantasia_dedup(fasta: str, fantasia_run: Path, device: str = "cuda:0", trabajador=None):
+    out_path = fantasia_run / "outputs"
+    manifiesto = Manifiesto(fantasia_run / "manifest.json")
+    huella = huella_fantasia(fasta)
+    if manifiesto.al_dia("fantasia4", huella, [out_path]):
+        print(f"[ALREADY DONE] Ya se había ejecutado FANTASIA4 con esta especie")
+        return True
+
+    dedup_dir = fantasia_run / "_dedup"
+    unique_fasta = dedup_dir / f"{Path(fasta).stem}.uniq.faa"
+    mapa = dedup_dir / f"{Path(fasta).stem}.dedup.tsv"
+    # el fasta ha cambiado (o no se había deduplicado): se rehace
+    deduplicar_fasta(fasta, unique_fasta, mapa)
+
+    # la ejecución sobre únicas tiene su propio manifiesto en _dedup
+    if not run_fantasia(str(unique_fasta), dedup_dir, device, especie=fantasia_run.parent.name,
+                        trabajador=trabajador):
+        return False
+
+    expandido = ruta_temporal(out_path)
+    expandir_directorio(dedup_dir / "outputs", expandido, mapa)
+    publicar_directorio(expandido, out_path)
+    manifiesto.registrar("fantasia4", huella, [out_path])
+    print(f"[DONE] Salidas re-expandidas a todos los IDs → {out_path}")
+    return True
+
+
+# especies =====================================================================
+def leer_especies(tsv_path: Path):
+    """Lee el TSV (especie<TAB>ruta_fasta) y devuelve [(especie, fasta)] válidos."""
+    especies = []
     with tsv_path.open(encoding="utf-8") as f:
         for line in f:
             line = line.strip()
@@ -98,35 +312,101 @@ def main():
                 print(f"[WARN] FASTA no existe o está vacío para {species}: {fasta}")
                 continue
 
-            # creamos el prefijo
-            parts = species.split("_")
-            prefix = parts[0][:2] + parts[1][:3]
-            if len(parts) > 2:
-                prefix += parts[2][:3]
+            especies.append((species, fasta))
+    return especies
+
+
+def procesar_especie(species: str, fasta: str, pool: PoolDispositivos, trabajadores=None):
+    """
+    FANTASIA de una especie en el primer dispositivo libre del pool (con
+    `trabajadores`, en el worker persistente de ese dispositivo o en un
+    proceso que lee los assets compilados).
+    """
+    # se crea la carpeta fantasia_run dentro de la carpeta de la especie
+    fantasia_run = OUTDIR / species / "fantasia4_run"
+    if not fantasia_run.exists():
+        fantasia_run.mkdir(parents=True, exist_ok=True)
+        print("[INFO] Carpeta 'fantasia_run' creada correctamente")
+
+    inicio = time.perf_counter()
+    if fantasia_al_dia(fasta, fantasia_run):
+        saltado("run_fantasia", species, time.perf_counter() - inicio, [fantasia_run / "outputs"])
+        print(f"[ALREADY DONE] Ya se había ejecutado FANTASIA4 con {species}")
+        return
+
+    def ejecutar_en(device):
+        if trabajadores is None:
+            return ejecutar_con(device, None)
+        with trabajadores.reservar(device) as trabajador:
+            return ejecutar_con(device, trabajador)
 
-            print(f"EJECUTANDO FANTASIA PARA LA ESPECIE {species}")
+    def ejecutar_con(device, trabajador):
+        if DEDUP_SECUENCIAS:
+            return run_fantasia_dedup(fasta, fantasia_run, device, trabajador=trabajador)
+        return run_fantasia(fasta, fantasia_run, device, trabajador=trabajador)
+
+    n_seqs = contar_secuencias(fasta)
+    # con todos los embeddings en el almacén sólo queda la búsqueda en la lookup: sin GPU
+    if CACHE_EMBEDDINGS and embeddings_completos(fasta):
+        print(f"EJECUTANDO FANTASIA PARA LA ESPECIE {species} ({n_seqs} secuencias) en cpu (embeddings en el almacén)")
+        ejecutar_en("cpu")
+        return
+
+    with pool.reservar(n_seqs) as device:
+        print(f"EJECUTANDO FANTASIA PARA LA ESPECIE {species} ({n_seqs} secuencias) en {device}")
+        ejecutar_en(device)
 
-            # se limpia el fasta
-            # clean_fasta_name = f"{Path(fasta).stem}.clean.faa"
-            # clean_fasta = OUTDIR / species / clean_fasta_name
-            # fasta_cleaner(fasta, clean_fasta)
 
-            # se crea la carpeta fantasia_run dentro de la carpeta de la especie
-            fantasia_run = OUTDIR / species / "fantasia4_run"
-            if not fantasia_run.exists():
-                fantasia_run.mkdir(parents=True, exist_ok=True)
-                print("[INFO] Carpeta 'fantasia_run' creada correctamente")
+# assets compilados (npy mapeables) de la lookup, rehechos si cambian los originales
+def preparar_assets():
+    if not ASSETS_COMPILADOS:
+        return None
+    try:
+        from fantasia_assets import AssetsFantasia  # necesita numpy
+        AssetsFantasia(ASSETS_COMPILADOS).asegurar([LOOKUP, ANN, ACC])
+        return ASSETS_COMPILADOS
+    except (ImportError, OSError, ValueError) as e:
+        print(f"[WARN] No se pueden usar assets compilados; se usan los originales. Detalle: {e}")
+        return None
 
-            # nos movemos a esa carpeta
-            original = Path.cwd()
-            os.chdir(fantasia_run)
 
-            # ejecución de FANTASIA
-            run_fantasia(fasta, fantasia_run)
+# main ========================================================================
+def main():
+    # compruba que existe el TSV con las especies
+    tsv_path = Path(TSV)
+    if not tsv_path.exists():
+        print(f"[ERROR] No encuentro el TSV: {tsv_path}")
+        return
+
+    # abre el TSV y almacena especies y fasta
+    especies = leer_especies(tsv_path)
 
-            os.chdir(original)
+    # una especie por dispositivo; el resto espera en cola
+    compilados = preparar_assets()
+    pool = PoolDispositivos(leer_dispositivos(DEVICES), CPU_WORKERS, CPU_MAX_SEQS)
+    lotes = ejecutor_actual().nombre == "lotes"
+    if MODO_LOTE and lotes:
+        print("[WARN] MODO_LOTE usa workers persistentes en esta máquina; con el ejecutor de lotes se ignora")
+    if MODO_LOTE and not lotes:
+        trabajadores = TrabajadoresPorDispositivo(FANTASIA4, [LOOKUP, ANN, ACC], compilados)
+    elif compilados:
+        trabajadores = LanzadorCompilados(compilados)
+    else:
+        trabajadores = None
+    try:
+        with ThreadPoolExecutor(max_workers=pool.capacidad) as ex:
+            futuros = {ex.submit(procesar_especie, species, fasta, pool, trabajadores): species
+                       for species, fasta in especies}
+            for fut in as_completed(futuros):
+                try:
+                    fut.result()
+                except Exception as e:
+                    print(f"[FAIL] {futuros[fut]}. Detalle: {e}")
+    finally:
+        if trabajadores is not None:
+            trabajadores.cerrar()
 
     print("\nTodo terminado. ✔")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -2,8 +2,18 @@
 # -*- coding: utf-8 -*-
 
 from pathlib import Path
+from array import array
+from itertools import groupby
 import csv, sys
-
+import hashlib
+import heapq
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+
+import numpy as np
 from matplotlib_venn import venn2
 import matplotlib.pyplot as plt
 
@@ -12,25 +22,40 @@ import matplotlib.pyplot as plt
 TSV = "/data/users/sgarjua/fof_analisis_resultados.tsv"
 OUTFILE = Path("/data/users/sgarjua/comparative_table_final.tsv")
 
-# creamos un diccionario {secuencia: [gos homologia],[gos fantasia]}
-resultados = {}
+# Modo streaming: recorre homología y FANTASIA a la vez ordenados por proteína
+# (merge-join) con memoria constante, en lugar de cargar los dos ficheros
+MODO_STREAMING = False
+ENTRADAS_ORDENADAS = False    # True si ya vienen ordenados (LC_ALL=C sort -k1,1 -s)
+MAX_LINEAS_MEMORIA = 1_000_000  # líneas por tramo al ordenar en disco
+DIR_TEMPORAL = None           # dónde ordenar (None = el temporal del sistema)
+DIR_SOLAPES = None            # si se indica, escribe {especie}.solapes.tsv por proteína
+
+PROCESOS = os.cpu_count() or 1  # especies analizadas a la vez
+
+# Caché de estadísticas por especie: sólo se recalculan las especies cuyos
+# ficheros de homología o FANTASIA han cambiado (ruta, tamaño, mtime, sha1)
+USAR_CACHE = True
+CACHE = None                  # None = OUTFILE con extensión .cache.json
+VERSION_CACHE = 1             # subir si cambia la forma de calcular las estadísticas
 
-# diccionarios para guardar resultados de los calculos
-calculos_h = {}
-calculos_f = {}
+VENN = None                   # None = OUTFILE con extensión .venn.png
 
 # funciones ===================================================================
 
-def calc_stats(file, species: str, destino: int):
+def internar(tabla: dict, clave: str) -> int:
+    """Entero asociado a una cadena (proteína o GO); los nuevos reciben el siguiente."""
+    i = tabla.get(clave)
+    if i is None:
+        i = tabla[clave] = len(tabla)
+    return i
+
+
+def lineas_datos(file):
     """
-    Lee un archivo de resultados y guarda los GO en resultados[prot][destino],
-    donde destino=0 -> Homología, destino=1 -> FANTASIA.
-    Devuelve: (protes, gos_totales, id_con_go, id_sin_go, gos_por_prote)
+    (proteína, campo GO) de cada línea de resultados, saltando vacías,
+    comentarios (#) y cabeceras (Protein-Accession). El campo GO es la
+    última columna.
     """
-    id_sin_go = 0
-    gos_totales = 0
-    protes = 0
-
     for line in file:
         line = line.strip()
         parts = line.split("\t")
@@ -41,118 +66,356 @@ def calc_stats(file, species: str, destino: int):
         prot = parts[0].strip() if parts else ""
         if not prot:
             continue
-        protes += 1
+        yield prot, (parts[-1].strip() if parts else "")
+
+
+def leer_gos(gos_field: str):
+    return [g.strip() for g in gos_field.split(",") if g.strip()]
+
+
+def calc_stats(file, proteinas: dict, terminos: dict):
+    """
+    Lee un archivo de resultados. Proteínas y GO se internan como enteros en
+    los diccionarios `proteinas` y `terminos` (compartidos por Homología y
+    FANTASIA de una misma especie).
+    Devuelve: (protes, gos_totales, id_con_go, id_sin_go, gos_por_prote, cobertura)
+    y los GO por proteína en CSR (ver csr_go).
+    """
+    id_sin_go = 0
+    gos_totales = 0
+    protes = 0
 
-        if prot not in resultados:
-            resultados[prot] = [[], []]  # [hom, fan]
+    # una entrada por línea con GO: proteína y su tramo [offsets[i], offsets[i+1]) de ids
+    lineas_prot = array("q")
+    offsets = array("q", [0])
+    ids = array("q")
 
-        gos_field = parts[-1].strip() if parts else ""
+    for prot, gos_field in lineas_datos(file):
+        protes += 1
         if "GO:" in gos_field:
-            gos = [g.strip() for g in gos_field.split(",") if g.strip()]
-            resultados[prot][destino] = gos
+            gos = leer_gos(gos_field)
+            lineas_prot.append(internar(proteinas, prot))
+            ids.extend(internar(terminos, g) for g in gos)
+            offsets.append(len(ids))
             gos_totales += len(gos)
         else:
             id_sin_go += 1
 
+    return stats_lado(protes, gos_totales, id_sin_go), csr_go(lineas_prot, offsets, ids)
+
+
+def csr_go(lineas_prot, offsets, ids):
+    """
+    GO por proteína en formato CSR: (prots, offsets, terminos), con las
+    proteínas ordenadas y los GO de prots[i] en terminos[offsets[i]:offsets[i+1]],
+    ordenados y sin repetir.
+    Si una proteína aparece en varias líneas con GO vale la última, y los GO
+    repetidos en una línea cuentan una vez en el solape.
+    """
+    lineas = np.frombuffer(lineas_prot, dtype=np.int64)
+    offs = np.frombuffer(offsets, dtype=np.int64)
+    ids = np.frombuffer(ids, dtype=np.int64)
+
+    # última línea de cada proteína
+    prots, desde_el_final = np.unique(lineas[::-1], return_index=True)
+    ultima = len(lineas) - 1 - desde_el_final
+    inicio, largo = offs[ultima], offs[ultima + 1] - offs[ultima]
+
+    # posiciones en `ids` de los tramos elegidos, concatenados
+    base = np.repeat(inicio - (np.cumsum(largo) - largo), largo)
+    pos = np.arange(int(largo.sum()), dtype=np.int64) + base
+
+    # pares (proteína, GO) únicos y ordenados, codificados en un int64
+    pares = np.unique((np.repeat(prots, largo) << 32) | ids[pos])
+    prots, inicios = np.unique(pares >> 32, return_index=True)
+    return prots, np.append(inicios, len(pares)), pares & 0xFFFFFFFF
+
+
+def claves_csr(csr):
+    """Pares (proteína, GO) de un CSR como int64 proteína<<32 | GO, ordenados."""
+    prots, offsets, terminos = csr
+    return (np.repeat(prots, np.diff(offsets)) << 32) | terminos
+
+
+def calc_overlap_por_prote(csr_h, csr_f):
+    """
+    Calcula el solape de GO por proteína (intersección de los pares
+    proteína-GO de Homología y FANTASIA, de una vez para todas las proteínas).
+    Devuelve total_solapados: número total de GO en la intersección sumando
+    todas las proteínas.
+    """
+    comunes = np.intersect1d(claves_csr(csr_h), claves_csr(csr_f), assume_unique=True)
+    return int(comunes.size)
+
+
+def ordenar_por_proteina(file, tmpdir):
+    """
+    Líneas de datos ordenadas por proteína conservando el orden original
+    entre líneas de la misma proteína (la última con GO sigue siendo la que
+    vale). Se ordena en tramos de MAX_LINEAS_MEMORIA en disco y se mezclan.
+    """
+    if ENTRADAS_ORDENADAS:
+        anterior = None
+        for prot, gos_field in lineas_datos(file):
+            if anterior is not None and prot < anterior:
+                raise ValueError(f"Entrada no ordenada por proteína: {prot} tras {anterior}")
+            anterior = prot
+            yield prot, gos_field
+        return
+
+    tramos, lote = [], []
+    for n, (prot, gos_field) in enumerate(lineas_datos(file)):
+        lote.append((prot, n, gos_field))
+        if len(lote) >= MAX_LINEAS_MEMORIA:
+            lote.sort()
+            tramo = tempfile.TemporaryFile("w+", encoding="utf-8", dir=tmpdir)
+            tramo.writelines(f"{p}\t{i}\t{g}\n" for p, i, g in lote)
+            tramo.seek(0)
+            tramos.append(tramo)
+            lote = []
+    lote.sort()
+    if not tramos:
+        for prot, _, gos_field in lote:
+            yield prot, gos_field
+        return
+
+    def leer_tramo(tramo):
+        for line in tramo:
+            prot, n, gos_field = line.rstrip("\n").split("\t", 2)
+            yield prot, int(n), gos_field
+
+    try:
+        for prot, _, gos_field in heapq.merge(*map(leer_tramo, tramos), iter(lote)):
+            yield prot, gos_field
+    finally:
+        for tramo in tramos:
+            tramo.close()
+
+
+def grupos_proteina(lineas):
+    """
+    Agrupa líneas ordenadas por proteína: (proteína, nº líneas, nº sin GO,
+    nº GO, GO de la última línea con GO).
+    """
+    for prot, grupo in groupby(lineas, key=lambda x: x[0]):
+        n = sin_go = n_gos = 0
+        ultimos = set()
+        for _, gos_field in grupo:
+            n += 1
+            if "GO:" in gos_field:
+                gos = leer_gos(gos_field)
+                n_gos += len(gos)
+                ultimos = set(gos)
+            else:
+                sin_go += 1
+        yield prot, n, sin_go, n_gos, ultimos
+
+
+def stats_lado(protes: int, gos_totales: int, id_sin_go: int):
+    """(protes, gos_totales, id_con_go, id_sin_go, gos_por_prote, cobertura), como calc_stats."""
     id_con_go = protes - id_sin_go
     gos_por_prote = (gos_totales / protes) if protes else 0.0
     cobertura = (id_con_go / protes) * 100
     return protes, gos_totales, id_con_go, id_sin_go, gos_por_prote, cobertura
 
 
-def calc_overlap_por_prote(resultados_dict):
+def comparar_streaming(hom_file, fan_file, solapes=None):
     """
-    Calcula el solape de GO por proteína.
-    Devuelve:
-      - overlaps: dict {prote: [GO... que están en Hom y en Fan]}
-      - total_solapados: número total de GO en la intersección sumando todas las proteínas
+    Merge-join de homología y FANTASIA por proteína, con memoria acotada.
+    Si se pasa `solapes` (fichero abierto), escribe proteína<TAB>nº<TAB>GOs
+    compartidos según se van encontrando.
+    Devuelve (stats_h, stats_f, total_solapados) con los mismos valores que
+    calc_stats + calc_overlap_por_prote.
     """
-    overlaps = {}
+    totales = {"h": [0, 0, 0], "f": [0, 0, 0]}  # protes, gos_totales, id_sin_go
     total_solapados = 0
-    for prot, (gos_h, gos_f) in resultados_dict.items():
-        sh, sf = set(gos_h), set(gos_f)
-        inter = sh & sf
-        if inter:
-            overlaps[prot] = sorted(inter)
-            total_solapados += len(inter)
-    return overlaps, total_solapados
-
-
-def asegurar_cabecera(outfile: Path, header):
-    """Escribe cabecera sólo si el fichero no existe aún."""
-    modo = "a" if outfile.exists() else "w"
-    with outfile.open(modo, newline="", encoding="utf-8") as tsv:
-        w = csv.writer(tsv, delimiter="\t")
-        if modo == "w":
-            w.writerow(header)
-
-
-def append_fila(outfile: Path, row):
-    with outfile.open("a", newline="", encoding="utf-8") as tsv:
-        w = csv.writer(tsv, delimiter="\t")
-        w.writerow(row)
+    with tempfile.TemporaryDirectory(dir=DIR_TEMPORAL) as tmpdir:
+        lados = [
+            (("h", g) for g in grupos_proteina(ordenar_por_proteina(hom_file, tmpdir))),
+            (("f", g) for g in grupos_proteina(ordenar_por_proteina(fan_file, tmpdir))),
+        ]
+        # los dos lados vienen ordenados: al mezclarlos, las entradas de una
+        # misma proteína quedan juntas (primero homología)
+        mezcla = heapq.merge(*lados, key=lambda x: x[1][0])
+        for prot, entradas in groupby(mezcla, key=lambda x: x[1][0]):
+            gos = {}
+            for lado, (_, n, sin_go, n_gos, ultimos) in entradas:
+                t = totales[lado]
+                t[0] += n
+                t[1] += n_gos
+                t[2] += sin_go
+                gos[lado] = ultimos
+            comunes = gos.get("h", set()) & gos.get("f", set())
+            if comunes:
+                total_solapados += len(comunes)
+                if solapes is not None:
+                    solapes.write(f"{prot}\t{len(comunes)}\t{', '.join(sorted(comunes))}\n")
+
+    return stats_lado(*totales["h"]), stats_lado(*totales["f"]), total_solapados
+
+
+@dataclass
+class ResultadoEspecie:
+    """Estadísticas numéricas de una especie (h = Homología, f = FANTASIA)."""
+    especie: str
+    h: tuple   # (protes, gos_totales, id_con_go, id_sin_go, gos_por_prote, cobertura)
+    f: tuple
+    total_solapados: int
+
+    # sin GOs en un lado (p.ej. FANTASIA no anotó nada) el solape es 0 %
+    @property
+    def solape_h(self) -> float:
+        return (self.total_solapados / self.h[1]) * 100 if self.h[1] else 0.0
+
+    @property
+    def solape_f(self) -> float:
+        return (self.total_solapados / self.f[1]) * 100 if self.f[1] else 0.0
+
+    def fila(self):
+        protes_h, gos_totales_h, id_con_go_h, id_sin_go_h, gos_por_prote_h, cobertura_h = self.h
+        protes_f, gos_totales_f, id_con_go_f, id_sin_go_f, gos_por_prote_f, cobertura_f = self.f
+        return [
+            self.especie,
+            f"{protes_h} | {protes_f}",
+            f"{id_con_go_h} | {id_con_go_f}",
+            f"{id_sin_go_h} | {id_sin_go_f}",
+            f"{cobertura_h:.3f} | {cobertura_f:.3f}",
+            f"{gos_por_prote_h:.3f} | {gos_por_prote_f:.3f}",
+            f"{gos_totales_h} | {gos_totales_f}",
+            self.total_solapados,
+            f"{self.solape_h:.3f} | {self.solape_f:.3f}"
+        ]
 
-def calc_total(outfile: Path):
-    protes_h, protes_f, id_con_go_h, id_con_go_f, id_sin_go_h, id_sin_go_f, cobertura_h, cobertura_f, gos_por_prote_h, gos_por_prote_f, gos_totales_h, gos_totales_f, total_solapados, solape_h, solape_f = 0, 0 ,0 ,0 ,0 ,0 ,0, 0, 0, 0, 0, 0, 0, 0, 0
-    n = 0
-    with outfile.open(encoding="utf-8") as tsv:
-        for line in tsv:
-            line = line.strip()
-            if line.startswith("Especie"):
-                continue
-            parts = line.split("\t")
-            n += 1
 
-            protes = parts[1].split(" | ")
-            protes_h += int(protes[0])
-            protes_f += int(protes[1])
+# configuración que usan los procesos del pool: se les pasa al arrancar, porque
+# con spawn/forkserver (macOS, Python >= 3.14) no heredan lo que se haya
+# cambiado en el módulo (p.ej. desde pipeline_dag) y verían los valores del fichero
+CONFIG_PROCESOS = ("MODO_STREAMING", "ENTRADAS_ORDENADAS", "MAX_LINEAS_MEMORIA", "DIR_TEMPORAL", "DIR_SOLAPES")
 
-            id_con_go = parts[2].split(" | ")
-            id_con_go_h += int(id_con_go[0])
-            id_con_go_f += int(id_con_go[1])
 
-            id_sin_go = parts[3].split(" | ")
-            id_sin_go_h += int(id_sin_go[0])
-            id_sin_go_f += int(id_sin_go[1])
+def configuracion_procesos() -> dict:
+    return {nombre: globals()[nombre] for nombre in CONFIG_PROCESOS}
 
-            cobertura = parts[4].split(" | ")
-            cobertura_h += float(cobertura[0])
-            cobertura_f += float(cobertura[1])
 
-            gos_por_prote = parts[5].split(" | ")
-            gos_por_prote_h += float(gos_por_prote[0])
-            gos_por_prote_f += float(gos_por_prote[1])
+def fijar_configuracion(config: dict):
+    globals().update(config)
 
-            gos_totales = parts[6].split(" | ")
-            gos_totales_h += int(gos_totales[0])
-            gos_totales_f += int(gos_totales[1])
 
-            total_solapados += int(parts[7])
+def analizar_especie(species: str, homologia: Path, fantasia: Path) -> ResultadoEspecie:
+    """Compara homología y FANTASIA de una especie (se ejecuta en un proceso del pool)."""
+    if MODO_STREAMING:
+        # homología y FANTASIA a la vez, proteína a proteína
+        solapes = None
+        if DIR_SOLAPES:
+            Path(DIR_SOLAPES).mkdir(parents=True, exist_ok=True)
+            solapes = (Path(DIR_SOLAPES) / f"{species}.solapes.tsv").open("w", encoding="utf-8")
+        try:
+            with homologia.open(encoding="utf-8") as hom, fantasia.open(encoding="utf-8") as fan:
+                stats_h, stats_f, total_solapados = comparar_streaming(hom, fan, solapes)
+        finally:
+            if solapes is not None:
+                solapes.close()
+    else:
+        # IMPORTANTE: enteros de proteínas y GO propios de cada especie
+        proteinas, terminos = {}, {}
 
-            solape = parts[8].split(" | ")
-            solape_h += float(solape[0])
-            solape_f += float(solape[1])
-    
+        # homología
+        with homologia.open(encoding="utf-8") as hom:
+            stats_h, csr_h = calc_stats(hom, proteinas, terminos)
 
-    id_con_go_h = id_con_go_h / n
-    id_con_go_f = id_con_go_f / n
+        # FANTASIA
+        with fantasia.open(encoding="utf-8") as fan:
+            stats_f, csr_f = calc_stats(fan, proteinas, terminos)
 
-    id_sin_go_h = id_sin_go_h / n
-    id_sin_go_f = id_sin_go_f / n
+        # calcular el solape de GO por proteína
+        total_solapados = calc_overlap_por_prote(csr_h, csr_f)
 
-    cobertura_h = cobertura_h / n
-    cobertura_f = cobertura_f / n
+    return ResultadoEspecie(species, tuple(stats_h), tuple(stats_f), total_solapados)
 
-    gos_por_prote_h = gos_por_prote_h / n
-    gos_por_prote_f = gos_por_prote_f / n
 
-    gos_totales_h = gos_totales_h / n
-    gos_totales_f = gos_totales_f / n
+def firma_fichero(path: Path, previa=None) -> dict:
+    """
+    Ruta, tamaño, mtime y sha1 del contenido. Si ruta, tamaño y mtime
+    coinciden con la firma previa se reutiliza su sha1 sin releer el fichero.
+    """
+    st = path.stat()
+    firma = {"ruta": str(path.resolve()), "tamano": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if previa and all(previa.get(k) == v for k, v in firma.items()):
+        firma["sha1"] = previa["sha1"]
+        return firma
+    h = hashlib.sha1()
+    with path.open("rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    firma["sha1"] = h.hexdigest()
+    return firma
+
+
+def mismo_contenido(a: dict, b: dict) -> bool:
+    return all(a.get(k) == b.get(k) for k in ("ruta", "tamano", "sha1"))
+
+
+def ruta_cache() -> Path:
+    return Path(CACHE) if CACHE else OUTFILE.with_suffix(".cache.json")
+
+
+def leer_cache() -> dict:
+    """{especie: {"homologia": firma, "fantasia": firma, "resultado": {...}}}"""
+    try:
+        datos = json.loads(ruta_cache().read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if datos.get("version") != VERSION_CACHE:
+        return {}
+    return datos.get("especies", {})
+
+
+def guardar_cache(especies: dict):
+    path = ruta_cache()
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps({"version": VERSION_CACHE, "especies": especies}, indent=1), encoding="utf-8")
+    tmp.replace(path)
+
+
+def desde_cache(entrada: dict, firma_h: dict, firma_f: dict):
+    """ResultadoEspecie guardado si las dos entradas no han cambiado; None si no."""
+    if not entrada or not mismo_contenido(entrada.get("homologia", {}), firma_h) \
+            or not mismo_contenido(entrada.get("fantasia", {}), firma_f):
+        return None
+    r = entrada["resultado"]
+    return ResultadoEspecie(r["especie"], tuple(r["h"]), tuple(r["f"]), r["total_solapados"])
+
+
+def escribir_tabla(outfile: Path, header, filas):
+    """Escribe la tabla completa de una vez (temporal + rename)."""
+    tmp = outfile.with_name(outfile.name + ".tmp")
+    with tmp.open("w", newline="", encoding="utf-8") as tsv:
+        w = csv.writer(tsv, delimiter="\t")
+        w.writerow(header)
+        w.writerows(filas)
+    tmp.replace(outfile)
 
-    total_solapados = total_solapados / n
 
-    solape_h = solape_h / n
-    solape_f = solape_f / n
+def calc_total(resultados):
+    """
+    Fila MEDIA a partir de los resultados de todas las especies (la de
+    secuencias es la suma). Devuelve también las medias para el Venn.
+    Los porcentajes y GO/sec se promedian tal como salen en la tabla (.3f),
+    igual que cuando la media se calculaba releyendo el TSV.
+    """
+    n = len(resultados)
+    media = lambda valores: sum(valores) / n
+    impreso = lambda x: float(f"{x:.3f}")
+
+    protes_h = sum(r.h[0] for r in resultados)
+    protes_f = sum(r.f[0] for r in resultados)
+    id_con_go_h, id_con_go_f = media(r.h[2] for r in resultados), media(r.f[2] for r in resultados)
+    id_sin_go_h, id_sin_go_f = media(r.h[3] for r in resultados), media(r.f[3] for r in resultados)
+    cobertura_h, cobertura_f = media(impreso(r.h[5]) for r in resultados), media(impreso(r.f[5]) for r in resultados)
+    gos_por_prote_h, gos_por_prote_f = media(impreso(r.h[4]) for r in resultados), media(impreso(r.f[4]) for r in resultados)
+    gos_totales_h, gos_totales_f = media(r.h[1] for r in resultados), media(r.f[1] for r in resultados)
+    total_solapados = media(r.total_solapados for r in resultados)
+    solape_h, solape_f = media(impreso(r.solape_h) for r in resultados), media(impreso(r.solape_f) for r in resultados)
 
     fila = [
         "MEDIA",
@@ -167,7 +430,11 @@ def calc_total(outfile: Path):
         ]
     return fila, gos_totales_h, gos_totales_f, total_solapados
 
+def ruta_venn() -> Path:
+    return Path(VENN) if VENN else OUTFILE.with_suffix(".venn.png")
+
 def diagrama_venn(gos_totales_h: float, gos_totales_f: float, total_solapados: float):
+    """Guarda el Venn de las medias en ruta_venn() (sin ventana: se lanza también desde pipeline_dag)."""
     A = gos_totales_h
     B = gos_totales_f
     AB = round(total_solapados, 1)
@@ -175,13 +442,13 @@ def diagrama_venn(gos_totales_h: float, gos_totales_f: float, total_solapados: f
     solo_A = round(A - AB, 1)
     solo_B = round(B - AB, 1)
 
+    fig = plt.figure(figsize=(5, 5))
     venn2(subsets=(solo_A, solo_B, AB), set_labels=("GO-Homología", "GO-Fantasia"))
     plt.title("Venn de los téminos GO anotados con FANTASIA vs anotación por homología, para la lista de especies analizadas")
-    plt.show()
-
-    fig = plt.gcf()
-    fig.set_size_inches(5, 5)
-    plt.savefig("venn.png", dpi=300, bbox_inches="tight")
+    venn = ruta_venn()
+    fig.savefig(venn, dpi=300, bbox_inches="tight")
+    plt.close(fig)
+    return venn
 
 # main ========================================================================
 def main():
@@ -201,8 +468,7 @@ def main():
         "GOs solapados (total)",
         "% (H|F)"
     ]
-    asegurar_cabecera(OUTFILE, cabecera)
-
+    trabajos = []
     with tsv_path.open(encoding="utf-8") as f:
         for line in f:
             line = line.strip()
@@ -231,41 +497,59 @@ def main():
                 print(f"[WARN] RESULTADOS FANTASIA no existe o está vacío para {species}")
                 continue
 
-            # IMPORTANTE: limpiar resultados por especie
-            resultados.clear()
-
-            # homología
-            with homologia.open(encoding="utf-8") as hom:
-                protes_h, gos_totales_h, id_con_go_h, id_sin_go_h, gos_por_prote_h, cobertura_h = calc_stats(hom, species, destino=0)
-                calculos_h[species] = [protes_h, gos_totales_h, id_con_go_h, id_sin_go_h, gos_por_prote_h, cobertura_h]
-
-            # FANTASIA
-            with fantasia.open(encoding="utf-8") as fan:
-                protes_f, gos_totales_f, id_con_go_f, id_sin_go_f, gos_por_prote_f, cobertura_f = calc_stats(fan, species, destino=1)
-                calculos_f[species] = [protes_f, gos_totales_f, id_con_go_f, id_sin_go_f, gos_por_prote_f, cobertura_f]
-
-            # calcular el solape de GO por proteína
-            overlaps, total_solapados = calc_overlap_por_prote(resultados)
-            solape_h = (total_solapados/gos_totales_h)*100
-            solape_f = (total_solapados/gos_totales_f)*100
-
-            # construir fila
-            fila = [
-                species,
-                f"{protes_h} | {protes_f}",
-                f"{id_con_go_h} | {id_con_go_f}",
-                f"{id_sin_go_h} | {id_sin_go_f}",
-                f"{cobertura_h:.3f} | {cobertura_f:.3f}",
-                f"{gos_por_prote_h:.3f} | {gos_por_prote_f:.3f}",
-                f"{gos_totales_h} | {gos_totales_f}",
-                total_solapados,
-                f"{solape_h:.3f} | {solape_f:.3f}"
-            ]
-            append_fila(OUTFILE, fila)
-
-        total, gos_totales_h, gos_totales_f, total_solapados = calc_total(OUTFILE)        
-        append_fila(OUTFILE, total)
-        venn = diagrama_venn(gos_totales_h, gos_totales_f, total_solapados)
+            trabajos.append((species, homologia, fantasia))
+
+    # especies sin cambios desde la última ejecución: directamente de la caché
+    cache = leer_cache() if USAR_CACHE else {}
+    por_especie, firmas, pendientes = {}, {}, []
+    for species, homologia, fantasia in trabajos:
+        previa = cache.get(species, {})
+        firma_h = firma_fichero(homologia, previa.get("homologia"))
+        firma_f = firma_fichero(fantasia, previa.get("fantasia"))
+        firmas[species] = (firma_h, firma_f)
+        res = desde_cache(previa, firma_h, firma_f)
+        if res is not None:
+            por_especie[species] = res
+        else:
+            pendientes.append((species, homologia, fantasia))
+    if USAR_CACHE:
+        print(f"[INFO] {len(por_especie)} especies sin cambios (caché), {len(pendientes)} por analizar")
+
+    # una especie por proceso
+    if pendientes:
+        with ProcessPoolExecutor(max_workers=max(1, min(PROCESOS, len(pendientes))),
+                                 initializer=fijar_configuracion, initargs=(configuracion_procesos(),)) as pool:
+            futuros = [pool.submit(analizar_especie, *t) for t in pendientes]
+            for (species, _, _), fut in zip(pendientes, futuros):
+                try:
+                    por_especie[species] = fut.result()
+                except Exception as e:
+                    print(f"[FAIL] {species}. Detalle: {e}")
+
+    # los resultados, en el orden del TSV
+    resultados = []
+    for species, _, _ in trabajos:
+        res = por_especie.get(species)
+        if res is None:
+            continue
+        for lado, stats in (("homología", res.h), ("FANTASIA", res.f)):
+            if not stats[1]:
+                print(f"[WARN] {species}: ningún GO en {lado}; su % de solape se cuenta como 0")
+        resultados.append(res)
+        if USAR_CACHE:
+            firma_h, firma_f = firmas[species]
+            cache[species] = {"homologia": firma_h, "fantasia": firma_f, "resultado": asdict(res)}
+    if USAR_CACHE:
+        guardar_cache(cache)
+
+    if not resultados:
+        print("[WARN] Ninguna especie analizada: no se escribe la tabla")
+        return
+
+    total, gos_totales_h, gos_totales_f, total_solapados = calc_total(resultados)
+    escribir_tabla(OUTFILE, cabecera, [r.fila() for r in resultados] + [total])
+    venn = diagrama_venn(gos_totales_h, gos_totales_f, total_solapados)
+    print(f"[DONE] Tabla → {OUTFILE}; Venn → {venn}")
 
 
 if __name__ == "__main__":
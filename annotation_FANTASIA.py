@@ -13,6 +13,15 @@ from pathlib import Path
 import csv, sys
 import os
 import time
+import shutil
+import asyncio
+
+from fasta_utils import deduplicar_fasta, normalizar_fasta, expandir_tabla, contar_secuencias
+from supervisor import ejecutar_async, entorno_con
+from device_pool import leer_dispositivos, entorno_dispositivo
+from manifest import Manifiesto, huella_paso, ruta_temporal, publicar
+from instrumentation import ejecutar, medir, saltado
+from executor import Recursos
 
 
 # configuración ===============================================================
@@ -20,99 +29,190 @@ TSV = "/data/users/sgarjua/ann_diamond_test/species.tsv" # archivo con: nombre e
 OUTDIR = Path("/data/users/sgarjua/SofiaFantasia/") # carpeta con las carpetas de las especies con los fastas
 GENERATE_GPSM = "/data/users/sgarjua/00_software/FANTASIA/generate_gopredsim_input_files.sh"
 LAUNCH_GPSM = "/data/users/sgarjua/00_software/FANTASIA/launch_gopredsim_pipeline.sh"
-GPU = "CUDA_VISIBLE_DEVICES=1"
+DEVICES = ["cuda:1"] # GPUs para GoPredSim, una especie por GPU (FANTASIA_DEVICES="cuda:0,cuda:1" lo sobreescribe)
 TOPGO = "/data/users/sgarjua/00_software/FANTASIA/convert_topgo_format.py"
+DEDUP_SECUENCIAS = False # colapsar secuencias idénticas y re-expandir el TopGO final
+MIN_LEN = 0 # longitud mínima al limpiar el fasta (0 = sin filtro)
+MAX_LEN = 0 # longitud máxima al limpiar el fasta (0 = sin filtro)
+MAX_CPU_PARALELO = 2 # pasos CPU (limpieza, primer paso, TopGO) simultáneos
+# recursos que pide cada paso al ejecutor (executor.py; EJECUTOR=lotes los envía a la cola)
+RECURSOS_PRIMER_PASO = Recursos(cpus=2, mem_gb=8)
+RECURSOS_GOPREDSIM = Recursos(cpus=4, mem_gb=32, gpus=1, horas=48)
+RECURSOS_TOPGO = Recursos(cpus=1, mem_gb=4)
 
 # funciones ===================================================================
 # limpiar el fasta
+# (cabecera hasta el primer espacio, sin . ni * en la secuencia, índice .fai)
+# devuelve False si falla, para no seguir con la especie
 def fasta_cleaner(fasta: Path, clean_fasta: Path):
+    species = Path(clean_fasta).parent.name
+    inicio = time.perf_counter()
+
+    manifiesto = Manifiesto(Path(clean_fasta).parent / "manifest.json")
+    huella = huella_paso(entradas={"fasta": fasta}, parametros={"min_len": MIN_LEN, "max_len": MAX_LEN})
 
-    cmd = f"sed -r 's/ .+//' {fasta} > {clean_fasta}"
-    
-    if clean_fasta.exists():
+    if manifiesto.al_dia(f"limpieza_{Path(clean_fasta).name}", huella, [clean_fasta]):
+        saltado("fasta_cleaner", species, time.perf_counter() - inicio, [clean_fasta])
         print(f"[ALREADY DONE] El archivo fasta ya estaba limpio")
+        return True
     else:
         print(f"[RUN] Se va a limpiar el fasta")
         try:
-            subprocess.run(cmd, shell=True, check=True)
-            print(f"[DONE] Limpieza del fasta completada")
-        except subprocess.CalledProcessError as e:
+            with medir("fasta_cleaner", species, entradas=[fasta], salidas=[clean_fasta]):
+                escritas, descartadas = normalizar_fasta(fasta, clean_fasta, min_len=MIN_LEN, max_len=MAX_LEN)
+            manifiesto.registrar(f"limpieza_{Path(clean_fasta).name}", huella, [clean_fasta])
+            print(f"[DONE] Limpieza del fasta completada ({escritas} secuencias, {descartadas} descartadas por longitud)")
+            return True
+        except OSError as e:
             print(f"[FAIL] Revisa parámetros/rutas. Detalle: {e}")
+            return False
 
 # ejecutar primer comando
+# el script escribe {fasta}_cdhit100.pep junto al fasta de entrada y el resto
+# en --outpath: se le da un directorio temporal (con un enlace al fasta) y sus
+# salidas se publican con rename sólo si termina bien, el .pep el último;
+# devuelve False si falla, para que la especie no pida GPU
 def firt_step(species: str, clean_fasta: str, prefix: str, fantasia_run: str):
     out_path = OUTDIR / species / f"{clean_fasta.stem}_cdhit100.pep"
     print(out_path)
 
+    staging = ruta_temporal(fantasia_run / "primer_paso")
+    entrada = staging / Path(clean_fasta).name
+
     cmd = [ GENERATE_GPSM,
-            "--infile", clean_fasta, 
-            "--outpath", fantasia_run, 
+            "--infile", entrada, 
+            "--outpath", staging, 
             "--prott5",
             "--prefix", prefix,
-            "--mode GPU"
+            "--mode", "GPU"
     ]
 
-    if out_path.exists():
+    # el paso sólo cuenta como hecho si termina bien (queda en el manifiesto)
+    inicio = time.perf_counter()
+    manifiesto = Manifiesto(fantasia_run / "manifest.json")
+    huella = huella_paso(entradas={"fasta": clean_fasta}, bases={"script": GENERATE_GPSM},
+                         parametros={"prefix": prefix})
+
+    if manifiesto.al_dia("primer_paso", huella, [out_path]):
+        saltado("firt_step", species, time.perf_counter() - inicio, [out_path])
         print(f"[ALREADY DONE] El primer paso para esta especie ya había sido realizado")
+        return True
     else:
         print(f"[RUN] Se va a ejecutar el primer paso de FANTASIA")
+        shutil.rmtree(staging, ignore_errors=True)
         try:
-            subprocess.run(cmd, check=True)
+            staging.mkdir(parents=True)
+            entrada.symlink_to(Path(clean_fasta).resolve())
+            ejecutar(cmd, "firt_step", species, entradas=[clean_fasta], salidas=[staging],
+                     n_proteinas=contar_secuencias(clean_fasta), cwd=fantasia_run, recursos=RECURSOS_PRIMER_PASO)
+            entrada.unlink()
+            pep = staging / out_path.name
+            if not pep.exists():
+                raise FileNotFoundError(f"El primer paso no generó {pep.name}")
+            for salida in staging.iterdir():
+                if salida != pep:
+                    publicar_salida(salida, fantasia_run / salida.name)
+            publicar(pep, out_path)
+            manifiesto.registrar("primer_paso", huella, [out_path])
             print(f"[DONE] Primer paso completado; cmd={cmd}")
-        except subprocess.CalledProcessError as e:
+            return True
+        except (subprocess.CalledProcessError, OSError) as e:
             print(f"[FAIL] Revisa parámetros/rutas. Detalle: {e}")
-
-# ejecutar segundo comando
-def second_step(prefix: str, fantasia_run: str):
+            return False
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+def publicar_salida(tmp: Path, final: Path):
+    """publicar, sustituyendo un directorio de una ejecución anterior."""
+    if final.is_dir() and not final.is_symlink():
+        shutil.rmtree(final)
+    publicar(tmp, final)
+
+# ejecutar segundo comando (supervisado con asyncio: sin screen ni sondeo)
+async def second_step(prefix: str, fantasia_run: str, device: str = "cuda:1"):
     out_path = fantasia_run / f"{prefix}.log"
-    screen_name = f"fantasia_{prefix}"
 
-    cmd = F"{GPU} screen -S {screen_name} -L -Logfile {prefix}.log {LAUNCH_GPSM} -c {fantasia_run} -x {prefix} -m prott5 -o {fantasia_run}"
+    cmd = [LAUNCH_GPSM, "-c", fantasia_run, "-x", prefix, "-m", "prott5", "-o", fantasia_run]
 
-    if out_path.exists():
+    # encadenado al primer paso: si éste se rehace, el segundo también
+    species = Path(fantasia_run).parent.name
+    inicio = time.perf_counter()
+    manifiesto = Manifiesto(fantasia_run / "manifest.json")
+    huella = huella_paso(bases={"script": LAUNCH_GPSM},
+                         parametros={"prefix": prefix, "previo": manifiesto.huella_de("primer_paso")})
+
+    if manifiesto.al_dia("gopredsim", huella, [out_path], adoptable=False):
+        saltado("second_step", species, time.perf_counter() - inicio, [out_path])
         print(f"[ALREADY DONE] El segundo paso para esta especie ya había sido realizado")
-    else:
-        print(f"[RUN] Se va a ejecutar el segundo paso de FANTASIA")
-        try:
-            subprocess.run(cmd, shell=True, check=True)
-            print(f"[WAIT] Esperando a que el screen '{screen_name}' termine...")
-            # Esperar a que el screen termine
-            while True:
-                result = subprocess.run(f"screen -ls | grep -q {screen_name}", shell=True)
-                if result.returncode != 0:
-                    print(f"[DONE] Segundo paso completado; cmd={cmd}; Log: {out_path}")
-                    break
-                time.sleep(10)
-        except subprocess.CalledProcessError as e:
-            print(f"[FAIL] Revisa parámetros/rutas. Detalle: {e}")
+        return True
+
+    gpu = entorno_dispositivo(device)
+    print(f"[RUN] Se va a ejecutar el segundo paso de FANTASIA ({gpu}); Log: {out_path}")
+    try:
+        codigo = await ejecutar_async(cmd, out_path, cwd=fantasia_run, env=entorno_con(gpu),
+                                      paso="second_step", especie=species,
+                                      salidas=[out_path, fantasia_run / f"{prefix}_prott5"],
+                                      recursos=RECURSOS_GOPREDSIM)
+    except OSError as e:
+        codigo = None
+        print(f"[FAIL] Revisa parámetros/rutas. Detalle: {e}")
+    if codigo == 0:
+        manifiesto.registrar("gopredsim", huella, [out_path])
+        print(f"[DONE] Segundo paso completado; cmd={cmd}; Log: {out_path}")
+        return True
+
+    # el log de un fallo no debe contar como paso hecho en la siguiente ejecución
+    if out_path.exists():
+        out_path.replace(out_path.with_name(out_path.name + ".failed"))
+    print(f"[FAIL] Segundo paso {prefix} terminó con código {codigo}; Log: {out_path}.failed")
+    return False
 
 # ejecutar tercer comando
+# devuelve False si falla
 def topgo_step(prefix: str, fantasia_run: str, fasta: str):
     out_path = fantasia_run / f"{Path(fasta).stem}.FANTASIA_TopGO.txt"
+    tmp_path = ruta_temporal(out_path)  # se publica con rename si TopGO acaba bien
 
-    cmd = f"python3 {TOPGO} -a {prefix}_prott5 -o {out_path} -p {prefix}"
+    cmd = f"python3 {TOPGO} -a {prefix}_prott5 -o {tmp_path} -p {prefix}"
 
+    species = Path(fantasia_run).parent.name
+    inicio = time.perf_counter()
+    manifiesto = Manifiesto(fantasia_run / "manifest.json")
+    huella = huella_paso(bases={"script": TOPGO},
+                         parametros={"prefix": prefix, "previo": manifiesto.huella_de("gopredsim")})
 
-    if out_path.exists():
+    if manifiesto.al_dia(f"topgo_{out_path.name}", huella, [out_path]):
+        saltado("topgo_step", species, time.perf_counter() - inicio, [out_path])
         print(f"[ALREADY DONE] El tercer paso (TopGo) para esta especie ya había sido realizado")
+        return True
     else:
         print(f"[RUN] Se va a ejecutar el tercer paso (TopGo)")
         try:
-            subprocess.run(cmd, shell=True, check=True)
+            ejecutar(cmd, "topgo_step", species, salidas=[tmp_path], shell=True, cwd=fantasia_run,
+                     recursos=RECURSOS_TOPGO)
+            publicar(tmp_path, out_path)
+            manifiesto.registrar(f"topgo_{out_path.name}", huella, [out_path])
             print(f"[DONE] TopGo paso completado; cmd={cmd}")
-        except subprocess.CalledProcessError as e:
+            return True
+        except (subprocess.CalledProcessError, OSError) as e:
+            tmp_path.unlink(missing_ok=True)
             print(f"[FAIL] Revisa parámetros/rutas. Detalle: {e}")
+            return False
 
 
-# main ========================================================================
-def main():
-    # compruba que existe el TSV con las especies
-    tsv_path = Path(TSV)
-    if not tsv_path.exists():
-        print(f"[ERROR] No encuentro el TSV: {tsv_path}")
-        return
+# deduplicar sólo si el fasta limpio cambió desde la última vez
+def deduplicar_al_dia(clean_fasta: Path, unique_fasta: Path, mapa: Path):
+    manifiesto = Manifiesto(unique_fasta.parent / "manifest.json")
+    huella = huella_paso(entradas={"fasta": clean_fasta})
+    if not manifiesto.al_dia(f"dedup_{unique_fasta.name}", huella, [unique_fasta, mapa]):
+        deduplicar_fasta(clean_fasta, unique_fasta, mapa)
+        manifiesto.registrar(f"dedup_{unique_fasta.name}", huella, [unique_fasta, mapa])
+
 
-    # abre el TSV y almacena esocies y fasta
+# especies =====================================================================
+def leer_especies(tsv_path: Path):
+    """Lee el TSV (especie<TAB>ruta_fasta) y devuelve [(especie, fasta)] válidos."""
+    especies = []
     with tsv_path.open(encoding="utf-8") as f:
         for line in f:
             line = line.strip()
@@ -134,41 +234,110 @@ def main():
                 print(f"[WARN] FASTA no existe o está vacío para {species}: {fasta}")
                 continue
 
-            # creamos el prefijo
-            parts = species.split("_")
-            prefix = parts[0][:2] + parts[1][:3]
-            if len(parts) > 2:
-                prefix += parts[2][:3]
-
-            print(f"EJECUTANDO FANTASIA PARA LA ESPECIE {species}")
-
-            # se limpia el fasta
-            clean_fasta_name = f"{Path(fasta).stem}.clean.faa"
-            clean_fasta = OUTDIR / species / clean_fasta_name
-            fasta_cleaner(fasta, clean_fasta)
-
-            # se crea la carpeta fantasia_run dentro de la carpeta de la especie
-            fantasia_run = OUTDIR / species / "fantasia_run"
-            if not fantasia_run.exists():
-                fantasia_run.mkdir(parents=True, exist_ok=True)
-                print("[INFO] Carpeta 'fantasia_run' creada correctamente")
-
-            # nos movemos a esa carpeta
-            original = Path.cwd()
-            os.chdir(fantasia_run)
+            especies.append((species, fasta))
+    return especies
+
+
+def prefijo_especie(species: str) -> str:
+    """Genus_species[_var] → Gespe[var] (prefijo de GoPredSim)."""
+    parts = species.split("_")
+    prefix = parts[0][:2] + parts[1][:3]
+    if len(parts) > 2:
+        prefix += parts[2][:3]
+    return prefix
+
+
+async def procesar_especie(species: str, fasta: str, cpu: asyncio.Semaphore, gpus: asyncio.Queue):
+    """
+    Pipeline de una especie. Los pasos CPU van a hilos (limitados por `cpu`) y
+    el paso GPU se supervisa con asyncio en una GPU de la cola `gpus` (en
+    exclusiva), así el TopGO de una especie corre mientras otra ocupa la GPU.
+    """
+    prefix = prefijo_especie(species)
+    print(f"EJECUTANDO FANTASIA PARA LA ESPECIE {species}")
+
+    # se crea la carpeta fantasia_run dentro de la carpeta de la especie
+    fantasia_run = OUTDIR / species / "fantasia_run"
+    if not fantasia_run.exists():
+        fantasia_run.mkdir(parents=True, exist_ok=True)
+        print("[INFO] Carpeta 'fantasia_run' creada correctamente")
+
+    clean_fasta = OUTDIR / species / f"{Path(fasta).stem}.clean.faa"
+    mapa = OUTDIR / species / f"{clean_fasta.stem}.dedup.tsv"
+    input_fasta = clean_fasta
+
+    async with cpu:
+        # se limpia el fasta
+        if not await asyncio.to_thread(fasta_cleaner, fasta, clean_fasta):
+            print(f"[FAIL] {species}: sin fasta limpio no se sigue con la especie")
+            return False
+
+        # con DEDUP_SECUENCIAS los pasos trabajan sólo con secuencias únicas
+        if DEDUP_SECUENCIAS:
+            input_fasta = OUTDIR / species / f"{clean_fasta.stem}.uniq.faa"
+            await asyncio.to_thread(deduplicar_al_dia, clean_fasta, input_fasta, mapa)
+
+        # ejecución del primer comando (cada paso usa cwd=fantasia_run, sin os.chdir)
+        if not await asyncio.to_thread(firt_step, species, input_fasta, prefix, fantasia_run):
+            print(f"[FAIL] {species}: falló el primer paso, no se lanza GoPredSim")
+            return False
+
+    # ejecución del segundo comando (espera en cola hasta que haya una GPU libre)
+    device = await gpus.get()
+    try:
+        ok = await second_step(prefix, fantasia_run, device)
+    finally:
+        gpus.put_nowait(device)
+    if not ok:
+        return False
+
+    # ejecución del tercer comando
+    async with cpu:
+        if DEDUP_SECUENCIAS:
+            await asyncio.to_thread(topgo_step, prefix, fantasia_run, input_fasta)
+            topgo_uniq = fantasia_run / f"{input_fasta.stem}.FANTASIA_TopGO.txt"
+            topgo_final = fantasia_run / f"{Path(fasta).stem}.FANTASIA_TopGO.txt"
+            if topgo_uniq.exists():
+                manifiesto = Manifiesto(fantasia_run / "manifest.json")
+                huella = huella_paso(entradas={"parcial": topgo_uniq, "mapa": mapa})
+                if not manifiesto.al_dia(f"expandir_{topgo_final.name}", huella, [topgo_final]):
+                    expandir_tabla(topgo_uniq, topgo_final, mapa)
+                    manifiesto.registrar(f"expandir_{topgo_final.name}", huella, [topgo_final])
+                    print(f"[DONE] TopGO re-expandido a todos los IDs → {topgo_final}")
+        else:
+            await asyncio.to_thread(topgo_step, prefix, fantasia_run, fasta)
+    return True
+
+
+async def procesar_especies(especies):
+    cpu = asyncio.Semaphore(MAX_CPU_PARALELO)
+    gpus = asyncio.Queue()
+    for device in leer_dispositivos(DEVICES):
+        gpus.put_nowait(device)
+    tareas = [procesar_especie(species, fasta, cpu, gpus) for species, fasta in especies]
+    resultados = await asyncio.gather(*tareas, return_exceptions=True)
+    estado = {}
+    for (species, _), res in zip(especies, resultados):
+        if isinstance(res, Exception):
+            print(f"[FAIL] {species}. Detalle: {res}")
+            res = False
+        estado[species] = res
+    return estado
 
-            # ejecución del primer comando
-            firt_step(species, clean_fasta, prefix, fantasia_run)
 
-            # ejecución del segundo comando
-            second_step(prefix, fantasia_run)
-
-            # ejecución del tercer comando
-            topgo_step(prefix, fantasia_run, fasta)
+# main ========================================================================
+def main():
+    # compruba que existe el TSV con las especies
+    tsv_path = Path(TSV)
+    if not tsv_path.exists():
+        print(f"[ERROR] No encuentro el TSV: {tsv_path}")
+        return
 
-            os.chdir(original)
+    # abre el TSV y almacena especies y fasta
+    especies = leer_especies(tsv_path)
+    asyncio.run(procesar_especies(especies))
 
     print("\nTodo terminado. ✔")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,222 +1,980 @@
-#!/usr/bin/env python3
-# -*- coding: utf-8 -*-
-
-"""
-Uso:
-1) Edita la sección CONFIG de abajo (TSV, DB1, DB2, OUTDIR, etc.).
-2) Ejecuta:  python annotation_with_diamond.py
-3) Los resultados se guardan en OUTDIR con nombres: especie.dbname.o6.txt
-   (dbname es el nombre del archivo .dmnd sin la ruta)
-"""
-
-import subprocess
-from pathlib import Path
-import csv, sys
-from tempfile import NamedTemporaryFile
-
-
-
-# ========================= CONFIGURACIÓN =====================================
-#TSV = "/data/users/sgarjua/ann_diamond_test/species.tsv"   # Formato: especie<TAB>ruta_fasta
-TSV = "/data/users/sgarjua/ann_diamond_test/sorghum.tsv"
-DB1 = "/data/shared_dbs/swissprot/uniprot_sprot_r2025_01.dmnd"
-DB2 = "/data/shared_dbs/swissprot/uniprot_trembl_r2025_01.dmnd"
-OUTDIR = "/data/users/sgarjua/ann_diamond_test/"
-
-MODE = "blastp"            # "blastp" para proteomas; "blastx" para ADN
-THREADS = "24"
-EVALUE = "1e-20"
-MAX_TARGET_SEQS = "1"
-SENSITIVITY = "--sensitive"  # o "--ultra-sensitive"
-OUTFMT = "6"      # columnas estándar + título del sujeto
-
-# Post-proceso: mapper GO + AHRD
-UNIPROT_GO_MAPPER = "/data/users/sgarjua/ann_diamond_test/uniprot_GO_mapper.py"
-
-AHRD_JAR = "/data/software/AHRD/dist/ahrd.jar"
-GO_GAF = "/data/shared_dbs/swissprot/goa_uniprot_all.gaf"
-UNIPROT_SPROT = "/data/shared_dbs/swissprot/uniprot_sprot_r2025_01.fasta"
-UNIPROT_TREMBL = "/data/shared_dbs/swissprot/uniprot_trembl_r2025_01.fasta"
-BLACKLIST = "/data/software/AHRD/test/resources/blacklist_descline.txt"
-FILTER_SPROT = "/data/software/AHRD/test/resources/filter_descline_sprot.txt"
-FILTER_TREMBL = "/data/software/AHRD/test/resources/filter_descline_trembl.txt"
-TOKEN_BLACKLIST = "/data/software/AHRD/test/resources/blacklist_token.txt"
-JAVA_XMX = "2g"   # sube a "8g" o más si lo necesitas
-
-
-# =============================================================================
-
-def run_diamond(species: str, fasta: str, db: str, outdir: Path):
-    dbname = Path(db).stem  # nombre corto de la DB para el fichero de salida
-    out_path = outdir / f"{species}.{dbname}.o6.txt"
-
-    cmd = [
-        "diamond", MODE,
-        "--query", fasta,
-        "--db", db,
-        "--outfmt", OUTFMT,
-        "--max-target-seqs", str(MAX_TARGET_SEQS),
-        "--evalue", EVALUE,
-        "--out", str(out_path),
-        "--threads", str(THREADS),
-        SENSITIVITY,
-    ]
-
-    if out_path.exists():
-        print(f"[ALREADY DONE] {species} vs {dbname} → {out_path}")
-    else:
-        print(f"[RUN ] {species} vs {dbname} → {out_path}")
-        try:
-            subprocess.run(cmd, check=True)
-            print(f"[DONE] {species} vs {dbname}")
-        except subprocess.CalledProcessError as e:
-            print(f"[FAIL] {species} vs {dbname}. Revisa parámetros/rutas. Detalle: {e}")
-
-
-def write_ahrd_yaml(tmp_yaml_path: Path,
-                    proteins_fasta: Path,
-                    go_gaf: Path,
-                    out_file: Path,
-                    sprot_tsv: Path,
-                    trembl_tsv: Path,
-                    uniprot_sprot_fa: Path,
-                    uniprot_trembl_fa: Path,
-                    blacklist: Path,
-                    filter_sprot: Path,
-                    filter_trembl: Path,
-                    token_blacklist: Path):
-    """Crea YAML temporal de AHRD (mismos pesos que en el bash)."""
-    yaml_text = f"""proteins_fasta: {proteins_fasta}
-token_score_bit_score_weight: 0.468
-token_score_database_score_weight: 0.2098
-token_score_overlap_score_weight: 0.3221
-gene_ontology_result: {go_gaf}
-reference_go_regex: '^UniProtKB\\t(?<shortAccession>[^\\t]+)\\t[^\\t]+\\t(?!NOT\\|)[^\\t]*\\t(?<goTerm>GO:\\d+)'
-prefer_reference_with_go_annos: true
-output: {out_file}
-blast_dbs:
-  swissprot:
-    weight: 653
-    description_score_bit_score_weight: 2.717061
-    file: {sprot_tsv}
-    database: {uniprot_sprot_fa}
-    blacklist: {blacklist}
-    filter: {filter_sprot}
-    token_blacklist: {token_blacklist}
-
-  trembl:
-    weight: 904
-    description_score_bit_score_weight: 2.590211
-    file: {trembl_tsv}
-    database: {uniprot_trembl_fa}
-    blacklist: {blacklist}
-    filter: {filter_trembl}
-    token_blacklist: {token_blacklist}
-"""
-    tmp_yaml_path.write_text(yaml_text)
-
-def run_ahrd(ahrd_jar: Path, yaml_path: Path, xmx: str = "2g"):
-    """java -Xmx<xmx> -jar ahrd.jar tmp.yml"""
-    if not ahrd_jar.exists():
-        raise FileNotFoundError(f"No se encuentra AHRD JAR: {ahrd_jar}")
-    if not yaml_path.exists():
-        raise FileNotFoundError(f"No se encuentra YAML de AHRD: {yaml_path}")
-    cmd = ["java", f"-Xmx{xmx}", "-jar", str(ahrd_jar), str(yaml_path)]
-    print(">> Ejecutando AHRD:", " ".join(cmd))
-    subprocess.run(cmd, check=True)
-
-# =============================================================================
-def main():
-    outdir = Path(OUTDIR)
-    outdir.mkdir(parents=True, exist_ok=True)
-
-    tsv_path = Path(TSV)
-    if not tsv_path.exists():
-        print(f"[ERROR] No encuentro el TSV: {tsv_path}")
-        return
-
-    if not Path(DB1).exists() or not Path(DB2).exists():
-        print(f"[ERROR] Revisa que existan DB1 y DB2:\n  DB1={DB1}\n  DB2={DB2}")
-        return
-
-    with tsv_path.open(encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith("#"):
-                continue
-            # Espera: especie<TAB>ruta_fasta
-            parts = line.split("\t")
-            if len(parts) < 2:
-                print(f"[WARN] Línea ignorada (formato esperado: especie<TAB>fasta): {line}")
-                continue
-
-            species, fasta = parts[0].strip(), parts[1].strip()
-
-            if not species or not fasta:
-                print(f"[WARN] Falta especie o fasta en la línea: {line}")
-                continue
-
-            if not Path(fasta).exists() or Path(fasta).stat().st_size == 0:
-                print(f"[WARN] FASTA no existe o está vacío para {species}: {fasta}")
-                continue
-
-            # Eliminar los puntos de los archivos de proteinas
-            # MODIFICAR PARA QUE LO GUARDE EN OTRA CARPETA O HACER UNA FUNCIOOOOOON
-            # with open(fasta, "r") as infile, open(f"{Path(fasta).stem}.nodots.faa", "w") as outfile:
-            #     for line in infile:
-            #         line = line.replace(".", "")
-            #         outfile.write(line)
-            #     fasta = outfile
-
-            # Ejecuta contra las dos bases
-            run_diamond(species, fasta, DB1, outdir)
-            run_diamond(species, fasta, DB2, outdir)
-
-            # === POST-PROCESO: Extraer IDs → Mapper GO → YAML AHRD → AHRD ===
-
-            # Reconstruimos rutas de salidas DIAMOND que ya generaste:
-            sprot_tsv = outdir / f"{species}.{Path(DB1).stem}.o6.txt"
-            trembl_tsv = outdir / f"{species}.{Path(DB2).stem}.o6.txt"
-
-            if not sprot_tsv.exists() or not trembl_tsv.exists():
-                print(f"[WARN] No encuentro TSVs de DIAMOND para {species}. Saltando post-proceso.")
-            else:
-                # YAML temporal AHRD + ejecución
-                ahrd_out = outdir / f"{species}.proteins.funct_ahrd.tsv"
-                if ahrd_out.exists():
-                    print("[INFO] AHRD already exists → {ahrd_out}")
-                else:    
-                    with NamedTemporaryFile("w", delete=False, suffix=".yml", dir=str(outdir)) as tmp:
-                        yaml_path = Path(tmp.name)
-
-                    print("[INFO] Generando YAML temporal para AHRD…")
-                    write_ahrd_yaml(
-                        tmp_yaml_path=yaml_path,
-                        proteins_fasta=Path(fasta),  # usa el FASTA que ya estabas usando
-                        go_gaf=Path(GO_GAF),
-                        out_file=ahrd_out,
-                        sprot_tsv=sprot_tsv,
-                        trembl_tsv=trembl_tsv,
-                        uniprot_sprot_fa=Path(UNIPROT_SPROT),
-                        uniprot_trembl_fa=Path(UNIPROT_TREMBL),
-                        blacklist=Path(BLACKLIST),
-                        filter_sprot=Path(FILTER_SPROT),
-                        filter_trembl=Path(FILTER_TREMBL),
-                        token_blacklist=Path(TOKEN_BLACKLIST),
-                    )
-
-                    print("[INFO] Ejecutando AHRD…")
-                    run_ahrd(Path(AHRD_JAR), yaml_path, xmx=JAVA_XMX)
-                    print(f"[DONE] AHRD → {ahrd_out}")
-
-                    # Limpieza del YAML temporal (opcional)
-                    try:
-                        yaml_path.unlink(missing_ok=True)
-                    except Exception:
-                        pass
-
-
-    print("\nTodo terminado. ✔")
-
-if __name__ == "__main__":
-    main()
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Uso:
+1) Edita la sección CONFIG de abajo (TSV, DB1, DB2, OUTDIR, etc.).
+2) Ejecuta:  python annotation_with_diamond.py
+3) Los resultados se guardan en OUTDIR con nombres: especie.dbname.o6.txt
+   (dbname es el nombre del archivo .dmnd sin la ruta)
+4) Con SHARDS > 1, otros nodos que vean el mismo OUTDIR pueden ayudar con:
+     python annotation_with_diamond.py --shard-worker
+"""
+
+import subprocess
+from pathlib import Path
+import csv, sys
+import json
+import os
+import shutil
+import socket
+import time
+from dataclasses import replace
+from tempfile import NamedTemporaryFile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from fasta_utils import (leer_fasta, digest_secuencia, escribir_fasta,
+                         deduplicar_fasta, expandir_tabla, normalizar_fasta, partir_fasta,
+                         contar_secuencias)
+from diamond_cache import CacheDiamond, espacio_cache
+from fasta_index import IndiceFasta
+from gaf_subset import accesiones_hits, subconjuntos_gaf
+from go_store import AlmacenGO, escribir_anotacion
+from manifest import Manifiesto, huella_paso, version_herramienta, ruta_temporal, publicar
+from instrumentation import ejecutar, saltado
+from executor import EjecutorLocal, Recursos, ejecutor_actual, memoria_gb
+
+
+
+# ========================= CONFIGURACIÓN =====================================
+#TSV = "/data/users/sgarjua/ann_diamond_test/species.tsv"   # Formato: especie<TAB>ruta_fasta
+TSV = "/data/users/sgarjua/ann_diamond_test/sorghum.tsv"
+DB1 = "/data/shared_dbs/swissprot/uniprot_sprot_r2025_01.dmnd"
+DB2 = "/data/shared_dbs/swissprot/uniprot_trembl_r2025_01.dmnd"
+OUTDIR = "/data/users/sgarjua/ann_diamond_test/"
+
+MODE = "blastp"            # "blastp" para proteomas; "blastx" para ADN
+THREADS = "24"
+EVALUE = "1e-20"
+MAX_TARGET_SEQS = "1"
+SENSITIVITY = "--sensitive"  # o "--ultra-sensitive"
+OUTFMT = "6"      # columnas estándar + título del sujeto
+
+# Post-proceso: AHRD
+AHRD_JAR = "/data/software/AHRD/dist/ahrd.jar"
+GO_GAF = "/data/shared_dbs/swissprot/goa_uniprot_all.gaf"
+UNIPROT_SPROT = "/data/shared_dbs/swissprot/uniprot_sprot_r2025_01.fasta"
+UNIPROT_TREMBL = "/data/shared_dbs/swissprot/uniprot_trembl_r2025_01.fasta"
+BLACKLIST = "/data/software/AHRD/test/resources/blacklist_descline.txt"
+FILTER_SPROT = "/data/software/AHRD/test/resources/filter_descline_sprot.txt"
+FILTER_TREMBL = "/data/software/AHRD/test/resources/filter_descline_trembl.txt"
+TOKEN_BLACKLIST = "/data/software/AHRD/test/resources/blacklist_token.txt"
+JAVA_XMX = "2g"   # sube a "8g" o más si lo necesitas
+
+# AHRD con un GAF recortado a las accesiones con hit ({especie}.goa_subset.gaf),
+# generado en una sola pasada por GO_GAF para todas las especies pendientes
+SUBCONJUNTO_GAF = False
+
+# AHRD con FASTAs de referencia recortados a los sujetos con hit
+# ({especie}.sprot_ref.fasta / .trembl_ref.fasta), extraídos con un índice
+# accesión → offset de UNIPROT_SPROT/TREMBL que se construye una vez por release
+REFERENCIAS_RECORTADAS = False
+INDICES_UNIPROT = "/data/users/sgarjua/ann_diamond_test/uniprot_idx"
+
+# GO por proteína directamente desde los hits de DIAMOND ({especie}.diamond_go.tsv)
+# con un almacén accesión → GO compilado una vez desde GO_GAF (en lugar del
+# uniprot_GO_mapper.py externo); mismas reglas NOT que la reference_go_regex de AHRD
+MAPEO_GO = False
+ALMACEN_GO = "/data/users/sgarjua/ann_diamond_test/goa_uniprot_all.gostore"
+MAPEO_GO_SOLO_MEJOR = True  # sólo el mejor hit de cada base (False = unión de todos)
+
+# Planificador: varias especies a la vez repartiendo THREADS entre los DIAMOND
+MAX_ESPECIES_PARALELO = 3   # DIAMOND simultáneos (cada uno usa THREADS // n hilos)
+MAX_AHRD_PARALELO = 2       # AHRD simultáneos (cada uno es una JVM de JAVA_XMX)
+
+# Modo lote: una sola búsqueda DIAMOND por base con todas las especies juntas
+BATCH_DIAMOND = False
+SEP_BATCH = "@@"            # separador etiqueta-especie / ID original en las cabeceras
+
+# Cascada: TrEMBL (DB2) sólo con las proteínas sin hit en SwissProt (DB1)
+CASCADA_SPROT = False
+
+# Caché de hits por secuencia (sha1 de la secuencia + .dmnd + parámetros);
+# con SHARDS > 1 sólo se parten las secuencias que no están en la caché
+USAR_CACHE_DIAMOND = False
+CACHE_DIAMOND = "/data/users/sgarjua/ann_diamond_test/diamond_cache.sqlite"
+CACHE_MAX_GB = 50           # al superarlo se expulsan las entradas menos usadas
+
+# Colapsar secuencias idénticas antes de DIAMOND/AHRD y re-expandir después
+DEDUP_SECUENCIAS = False
+
+# Normalizar los FASTA (cabecera hasta el primer espacio, sin . ni * en la secuencia)
+NORMALIZAR_FASTA = False
+MIN_LEN = 0                 # descarta secuencias más cortas (0 = sin filtro)
+MAX_LEN = 0                 # descarta secuencias más largas (0 = sin filtro)
+
+# Shards: partir el query en N trozos equilibrados por residuos, cada uno con su
+# propio checkpoint; varios nodos pueden repartírselos a través de OUTDIR/_shards
+# lanzando en ellos:  python annotation_with_diamond.py --shard-worker
+SHARDS = 1                  # 1 = sin shards
+SHARD_PARALELO = 2          # shards simultáneos en este nodo (se reparten los hilos)
+SHARD_REINTENTOS = 2        # reintentos de un shard fallido (sin tocar los demás)
+SHARD_LOCK_HORAS = 48       # un lock más viejo se considera de un nodo muerto
+SHARD_ESPERA = 60           # segundos entre comprobaciones de shards de otros nodos
+
+# Recursos que pide cada paso al ejecutor (executor.py; EJECUTOR=lotes los envía
+# a la cola del clúster). Los cpus de DIAMOND son sus --threads y la memoria
+# de AHRD, JAVA_XMX más el margen de la JVM. La memoria de DIAMOND es la que se
+# pide a la cola; en local se recorta a la parte de la memoria de la máquina
+# proporcional a sus hilos (si no, en una máquina con menos de 2 x 32 GB las
+# búsquedas irían de una en una aunque sobraran núcleos)
+RECURSOS_DIAMOND = Recursos(mem_gb=32, horas=48)
+RECURSOS_AHRD = Recursos(cpus=2, horas=24)
+MARGEN_JVM_GB = 1
+
+
+# =============================================================================
+
+def manifiesto_especie(outdir: Path, species: str):
+    """Manifiesto de pasos hechos de una especie ({especie}.manifest.json)."""
+    return Manifiesto(outdir / f"{species}.manifest.json")
+
+
+def huella_diamond(fasta: str, db: str):
+    """Huella de una búsqueda: contenido del query, identidad del .dmnd, parámetros y versión."""
+    return huella_paso(
+        entradas={"query": fasta},
+        bases={"db": db},
+        parametros={"mode": MODE, "evalue": EVALUE, "max_target_seqs": MAX_TARGET_SEQS,
+                    "sensitivity": SENSITIVITY, "outfmt": OUTFMT},
+        herramientas={"diamond": version_herramienta(["diamond", "version"])},
+    )
+
+
+def run_diamond(species: str, fasta: str, db: str, outdir: Path, threads=THREADS):
+    """Lanza DIAMOND de una especie contra una DB. Devuelve True si la salida está al día."""
+    dbname = Path(db).stem  # nombre corto de la DB para el fichero de salida
+    out_path = outdir / f"{species}.{dbname}.o6.txt"
+    tmp_path = ruta_temporal(out_path)  # se publica con rename sólo si DIAMOND acaba bien
+
+    cmd = [
+        "diamond", MODE,
+        "--query", fasta,
+        "--db", db,
+        "--outfmt", OUTFMT,
+        "--max-target-seqs", str(MAX_TARGET_SEQS),
+        "--evalue", EVALUE,
+        "--out", str(tmp_path),
+        "--threads", str(threads),
+        SENSITIVITY,
+    ]
+
+    inicio = time.perf_counter()
+    manifiesto = manifiesto_especie(outdir, species)
+    huella = huella_diamond(fasta, db)
+    if manifiesto.al_dia(f"diamond_{dbname}", huella, [out_path]):
+        saltado(f"diamond_{dbname}", species, time.perf_counter() - inicio, [out_path])
+        print(f"[ALREADY DONE] {species} vs {dbname} → {out_path}")
+        return True
+
+    print(f"[RUN ] {species} vs {dbname} → {out_path}")
+    try:
+        if Path(fasta).stat().st_size == 0:
+            tmp_path.touch()  # query vacío (p.ej. residual de la cascada): tabla vacía válida
+        else:
+            ejecutar(cmd, f"diamond_{dbname}", species, entradas=[fasta], salidas=[tmp_path],
+                     n_proteinas=contar_secuencias(fasta), recursos=recursos_diamond(threads))
+        publicar(tmp_path, out_path)
+        manifiesto.registrar(f"diamond_{dbname}", huella, [out_path])
+        print(f"[DONE] {species} vs {dbname}")
+        return True
+    except (subprocess.CalledProcessError, OSError) as e:
+        tmp_path.unlink(missing_ok=True)
+        print(f"[FAIL] {species} vs {dbname}. Revisa parámetros/rutas. Detalle: {e}")
+        return False
+
+
+def run_diamond_cacheado(species: str, fasta: str, db: str, outdir: Path, threads=THREADS):
+    """
+    Como run_diamond, pero consultando antes la caché de hits: sólo se busca
+    con DIAMOND las secuencias que no estén ya en ella y el .o6.txt final se
+    reconstruye con los IDs de esta ejecución, en el orden del FASTA. Con
+    SHARDS > 1 la búsqueda de las que faltan va por shards.
+    """
+    dbname = Path(db).stem
+    out_path = outdir / f"{species}.{dbname}.o6.txt"
+    manifiesto = manifiesto_especie(outdir, species)
+    huella = huella_diamond(fasta, db)
+    if manifiesto.al_dia(f"diamond_{dbname}", huella, [out_path]):
+        print(f"[ALREADY DONE] {species} vs {dbname} → {out_path}")
+        return True
+
+    espacio = espacio_cache(db, MODE, EVALUE, SENSITIVITY, MAX_TARGET_SEQS, OUTFMT)
+    registros, secuencias = [], {}
+    for prot, seq in leer_fasta(fasta):
+        digest = digest_secuencia(seq)
+        registros.append((prot, digest))
+        secuencias.setdefault(digest, seq)
+
+    cache = CacheDiamond(CACHE_DIAMOND, CACHE_MAX_GB * 1e9)
+    try:
+        hits = cache.buscar(espacio, secuencias.keys())
+        faltan = {d: seq for d, seq in secuencias.items() if d not in hits}
+        print(f"[INFO] Caché {species} vs {dbname}: {len(hits)} secuencias en caché, "
+              f"{len(faltan)} por buscar")
+
+        if faltan:
+            tmpdir = outdir / "_cache_miss"
+            tmpdir.mkdir(parents=True, exist_ok=True)
+            query = tmpdir / f"{species}.{dbname}.miss.faa"
+            miss_out = tmpdir / f"{species}.miss.{dbname}.o6.txt"
+            escribir_fasta(faltan.items(), query)  # la cabecera es la huella
+            miss_out.unlink(missing_ok=True)
+            buscar = run_diamond_shards if SHARDS > 1 else run_diamond
+            if not buscar(f"{species}.miss", str(query), db, tmpdir, threads=threads):
+                return False
+
+            nuevos = {d: [] for d in faltan}
+            with miss_out.open(encoding="utf-8") as f:
+                for line in f:
+                    digest, _, resto = line.rstrip("\n").partition("\t")
+                    if digest in nuevos:
+                        nuevos[digest].append(resto)
+            cache.guardar(espacio, nuevos)
+            hits.update(nuevos)
+            query.unlink(missing_ok=True)
+            miss_out.unlink(missing_ok=True)
+            shutil.rmtree(tmpdir / "_shards" / f"{species}.miss.{dbname}", ignore_errors=True)
+    finally:
+        cache.close()
+
+    tmp = ruta_temporal(out_path)
+    with tmp.open("w", encoding="utf-8") as out:
+        for prot, digest in registros:
+            for resto in hits.get(digest, []):
+                out.write(f"{prot}\t{resto}\n")
+    publicar(tmp, out_path)
+    manifiesto.registrar(f"diamond_{dbname}", huella, [out_path])
+    print(f"[DONE] {species} vs {dbname} (con caché)")
+    return True
+
+
+def particion_shards(fasta: str, shard_dir: Path, n: int):
+    """
+    Trozos del query en shard_dir (shard_000.faa…). Se reutilizan mientras el
+    FASTA y n no cambien; si varios nodos parten a la vez, gana el primer rename.
+    """
+    huella = huella_paso(entradas={"fasta": fasta}, parametros={"n": n})
+    info = shard_dir / "particion.json"
+    if info.exists() and json.loads(info.read_text()).get("huella") == huella:
+        return sorted(shard_dir.glob("shard_*.faa"))
+
+    if shard_dir.exists():
+        print(f"[INFO] Partición obsoleta en {shard_dir}, se rehace")
+        shutil.rmtree(shard_dir, ignore_errors=True)
+    tmp = ruta_temporal(shard_dir)
+    shutil.rmtree(tmp, ignore_errors=True)
+    partir_fasta(fasta, n, tmp)
+    (tmp / "particion.json").write_text(json.dumps({"huella": huella, "fasta": str(fasta), "n": n}))
+    try:
+        os.replace(tmp, shard_dir)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)  # otro nodo la publicó antes
+    return sorted(shard_dir.glob("shard_*.faa"))
+
+
+def reclamar_shard(lock: Path) -> bool:
+    """Crea el lock del shard de forma exclusiva (O_EXCL también vale entre nodos)."""
+    for _ in range(2):
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            with os.fdopen(fd, "w") as f:
+                f.write(f"{socket.gethostname()}:{os.getpid()}:{time.time():.0f}\n")
+            return True
+        except FileExistsError:
+            try:
+                edad = time.time() - lock.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if edad < SHARD_LOCK_HORAS * 3600:
+                return False
+            print(f"[WARN] Lock abandonado ({edad / 3600:.1f} h), se reclama: {lock}")
+            lock.unlink(missing_ok=True)
+    return False
+
+
+def trabajar_shard(shard_fa: Path, db: str, shard_dir: Path, threads=THREADS):
+    """
+    Ejecuta un shard si está pendiente y libre. Devuelve True (hecho),
+    False (falló tras los reintentos) o None (lo está haciendo otro nodo).
+    """
+    nombre = shard_fa.stem
+    out = shard_dir / f"{nombre}.{Path(db).stem}.o6.txt"
+    if manifiesto_especie(shard_dir, nombre).al_dia(f"diamond_{Path(db).stem}", huella_diamond(shard_fa, db), [out]):
+        return True
+    lock = shard_dir / f"{nombre}.{Path(db).stem}.lock"
+    if not reclamar_shard(lock):
+        return None
+    try:
+        for intento in range(1 + SHARD_REINTENTOS):
+            if run_diamond(nombre, str(shard_fa), db, shard_dir, threads=threads):
+                return True
+            print(f"[WARN] {shard_dir.name}/{nombre} falló (intento {intento + 1})")
+        return False
+    finally:
+        lock.unlink(missing_ok=True)
+
+
+def run_diamond_shards(species: str, fasta: str, db: str, outdir: Path, threads=THREADS, n: int = None):
+    """
+    DIAMOND por shards con checkpoint: cada trozo tiene su salida atómica y su
+    manifiesto en OUTDIR/_shards/{especie}.{db}/, así que un shard fallido se
+    reintenta solo y una ejecución interrumpida retoma los que faltan. Al
+    terminar todos, se concatenan en orden en el {especie}.{db}.o6.txt final.
+    """
+    dbname = Path(db).stem
+    out_path = outdir / f"{species}.{dbname}.o6.txt"
+    manifiesto = manifiesto_especie(outdir, species)
+    huella = huella_diamond(fasta, db)
+    if manifiesto.al_dia(f"diamond_{dbname}", huella, [out_path]):
+        print(f"[ALREADY DONE] {species} vs {dbname} → {out_path}")
+        return True
+
+    shard_dir = outdir / "_shards" / f"{species}.{dbname}"
+    shards = particion_shards(fasta, shard_dir, n or SHARDS)
+    paralelo = max(1, min(SHARD_PARALELO, len(shards)))
+    threads_shard = threads_por_trabajo(threads, paralelo)
+    print(f"[RUN ] {species} vs {dbname} en {len(shards)} shards ({paralelo} x {threads_shard} hilos)")
+
+    pendientes = list(shards)
+    while pendientes:
+        with ThreadPoolExecutor(max_workers=paralelo) as ex:
+            res = list(ex.map(lambda sh: trabajar_shard(sh, db, shard_dir, threads_shard), pendientes))
+        fallidos = [sh.name for sh, r in zip(pendientes, res) if r is False]
+        if fallidos:
+            print(f"[FAIL] {species} vs {dbname}: shards fallidos {', '.join(fallidos)}")
+            return False
+        pendientes = [sh for sh, r in zip(pendientes, res) if r is None]
+        if pendientes:
+            print(f"[WAIT] {species} vs {dbname}: {len(pendientes)} shards en marcha en otros nodos")
+            time.sleep(SHARD_ESPERA)
+
+    tmp = ruta_temporal(out_path)
+    with tmp.open("wb") as out:
+        for sh in shards:
+            with (shard_dir / f"{sh.stem}.{dbname}.o6.txt").open("rb") as parte:
+                shutil.copyfileobj(parte, out)
+    publicar(tmp, out_path)
+    manifiesto.registrar(f"diamond_{dbname}", huella, [out_path])
+    print(f"[DONE] {species} vs {dbname} ({len(shards)} shards unidos)")
+    return True
+
+
+def trabajar_shards_especies(especies, outdir: Path):
+    """Modo --shard-worker: ayuda con los shards pendientes de todas las especies, sin unir ni AHRD."""
+    bases = [DB1] if CASCADA_SPROT else [DB1, DB2]  # el residual de la cascada depende de DB1
+    for species, fasta in especies:
+        for db in bases:
+            shard_dir = outdir / "_shards" / f"{species}.{Path(db).stem}"
+            shards = particion_shards(fasta, shard_dir, SHARDS)
+            with ThreadPoolExecutor(max_workers=max(1, SHARD_PARALELO)) as ex:
+                list(ex.map(lambda sh: trabajar_shard(sh, db, shard_dir,
+                                                      threads_por_trabajo(THREADS, SHARD_PARALELO)), shards))
+
+
+def buscar_diamond(species: str, fasta: str, db: str, outdir: Path, threads=THREADS):
+    """Punto único de búsqueda por especie: con caché de hits (sus fallos por shards si SHARDS > 1), por shards o directa."""
+    if USAR_CACHE_DIAMOND:
+        return run_diamond_cacheado(species, fasta, db, outdir, threads=threads)
+    if SHARDS > 1:
+        return run_diamond_shards(species, fasta, db, outdir, threads=threads)
+    return run_diamond(species, fasta, db, outdir, threads=threads)
+
+
+def escribir_query_lote(especies, query_path: Path):
+    """
+    Une los FASTA de varias especies en un solo query con cabeceras etiquetadas
+    ">{i}@@{id}" (i = posición de la especie), así los IDs repetidos entre
+    especies no colisionan. Devuelve {etiqueta: especie}.
+    """
+    etiquetas = {}
+    with query_path.open("w", encoding="utf-8") as out:
+        for i, (species, fasta) in enumerate(especies):
+            tag = str(i)
+            etiquetas[tag] = species
+            with open(fasta, encoding="utf-8") as fa:
+                for line in fa:
+                    if line.startswith(">"):
+                        prot = line[1:].split(maxsplit=1)[0] if line[1:].strip() else ""
+                        line = f">{tag}{SEP_BATCH}{prot}\n"
+                    out.write(line)
+    return etiquetas
+
+
+def repartir_hits_lote(hits_path: Path, etiquetas: dict, db: str, outdir: Path):
+    """
+    Recorre la tabla de hits combinada en streaming y la reparte en los
+    {especie}.{dbname}.o6.txt de siempre, devolviendo a cada query su ID original.
+    Escribe en .tmp y renombra al final para no dejar salidas a medias.
+    """
+    dbname = Path(db).stem
+    finales = {tag: outdir / f"{sp}.{dbname}.o6.txt" for tag, sp in etiquetas.items()}
+    tmps = {tag: p.with_name(p.name + ".tmp") for tag, p in finales.items()}
+    handles = {tag: p.open("w", encoding="utf-8") for tag, p in tmps.items()}
+    try:
+        with hits_path.open(encoding="utf-8") as hits:
+            for line in hits:
+                qseqid, sep, resto = line.partition("\t")
+                tag, _, prot = qseqid.partition(SEP_BATCH)
+                if tag not in handles:
+                    print(f"[WARN] Hit con query sin etiqueta de especie: {qseqid}")
+                    continue
+                handles[tag].write(f"{prot}{sep}{resto}")
+    finally:
+        for h in handles.values():
+            h.close()
+    for tag, tmp in tmps.items():
+        tmp.replace(finales[tag])
+
+
+def run_diamond_batch(especies, db: str, outdir: Path, threads=THREADS):
+    """
+    Modo lote: una única ejecución de DIAMOND contra `db` para todas las especies
+    que aún no tienen su salida (la base y su índice se cargan una sola vez).
+    Es reanudable: las especies con salida ya hecha no entran en el query.
+    """
+    dbname = Path(db).stem
+    pendientes = []
+    for sp, fa in especies:
+        out_path = outdir / f"{sp}.{dbname}.o6.txt"
+        if manifiesto_especie(outdir, sp).al_dia(f"diamond_{dbname}", huella_diamond(fa, db), [out_path]):
+            print(f"[ALREADY DONE] {sp} vs {dbname}")
+        else:
+            pendientes.append((sp, fa))
+    if not pendientes:
+        return True
+
+    batch_dir = outdir / "_batch"
+    batch_dir.mkdir(parents=True, exist_ok=True)
+    query = batch_dir / f"batch.{dbname}.query.faa"
+    hits = batch_dir / f"batch.{dbname}.o6.txt"
+    etiquetas = escribir_query_lote(pendientes, query)
+
+    print(f"[RUN ] LOTE de {len(pendientes)} especies vs {dbname} → {hits}")
+    # reutilizamos run_diamond con una "especie" ficticia para el lote
+    hits.unlink(missing_ok=True)
+    if not run_diamond("batch", str(query), db, batch_dir, threads=threads):
+        return False
+
+    repartir_hits_lote(hits, etiquetas, db, outdir)
+    for sp, fa in pendientes:
+        manifiesto_especie(outdir, sp).registrar(
+            f"diamond_{dbname}", huella_diamond(fa, db), [outdir / f"{sp}.{dbname}.o6.txt"])
+    print(f"[DONE] LOTE vs {dbname}: {', '.join(sp for sp, _ in pendientes)}")
+    query.unlink(missing_ok=True)
+    hits.unlink(missing_ok=True)
+    return True
+
+
+def ids_con_hit(o6_path: Path):
+    """Conjunto de queries (columna 1) que aparecen en una tabla outfmt 6."""
+    ids = set()
+    with o6_path.open(encoding="utf-8") as f:
+        for line in f:
+            qseqid = line.split("\t", 1)[0].strip()
+            if qseqid:
+                ids.add(qseqid)
+    return ids
+
+
+def fasta_residual(species: str, fasta: str, outdir: Path):
+    """
+    Cascada SwissProt → TrEMBL: escribe {especie}.{db1}.nohit.faa con las
+    proteínas sin hit en la salida de DB1 y guarda el recuento en
+    {especie}.cascada.tsv. Devuelve la ruta del FASTA residual.
+    """
+    db1name = Path(DB1).stem
+    sprot_tsv = outdir / f"{species}.{db1name}.o6.txt"
+    residual = outdir / f"{species}.{db1name}.nohit.faa"
+    stats_path = outdir / f"{species}.cascada.tsv"
+
+    manifiesto = manifiesto_especie(outdir, species)
+    huella = huella_paso(entradas={"fasta": fasta, "sprot": sprot_tsv})
+    if manifiesto.al_dia("cascada", huella, [residual, stats_path]):
+        print(f"[ALREADY DONE] Residual de {species} sin hit en {db1name} → {residual}")
+        return residual
+
+    con_hit = ids_con_hit(sprot_tsv)
+    total = quedan = 0
+    tmp = residual.with_name(residual.name + ".tmp")
+    with open(fasta, encoding="utf-8") as fa, tmp.open("w", encoding="utf-8") as out:
+        escribir = False
+        for line in fa:
+            if line.startswith(">"):
+                total += 1
+                prot = line[1:].split(maxsplit=1)[0] if line[1:].strip() else ""
+                escribir = prot not in con_hit
+                quedan += escribir
+            if escribir:
+                out.write(line)
+    tmp.replace(residual)
+
+    with stats_path.open("w", encoding="utf-8") as st:
+        st.write("especie\tproteinas\tcon_hit_" + db1name + "\tenviadas_" + Path(DB2).stem + "\n")
+        st.write(f"{species}\t{total}\t{total - quedan}\t{quedan}\n")
+    manifiesto.registrar("cascada", huella, [residual, stats_path])
+    print(f"[INFO] Cascada {species}: {total} proteínas, {total - quedan} resueltas en {db1name}, "
+          f"{quedan} pasan a {Path(DB2).stem}")
+    return residual
+
+
+def write_ahrd_yaml(tmp_yaml_path: Path,
+                    proteins_fasta: Path,
+                    go_gaf: Path,
+                    out_file: Path,
+                    sprot_tsv: Path,
+                    trembl_tsv: Path,
+                    uniprot_sprot_fa: Path,
+                    uniprot_trembl_fa: Path,
+                    blacklist: Path,
+                    filter_sprot: Path,
+                    filter_trembl: Path,
+                    token_blacklist: Path):
+    """Crea YAML temporal de AHRD (mismos pesos que en el bash)."""
+    yaml_text = f"""proteins_fasta: {proteins_fasta}
+token_score_bit_score_weight: 0.468
+token_score_database_score_weight: 0.2098
+token_score_overlap_score_weight: 0.3221
+gene_ontology_result: {go_gaf}
+reference_go_regex: '^UniProtKB\\t(?<shortAccession>[^\\t]+)\\t[^\\t]+\\t(?!NOT\\|)[^\\t]*\\t(?<goTerm>GO:\\d+)'
+prefer_reference_with_go_annos: true
+output: {out_file}
+blast_dbs:
+  swissprot:
+    weight: 653
+    description_score_bit_score_weight: 2.717061
+    file: {sprot_tsv}
+    database: {uniprot_sprot_fa}
+    blacklist: {blacklist}
+    filter: {filter_sprot}
+    token_blacklist: {token_blacklist}
+
+  trembl:
+    weight: 904
+    description_score_bit_score_weight: 2.590211
+    file: {trembl_tsv}
+    database: {uniprot_trembl_fa}
+    blacklist: {blacklist}
+    filter: {filter_trembl}
+    token_blacklist: {token_blacklist}
+"""
+    tmp_yaml_path.write_text(yaml_text)
+
+def run_ahrd(ahrd_jar: Path, yaml_path: Path, xmx: str = "2g", especie=None, entradas=(), salidas=(),
+             n_proteinas=None):
+    """java -Xmx<xmx> -jar ahrd.jar tmp.yml (el RSS máximo de la JVM queda en el informe)"""
+    if not ahrd_jar.exists():
+        raise FileNotFoundError(f"No se encuentra AHRD JAR: {ahrd_jar}")
+    if not yaml_path.exists():
+        raise FileNotFoundError(f"No se encuentra YAML de AHRD: {yaml_path}")
+    cmd = ["java", f"-Xmx{xmx}", "-jar", str(ahrd_jar), str(yaml_path)]
+    print(">> Ejecutando AHRD:", " ".join(cmd))
+    ejecutar(cmd, "ahrd", especie, entradas=entradas, salidas=salidas, n_proteinas=n_proteinas,
+             extra={"xmx": xmx}, recursos=replace(RECURSOS_AHRD, mem_gb=memoria_gb(xmx) + MARGEN_JVM_GB))
+
+def leer_especies(tsv_path: Path):
+    """Lee el TSV (especie<TAB>ruta_fasta) y devuelve [(especie, fasta)] válidos."""
+    especies = []
+    with tsv_path.open(encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            # Espera: especie<TAB>ruta_fasta
+            parts = line.split("\t")
+            if len(parts) < 2:
+                print(f"[WARN] Línea ignorada (formato esperado: especie<TAB>fasta): {line}")
+                continue
+
+            species, fasta = parts[0].strip(), parts[1].strip()
+
+            if not species or not fasta:
+                print(f"[WARN] Falta especie o fasta en la línea: {line}")
+                continue
+
+            if not Path(fasta).exists() or Path(fasta).stat().st_size == 0:
+                print(f"[WARN] FASTA no existe o está vacío para {species}: {fasta}")
+                continue
+
+            especies.append((species, fasta))
+    return especies
+
+
+def recursos_diamond(threads) -> Recursos:
+    """RECURSOS_DIAMOND con sus hilos; en local, memoria en proporción a los hilos."""
+    mem_gb = RECURSOS_DIAMOND.mem_gb
+    ejecutor = ejecutor_actual()
+    if isinstance(ejecutor, EjecutorLocal):
+        mem_gb = min(mem_gb, ejecutor.mem_gb * int(threads) / ejecutor.cpus)
+    return replace(RECURSOS_DIAMOND, cpus=int(threads), mem_gb=mem_gb)
+
+
+def threads_por_trabajo(total, n_trabajos: int) -> int:
+    """Reparte el presupuesto global de hilos entre n trabajos simultáneos."""
+    return max(1, int(total) // max(1, n_trabajos))
+
+
+def diamond_db2(species: str, fasta: str, outdir: Path, threads=THREADS):
+    """DIAMOND contra DB2 (con CASCADA_SPROT, sólo las proteínas sin hit en DB1)."""
+    if CASCADA_SPROT:
+        # si todo se resolvió en SwissProt el residual está vacío y
+        # run_diamond deja una tabla vacía pero válida para AHRD
+        fasta = str(fasta_residual(species, fasta, outdir))
+    return buscar_diamond(species, fasta, DB2, outdir, threads=threads)
+
+
+def diamond_especie(species: str, fasta: str, outdir: Path, threads=THREADS):
+    """DIAMOND contra las dos bases. Devuelve True si ambas salidas existen."""
+    ok1 = buscar_diamond(species, fasta, DB1, outdir, threads=threads)
+    if CASCADA_SPROT and not ok1:
+        return False
+    ok2 = diamond_db2(species, fasta, outdir, threads=threads)
+    return ok1 and ok2
+
+
+def gaf_especie(species: str, outdir: Path) -> Path:
+    return outdir / f"{species}.goa_subset.gaf"
+
+
+def huella_gaf(species: str, outdir: Path) -> str:
+    return huella_paso(
+        entradas={"sprot": outdir / f"{species}.{Path(DB1).stem}.o6.txt",
+                  "trembl": outdir / f"{species}.{Path(DB2).stem}.o6.txt"},
+        bases={"gaf": GO_GAF},
+    )
+
+
+def preparar_gaf(especies, outdir: Path):
+    """
+    Subconjunto del GAF para cada especie con sus tablas DIAMOND hechas y el
+    subconjunto pendiente o desfasado. Todas ellas comparten una única lectura
+    de GO_GAF.
+    """
+    grupos, pendientes = {}, []
+    for species, _ in especies:
+        tablas = [outdir / f"{species}.{Path(db).stem}.o6.txt" for db in (DB1, DB2)]
+        if not all(t.exists() for t in tablas):
+            continue
+        huella = huella_gaf(species, outdir)
+        if manifiesto_especie(outdir, species).al_dia("gaf_subset", huella, [gaf_especie(species, outdir)]):
+            continue
+        grupos[gaf_especie(species, outdir)] = accesiones_hits(tablas)
+        pendientes.append((species, huella))
+    if not grupos:
+        return
+
+    print(f"[RUN ] Subconjunto de {GO_GAF} para {len(grupos)} especies "
+          f"({sum(len(a) for a in grupos.values())} accesiones)")
+    cuentas = subconjuntos_gaf(GO_GAF, grupos)
+    for species, huella in pendientes:
+        destino = gaf_especie(species, outdir)
+        manifiesto_especie(outdir, species).registrar("gaf_subset", huella, [destino])
+        print(f"[DONE] {destino} ({cuentas[destino]} anotaciones)")
+
+
+def referencias_especie(species: str, outdir: Path):
+    """
+    FASTAs de referencia de AHRD con sólo los sujetos con hit de la especie
+    en SwissProt y TrEMBL. Devuelve (sprot_ref, trembl_ref).
+    """
+    pares = [
+        (outdir / f"{species}.{Path(DB1).stem}.o6.txt", UNIPROT_SPROT, outdir / f"{species}.sprot_ref.fasta"),
+        (outdir / f"{species}.{Path(DB2).stem}.o6.txt", UNIPROT_TREMBL, outdir / f"{species}.trembl_ref.fasta"),
+    ]
+    manifiesto = manifiesto_especie(outdir, species)
+    huella = huella_paso(
+        entradas={"sprot": pares[0][0], "trembl": pares[1][0]},
+        bases={"sprot_fa": UNIPROT_SPROT, "trembl_fa": UNIPROT_TREMBL},
+    )
+    salidas = [ref for _, _, ref in pares]
+    if manifiesto.al_dia("referencias", huella, salidas):
+        return tuple(salidas)
+
+    for tabla, uniprot, ref in pares:
+        encontradas, ausentes = IndiceFasta(uniprot, INDICES_UNIPROT).extraer(accesiones_hits([tabla]), ref)
+        print(f"[DONE] {ref.name}: {encontradas} secuencias de {Path(uniprot).name}"
+              + (f" ({ausentes} accesiones sin registro)" if ausentes else ""))
+    manifiesto.registrar("referencias", huella, salidas)
+    return tuple(salidas)
+
+
+def ahrd_especie(species: str, fasta: str, outdir: Path):
+    """YAML temporal de AHRD + ejecución a partir de las salidas de DIAMOND (False si faltan)."""
+    inicio = time.perf_counter()
+    # Reconstruimos rutas de salidas DIAMOND que ya generaste:
+    sprot_tsv = outdir / f"{species}.{Path(DB1).stem}.o6.txt"
+    trembl_tsv = outdir / f"{species}.{Path(DB2).stem}.o6.txt"
+
+    if not sprot_tsv.exists() or not trembl_tsv.exists():
+        print(f"[WARN] No encuentro TSVs de DIAMOND para {species}. Saltando post-proceso.")
+        return False
+
+    ahrd_out = outdir / f"{species}.proteins.funct_ahrd.tsv"
+    ahrd_tmp = ruta_temporal(ahrd_out)  # AHRD escribe aquí; se publica al acabar bien
+
+    go_gaf = Path(GO_GAF)
+    if SUBCONJUNTO_GAF:
+        preparar_gaf([(species, fasta)], outdir)  # no lee el GAF si ya está al día
+        go_gaf = gaf_especie(species, outdir)
+
+    sprot_fa, trembl_fa = Path(UNIPROT_SPROT), Path(UNIPROT_TREMBL)
+    if REFERENCIAS_RECORTADAS:
+        sprot_fa, trembl_fa = referencias_especie(species, outdir)
+
+    with NamedTemporaryFile("w", delete=False, suffix=".yml", dir=str(outdir)) as tmp:
+        yaml_path = Path(tmp.name)
+
+    write_ahrd_yaml(
+        tmp_yaml_path=yaml_path,
+        proteins_fasta=Path(fasta),  # usa el FASTA que ya estabas usando
+        go_gaf=go_gaf,
+        out_file=ahrd_tmp,
+        sprot_tsv=sprot_tsv,
+        trembl_tsv=trembl_tsv,
+        uniprot_sprot_fa=sprot_fa,
+        uniprot_trembl_fa=trembl_fa,
+        blacklist=Path(BLACKLIST),
+        filter_sprot=Path(FILTER_SPROT),
+        filter_trembl=Path(FILTER_TREMBL),
+        token_blacklist=Path(TOKEN_BLACKLIST),
+    )
+
+    # huella: tablas de hits + FASTA, ficheros de referencia y la propia
+    # configuración de AHRD (pesos, regex) sin la ruta temporal de salida
+    manifiesto = manifiesto_especie(outdir, species)
+    entradas = {"fasta": fasta, "sprot": sprot_tsv, "trembl": trembl_tsv}
+    if SUBCONJUNTO_GAF:
+        entradas["gaf"] = go_gaf
+    if REFERENCIAS_RECORTADAS:
+        entradas.update({"sprot_fa": sprot_fa, "trembl_fa": trembl_fa})
+    huella = huella_paso(
+        entradas=entradas,
+        bases={"jar": AHRD_JAR, "gaf": GO_GAF, "sprot_fa": UNIPROT_SPROT, "trembl_fa": UNIPROT_TREMBL,
+               "blacklist": BLACKLIST, "filter_sprot": FILTER_SPROT, "filter_trembl": FILTER_TREMBL,
+               "token_blacklist": TOKEN_BLACKLIST},
+        parametros={"yaml": yaml_path.read_text().replace(str(ahrd_tmp), "OUTPUT")},
+    )
+
+    try:
+        if manifiesto.al_dia("ahrd", huella, [ahrd_out]):
+            saltado("ahrd", species, time.perf_counter() - inicio, [ahrd_out])
+            print(f"[INFO] AHRD already exists → {ahrd_out}")
+            return True
+
+        print(f"[INFO] Ejecutando AHRD ({species})…")
+        run_ahrd(Path(AHRD_JAR), yaml_path, xmx=JAVA_XMX, especie=species,
+                 entradas=[fasta, sprot_tsv, trembl_tsv, go_gaf, sprot_fa, trembl_fa], salidas=[ahrd_tmp],
+                 n_proteinas=contar_secuencias(fasta))
+        publicar(ahrd_tmp, ahrd_out)
+        manifiesto.registrar("ahrd", huella, [ahrd_out])
+        print(f"[DONE] AHRD → {ahrd_out}")
+        return True
+    finally:
+        # Limpieza del YAML temporal y de salidas a medias
+        try:
+            yaml_path.unlink(missing_ok=True)
+            ahrd_tmp.unlink(missing_ok=True)
+        except Exception:
+            pass
+
+
+def mapear_go_especie(species: str, fasta: str, outdir: Path, almacen: AlmacenGO):
+    """GO de los sujetos con hit en DB1 y DB2 para cada proteína del FASTA."""
+    tablas = [outdir / f"{species}.{Path(db).stem}.o6.txt" for db in (DB1, DB2)]
+    if not all(t.exists() for t in tablas):
+        print(f"[WARN] No encuentro TSVs de DIAMOND para {species}. Sin mapeo GO.")
+        return
+    out_path = outdir / f"{species}.diamond_go.tsv"
+    manifiesto = manifiesto_especie(outdir, species)
+    huella = huella_paso(
+        entradas={"fasta": fasta, "sprot": tablas[0], "trembl": tablas[1]},
+        bases={"gaf": GO_GAF},
+        parametros={"solo_mejor": MAPEO_GO_SOLO_MEJOR},
+    )
+    if manifiesto.al_dia("mapeo_go", huella, [out_path]):
+        print(f"[ALREADY DONE] GO de {species} → {out_path}")
+        return
+    anotaciones = almacen.anotar_tablas(tablas, solo_mejor=MAPEO_GO_SOLO_MEJOR)
+    escribir_anotacion(anotaciones, out_path, proteinas=[prot for prot, _ in leer_fasta(fasta)])
+    manifiesto.registrar("mapeo_go", huella, [out_path])
+    print(f"[DONE] GO de {species}: {sum(1 for g in anotaciones.values() if g)} proteínas con GO → {out_path}")
+
+
+def planificar_especies(especies, outdir: Path,
+                        max_paralelo: int = MAX_ESPECIES_PARALELO,
+                        max_ahrd: int = MAX_AHRD_PARALELO,
+                        antes_de_ahrd=None):
+    """
+    Ejecuta varias especies a la vez:
+      - hasta max_paralelo DIAMOND simultáneos, repartiendo THREADS entre ellos;
+      - AHRD en un pool aparte, de modo que el AHRD de la especie N se solapa
+        con el DIAMOND de la especie N+1.
+    Con antes_de_ahrd (función que recibe [(especie, fasta)] con DIAMOND hecho)
+    los AHRD esperan a que terminen todos los DIAMOND y a esa función.
+    Devuelve {especie: True/False} según haya terminado AHRD sin errores.
+    """
+    max_paralelo = max(1, min(max_paralelo, len(especies)))
+    threads = threads_por_trabajo(THREADS, max_paralelo)
+    print(f"[INFO] {len(especies)} especies; {max_paralelo} DIAMOND en paralelo x {threads} hilos")
+
+    estado = {}
+    with ThreadPoolExecutor(max_workers=max_paralelo) as pool_diamond, \
+         ThreadPoolExecutor(max_workers=max(1, max_ahrd)) as pool_ahrd:
+        futuros = {
+            pool_diamond.submit(diamond_especie, species, fasta, outdir, threads): (species, fasta)
+            for species, fasta in especies
+        }
+        futuros_ahrd, diamond_hecho = {}, []
+        for fut in as_completed(futuros):
+            species, fasta = futuros[fut]
+            try:
+                ok = fut.result()
+            except Exception as e:
+                print(f"[FAIL] DIAMOND {species}. Detalle: {e}")
+                ok = False
+            if not ok:
+                estado[species] = False
+            elif antes_de_ahrd is not None:
+                diamond_hecho.append((species, fasta))
+            else:
+                futuros_ahrd[pool_ahrd.submit(ahrd_especie, species, fasta, outdir)] = species
+
+        if antes_de_ahrd is not None and diamond_hecho:
+            antes_de_ahrd(diamond_hecho)
+            for species, fasta in diamond_hecho:
+                futuros_ahrd[pool_ahrd.submit(ahrd_especie, species, fasta, outdir)] = species
+
+        for fut in as_completed(futuros_ahrd):
+            species = futuros_ahrd[fut]
+            try:
+                estado[species] = fut.result()
+            except Exception as e:
+                print(f"[FAIL] AHRD {species}. Detalle: {e}")
+                estado[species] = False
+    return estado
+
+def limpiar_fasta(species: str, fasta: str, clean_dir: Path):
+    """Versión normalizada del FASTA de una especie ({especie}.nodots.faa)."""
+    clean_fasta = clean_dir / f"{species}.nodots.faa"
+    manifiesto = manifiesto_especie(clean_dir, species)
+    huella = huella_paso(entradas={"fasta": fasta}, parametros={"min_len": MIN_LEN, "max_len": MAX_LEN})
+    if manifiesto.al_dia("normalizar", huella, [clean_fasta]):
+        print(f"[ALREADY DONE] FASTA normalizado de {species} → {clean_fasta}")
+    else:
+        escritas, descartadas = normalizar_fasta(fasta, clean_fasta, min_len=MIN_LEN, max_len=MAX_LEN)
+        manifiesto.registrar("normalizar", huella, [clean_fasta])
+        print(f"[DONE] FASTA normalizado de {species}: {escritas} secuencias, "
+              f"{descartadas} descartadas por longitud → {clean_fasta}")
+    return clean_fasta
+
+
+def salidas_especie(species: str, outdir: Path):
+    """Salidas finales de una especie: DIAMOND DB1, DIAMOND DB2, AHRD y mapeo GO."""
+    return [
+        outdir / f"{species}.{Path(DB1).stem}.o6.txt",
+        outdir / f"{species}.{Path(DB2).stem}.o6.txt",
+        outdir / f"{species}.proteins.funct_ahrd.tsv",
+        outdir / f"{species}.diamond_go.tsv",
+    ]
+
+
+def preparar_dedup(especies, dedup_dir: Path):
+    """
+    Deduplica el FASTA de cada especie en dedup_dir (sólo si el FASTA cambió).
+    Devuelve la lista [(especie, fasta_unico)] sobre la que se lanzará el pipeline.
+    """
+    trabajo = []
+    for species, fasta in especies:
+        unique_fasta = dedup_dir / f"{species}.uniq.faa"
+        mapa = dedup_dir / f"{species}.dedup.tsv"
+        manifiesto = manifiesto_especie(dedup_dir, species)
+        huella = huella_paso(entradas={"fasta": fasta})
+        if not manifiesto.al_dia("dedup", huella, [unique_fasta, mapa]):
+            deduplicar_fasta(fasta, unique_fasta, mapa)
+            manifiesto.registrar("dedup", huella, [unique_fasta, mapa])
+        trabajo.append((species, str(unique_fasta)))
+    return trabajo
+
+
+def expandir_dedup(especies, outdir: Path, dedup_dir: Path):
+    """Re-expande las salidas calculadas sobre representantes a todos los IDs."""
+    for species, _ in especies:
+        mapa = dedup_dir / f"{species}.dedup.tsv"
+        manifiesto = manifiesto_especie(outdir, species)
+        for final in salidas_especie(species, outdir):
+            parcial = dedup_dir / final.name
+            if not parcial.exists():
+                continue
+            huella = huella_paso(entradas={"parcial": parcial, "mapa": mapa})
+            if manifiesto.al_dia(f"expandir_{final.name}", huella, [final]):
+                continue
+            expandir_tabla(parcial, final, mapa)
+            manifiesto.registrar(f"expandir_{final.name}", huella, [final])
+            print(f"[DONE] Expandido {parcial.name} → {final}")
+
+# =============================================================================
+def main():
+    outdir = Path(OUTDIR)
+    outdir.mkdir(parents=True, exist_ok=True)
+
+    tsv_path = Path(TSV)
+    if not tsv_path.exists():
+        print(f"[ERROR] No encuentro el TSV: {tsv_path}")
+        return
+
+    if not Path(DB1).exists() or not Path(DB2).exists():
+        print(f"[ERROR] Revisa que existan DB1 y DB2:\n  DB1={DB1}\n  DB2={DB2}")
+        return
+
+    especies = leer_especies(tsv_path)
+
+    # Eliminar los puntos de los archivos de proteinas (en OUTDIR/_clean)
+    if NORMALIZAR_FASTA:
+        especies = [(sp, str(limpiar_fasta(sp, fa, outdir / "_clean"))) for sp, fa in especies]
+
+    # Con DEDUP_SECUENCIAS se trabaja sobre representantes en OUTDIR/_dedup
+    workdir = outdir
+    if DEDUP_SECUENCIAS:
+        workdir = outdir / "_dedup"
+        especies = preparar_dedup(especies, workdir)
+
+    # Nodo auxiliar: sólo shards pendientes (el nodo principal une y lanza AHRD)
+    if "--shard-worker" in sys.argv[1:]:
+        if SHARDS > 1 and USAR_CACHE_DIAMOND:
+            print("[WARN] --shard-worker no sirve con USAR_CACHE_DIAMOND: los fallos de caché se parten en el nodo principal")
+        elif SHARDS > 1:
+            trabajar_shards_especies(especies, workdir)
+        else:
+            print("[WARN] --shard-worker necesita SHARDS > 1")
+        return
+
+    # Modo lote: cada base se carga una vez para todas las especies pendientes
+    if BATCH_DIAMOND:
+        run_diamond_batch(especies, DB1, workdir)
+        especies_db2 = especies
+        if CASCADA_SPROT:
+            especies_db2 = [(sp, str(fasta_residual(sp, fa, workdir))) for sp, fa in especies
+                            if (workdir / f"{sp}.{Path(DB1).stem}.o6.txt").exists()]
+        run_diamond_batch(especies_db2, DB2, workdir)
+
+    # DIAMOND (DB1, DB2) y AHRD de varias especies a la vez. Con SUBCONJUNTO_GAF
+    # se hace primero todo DIAMOND para poder recortar el GAF de todas las
+    # especies en una sola pasada antes de los AHRD
+    gaf = (lambda hechas: preparar_gaf(hechas, workdir)) if SUBCONJUNTO_GAF else None
+    planificar_especies(especies, workdir, antes_de_ahrd=gaf)
+
+    if MAPEO_GO:
+        almacen = AlmacenGO(ALMACEN_GO, gaf=GO_GAF)
+        try:
+            for species, fasta in especies:
+                mapear_go_especie(species, fasta, workdir, almacen)
+        finally:
+            almacen.close()
+
+    if DEDUP_SECUENCIAS:
+        expandir_dedup(especies, outdir, workdir)
+
+    print("\nTodo terminado. ✔")
+
+if __name__ == "__main__":
+    main()
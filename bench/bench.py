@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark sin conexión de los scripts de anotación.
+
+Uso:
+1) Edita la sección CONFIG de abajo (escenarios, latencias de las herramientas).
+2) Ejecuta:  python bench/bench.py
+3) Para cada escenario (nº de especies x proteínas por especie) se generan
+   TSVs y FASTAs sintéticos en WORKDIR y se ejecutan de principio a fin
+     annotation_with_diamond.main, FANTASIA4.main, annotation_FANTASIA.main
+     y analysis.main
+   con ejecutables de pega (bench/fake_tools: diamond, java -jar ahrd.jar,
+   GoPredSim, fantasia_pipeline.py) que escriben salidas con la forma real y
+   tardan lo que se les diga. Con EJECUTOR = "lotes" los pasos van además
+   a una cola de pega (bench/fake_tools: sbatch, squeue, scancel). Cada pipeline se ejecuta dos veces: en frío y
+   en caliente (todo hecho: mide el coste de comprobar y saltar pasos).
+4) Los tiempos y el rendimiento (proteínas/s, especies/min) se añaden a
+   RESULTADOS (JSON lines) para seguir mejoras y regresiones entre commits;
+   la salida de cada ejecución queda en WORKDIR/<escenario>/<pipeline>.log y
+   el informe por paso en WORKDIR/<escenario>/informe_ejecucion.jsonl
+   (python instrumentation.py <informe> para ver el resumen).
+"""
+
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+FAKES = Path(__file__).resolve().parent / "fake_tools"
+sys.path.insert(0, str(RAIZ))
+
+import executor  # noqa: E402
+import instrumentation  # noqa: E402
+
+
+# ========================= CONFIGURACIÓN =====================================
+WORKDIR = Path("/tmp/lab_scripts_bench")
+RESULTADOS = Path(__file__).resolve().parent / "resultados.jsonl"
+ESCENARIOS = [(2, 500), (8, 2000)]   # (nº de especies, proteínas por especie)
+SEMILLA = 1
+PIPELINES = ["annotation_with_diamond", "FANTASIA4", "annotation_FANTASIA", "analysis"]
+REPETICIONES = ["fria", "caliente"]
+DEVICES = ["cuda:0", "cuda:1"]      # dispositivos ficticios para FANTASIA4 / GoPredSim
+FANTASIA4_LOTE = False              # FANTASIA4 con un worker persistente por dispositivo
+EJECUTOR = "local"                  # "lotes": cada paso es un trabajo de la cola de pega
+COLA_ESPERA = 0.0                   # segundos que pasa cada trabajo en la cola de pega antes de arrancar
+
+# latencia de cada herramienta de pega: (segundos fijos, segundos por 1000 proteínas)
+LATENCIAS = {
+    "diamond": (0.3, 0.05),
+    "ahrd": (0.5, 0.02),
+    "fantasia": (1.0, 0.10),
+    "gen": (0.1, 0.0),
+    "gopredsim": (1.0, 0.10),
+    "topgo": (0.1, 0.0),
+}
+# =============================================================================
+
+AMINOACIDOS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def nombre_especie(i: int) -> str:
+    """Bench_xyz: nombres distintos también en el prefijo de GoPredSim (Bexyz)."""
+    letras = ""
+    for _ in range(3):
+        i, r = divmod(i, 26)
+        letras = chr(ord("a") + r) + letras
+    return f"Bench_{letras}"
+
+
+def generar_datos(base: Path, n_especies: int, n_proteinas: int, rng: random.Random):
+    """
+    FASTAs con longitudes realistas (log-normal, mediana ~330 aa), algún
+    '*' final y '.' internos (para la limpieza) y un 5 % de secuencias
+    repetidas. Devuelve la ruta del TSV especie<TAB>fasta.
+    """
+    fastas = base / "fastas"
+    fastas.mkdir(parents=True, exist_ok=True)
+    tsv = base / "species.tsv"
+    with tsv.open("w", encoding="utf-8") as t:
+        for i in range(n_especies):
+            species = nombre_especie(i)
+            fasta = fastas / f"{species}.faa"
+            anteriores = []
+            with fasta.open("w", encoding="utf-8") as f:
+                for j in range(n_proteinas):
+                    if anteriores and rng.random() < 0.05:
+                        seq = rng.choice(anteriores)
+                    else:
+                        largo = min(5000, max(30, int(rng.lognormvariate(5.8, 0.6))))
+                        seq = "M" + "".join(rng.choice(AMINOACIDOS) for _ in range(largo - 1))
+                        if rng.random() < 0.02:
+                            seq = seq[:largo // 2] + "." + seq[largo // 2:]
+                        if rng.random() < 0.3:
+                            seq += "*"
+                        anteriores.append(seq)
+                    f.write(f">{species}_{j:06d} synthetic protein {j}\n")
+                    for k in range(0, len(seq), 60):
+                        f.write(seq[k:k + 60] + "\n")
+            t.write(f"{species}\t{fasta}\n")
+    return tsv
+
+
+def preparar_recursos(base: Path):
+    """Ficheros que los scripts comprueban que existen (bases, jar, lookup)."""
+    recursos = base / "recursos"
+    recursos.mkdir(parents=True, exist_ok=True)
+    for nombre in ("uniprot_sprot_bench.dmnd", "uniprot_trembl_bench.dmnd", "ahrd.jar",
+                   "lookup_table.npz", "annotations.json", "accessions.json"):
+        (recursos / nombre).touch()
+    return recursos
+
+
+def configurar(modulo: str, base: Path, tsv: Path, recursos: Path):
+    """Importa el script y apunta su CONFIG al escenario; devuelve el módulo."""
+    import importlib
+    m = importlib.import_module(modulo)
+    if modulo == "annotation_with_diamond":
+        m.TSV = str(tsv)
+        m.OUTDIR = str(base / "diamond")
+        m.DB1 = str(recursos / "uniprot_sprot_bench.dmnd")
+        m.DB2 = str(recursos / "uniprot_trembl_bench.dmnd")
+        m.AHRD_JAR = str(recursos / "ahrd.jar")
+    elif modulo == "FANTASIA4":
+        m.TSV = str(tsv)
+        m.OUTDIR = base / "fantasia4"
+        m.FANTASIA4 = str(FAKES / "fantasia_pipeline.py")
+        m.LOOKUP = str(recursos / "lookup_table.npz")
+        m.ANN = str(recursos / "annotations.json")
+        m.ACC = str(recursos / "accessions.json")
+        m.DEVICES = list(DEVICES)
+        m.MODO_LOTE = FANTASIA4_LOTE
+    elif modulo == "annotation_FANTASIA":
+        m.TSV = str(tsv)
+        m.OUTDIR = base / "gopredsim"
+        m.GENERATE_GPSM = str(FAKES / "generate_gopredsim_input_files.sh")
+        m.LAUNCH_GPSM = str(FAKES / "launch_gopredsim_pipeline.sh")
+        m.TOPGO = str(FAKES / "convert_topgo_format.py")
+        m.DEVICES = list(DEVICES)
+    elif modulo == "analysis":
+        # homología (AHRD) frente a FANTASIA4 de las mismas especies
+        fof = base / "fof_analisis.tsv"
+        with fof.open("w", encoding="utf-8") as f, tsv.open(encoding="utf-8") as t:
+            for line in t:
+                species = line.split("\t")[0]
+                f.write(f"{species}\t{base / 'diamond' / f'{species}.proteins.funct_ahrd.tsv'}"
+                        f"\t{base / 'fantasia4' / species / 'fantasia4_run' / 'outputs' / 'fantasia_topgo.tsv'}\n")
+        m.TSV = str(fof)
+        m.OUTFILE = base / "comparative_table.tsv"
+    return m
+
+
+@contextmanager
+def salida_a(log_path: Path):
+    """Redirige stdout/stderr (también de los procesos hijos) a un log."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    guardados = os.dup(1), os.dup(2)
+    with log_path.open("ab") as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(guardados[0], 1)
+            os.dup2(guardados[1], 2)
+            os.close(guardados[0])
+            os.close(guardados[1])
+
+
+def commit_actual() -> str:
+    try:
+        return subprocess.run(["git", "-C", str(RAIZ), "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True).stdout.strip() or "?"
+    except OSError:
+        return "?"
+
+
+def entorno_bench():
+    os.environ["PATH"] = f"{FAKES}{os.pathsep}{os.environ.get('PATH', '')}"
+    os.environ["MPLBACKEND"] = "Agg"  # el Venn de analysis.py sin ventana
+    os.environ.pop("FANTASIA_DEVICES", None)
+    for herramienta, (fija, por_mil) in LATENCIAS.items():
+        os.environ[f"BENCH_LAT_{herramienta.upper()}"] = f"{fija},{por_mil}"
+    os.environ["COLA_FALSA_ESPERA"] = str(COLA_ESPERA)
+
+
+# =============================================================================
+def main():
+    entorno_bench()
+    rng = random.Random(SEMILLA)
+    commit = commit_actual()
+    filas = []
+
+    for n_especies, n_proteinas in ESCENARIOS:
+        base = WORKDIR / f"{n_especies}x{n_proteinas}"
+        shutil.rmtree(base, ignore_errors=True)
+        base.mkdir(parents=True)
+        tsv = generar_datos(base, n_especies, n_proteinas, rng)
+        recursos = preparar_recursos(base)
+        instrumentation.INFORME = base / "informe_ejecucion.jsonl"
+        if EJECUTOR == "lotes":
+            os.environ["COLA_FALSA_DIR"] = str(base / "cola")
+            executor.usar(executor.EjecutorLotes(directorio=base / "trabajos", intervalo=0.2))
+        else:
+            executor.usar(EJECUTOR)
+        total_proteinas = n_especies * n_proteinas
+
+        for modulo in PIPELINES:
+            try:
+                m = configurar(modulo, base, tsv, recursos)
+            except ImportError as e:
+                print(f"[WARN] {modulo} no se puede importar aquí ({e}); se salta")
+                continue
+            for repeticion in REPETICIONES:
+                log = base / f"{modulo}.log"
+                inicio = time.perf_counter()
+                error = None
+                with salida_a(log):
+                    try:
+                        m.main()
+                    except Exception as e:
+                        error = f"{type(e).__name__}: {e}"
+                segundos = time.perf_counter() - inicio
+                fila = {
+                    "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    "commit": commit,
+                    "pipeline": modulo,
+                    "repeticion": repeticion,
+                    "especies": n_especies,
+                    "proteinas_por_especie": n_proteinas,
+                    "segundos": round(segundos, 3),
+                    "proteinas_por_s": round(total_proteinas / segundos, 1) if segundos else None,
+                    "especies_por_min": round(60 * n_especies / segundos, 2) if segundos else None,
+                    "latencias": LATENCIAS,
+                    "ejecutor": EJECUTOR,
+                    "error": error,
+                }
+                filas.append(fila)
+                with RESULTADOS.open("a", encoding="utf-8") as r:
+                    r.write(json.dumps(fila, ensure_ascii=False) + "\n")
+                estado = "[FAIL]" if error else "[DONE]"
+                print(f"{estado} {n_especies:>3} x {n_proteinas:<6} {modulo:<24} {repeticion:<8} "
+                      f"{segundos:8.2f} s  {fila['proteinas_por_s']:>10} prot/s"
+                      + (f"  ({error})" if error else ""))
+
+    print(f"\nResultados añadidos a {RESULTADOS}")
+
+
+if __name__ == "__main__":
+    main()
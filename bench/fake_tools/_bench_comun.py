@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+"""
+Utilidades compartidas por los ejecutables de pega del benchmark: latencia
+configurable, lectura mínima de FASTA y GO sintéticos deterministas (los
+mismos para una secuencia dada en AHRD y en FANTASIA, para que haya solape).
+"""
+
+import os
+import time
+import zlib
+
+N_GO = 5000  # tamaño del vocabulario GO sintético
+_arrancadas = set()  # herramientas que ya pagaron el arranque en este proceso
+
+
+def dormir(herramienta: str, n_proteinas: int = 0):
+    """
+    Simula el coste de la herramienta: BENCH_LAT_<HERRAMIENTA>="fija,por_mil"
+    (segundos fijos + segundos por cada 1000 proteínas). La parte fija es el
+    arranque (importaciones, carga del modelo): un worker persistente que
+    ejecuta la herramienta varias veces sólo la paga la primera.
+    """
+    texto = os.environ.get(f"BENCH_LAT_{herramienta.upper()}", "0,0")
+    fija, por_mil = (float(x) for x in texto.split(","))
+    if herramienta in _arrancadas:
+        fija = 0.0
+    _arrancadas.add(herramienta)
+    time.sleep(fija + por_mil * n_proteinas / 1000)
+
+
+def leer_fasta(path):
+    """[(id, secuencia)] de un FASTA (el id es la primera palabra)."""
+    registros, actual = [], None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith(">"):
+                actual = [line[1:].split()[0] if line[1:].split() else "", []]
+                registros.append(actual)
+            elif actual is not None:
+                actual[1].append(line.strip())
+    return [(prot, "".join(trozos)) for prot, trozos in registros]
+
+
+def semilla(texto: str) -> int:
+    return zlib.crc32(texto.encode("utf-8"))
+
+
+def gos_sinteticos(seq: str, n: int, desplazamiento: int = 0):
+    """n términos GO deterministas para una secuencia; con distinto desplazamiento solapan en parte."""
+    base = semilla(seq)
+    return [f"GO:{(base + 7919 * (i + desplazamiento)) % N_GO:07d}" for i in range(n)]
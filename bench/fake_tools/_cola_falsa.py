@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""
+Gestor de colas de pega para probar executor.EjecutorLotes sin clúster:
+sbatch, squeue y scancel de este directorio sólo ejecutan el script en esta
+máquina y guardan el estado de cada trabajo en ficheros de COLA_FALSA_DIR
+({id}.estado: PENDING, RUNNING, COMPLETED, FAILED o CANCELLED; {id}.pid).
+COLA_FALSA_ESPERA="s" simula s segundos en cola antes de arrancar.
+"""
+
+import fcntl
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+DIRECTORIO = Path(os.environ.get("COLA_FALSA_DIR", "/tmp/cola_falsa"))
+ACTIVOS = ("PENDING", "RUNNING")
+
+
+def _fichero(trabajo: str, tipo: str) -> Path:
+    return DIRECTORIO / f"{trabajo}.{tipo}"
+
+
+def leer_estado(trabajo: str):
+    try:
+        return _fichero(trabajo, "estado").read_text().strip()
+    except OSError:
+        return None
+
+
+def escribir_estado(trabajo: str, estado: str):
+    tmp = _fichero(trabajo, f"estado.tmp{os.getpid()}")
+    tmp.write_text(estado + "\n")
+    os.replace(tmp, _fichero(trabajo, "estado"))
+
+
+def nuevo_id() -> str:
+    DIRECTORIO.mkdir(parents=True, exist_ok=True)
+    with open(DIRECTORIO / "contador", "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        n = int(f.read().strip() or 0) + 1
+        f.seek(0)
+        f.truncate()
+        f.write(str(n))
+    return str(n)
+
+
+def salida_del_script(script: str, trabajo: str) -> str:
+    """Ruta de #SBATCH --output (slurm-<id>.out si no la hay)."""
+    with open(script, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#SBATCH --output="):
+                return line.split("=", 1)[1].strip()
+    return f"slurm-{trabajo}.out"
+
+
+def enviar(script: str) -> str:
+    """sbatch: registra el trabajo y lo arranca desacoplado; devuelve su id."""
+    trabajo = nuevo_id()
+    escribir_estado(trabajo, "PENDING")
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), trabajo, script,
+                      salida_del_script(script, trabajo)],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+    return trabajo
+
+
+def correr(trabajo: str, script: str, salida: str):
+    """Proceso que hace de nodo: espera en cola, ejecuta el script y anota cómo acabó."""
+    time.sleep(float(os.environ.get("COLA_FALSA_ESPERA", "0")))
+    if leer_estado(trabajo) != "PENDING":
+        return  # cancelado en cola
+    _fichero(trabajo, "pid").write_text(str(os.getpid()))  # líder de sesión: pid = grupo
+    escribir_estado(trabajo, "RUNNING")
+    with open(salida, "ab") as log:
+        proc = subprocess.Popen(["bash", script], stdout=log, stderr=subprocess.STDOUT)
+        codigo = proc.wait()
+    if leer_estado(trabajo) == "RUNNING":
+        escribir_estado(trabajo, "COMPLETED" if codigo == 0 else "FAILED")
+
+
+def cancelar(trabajo: str):
+    """scancel: marca el trabajo y termina su grupo de procesos si está en marcha."""
+    if leer_estado(trabajo) not in ACTIVOS:
+        return
+    escribir_estado(trabajo, "CANCELLED")
+    try:
+        pid = int(_fichero(trabajo, "pid").read_text())
+        os.killpg(pid, signal.SIGTERM)
+    except (OSError, ValueError):
+        pass
+
+
+if __name__ == "__main__":
+    # proceso "nodo" lanzado por enviar: _cola_falsa.py id script salida
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(143))
+    correr(*sys.argv[1:4])
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""convert_topgo_format.py de pega: -a DIR_PROTT5 -o SALIDA -p PREFIJO."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _bench_comun import dormir
+
+args = sys.argv[1:]
+entrada = args[args.index("-a") + 1]
+salida = args[args.index("-o") + 1]
+
+gos = {}
+for nombre in sorted(os.listdir(entrada)):
+    with open(os.path.join(entrada, nombre)) as f:
+        for line in f:
+            prot, go, _ = line.rstrip("\n").split("\t")
+            gos.setdefault(prot, []).append(go)
+dormir("topgo", len(gos))
+with open(salida, "w") as out:
+    for prot, terminos in gos.items():
+        out.write(f"{prot}\t{', '.join(terminos)}\n")
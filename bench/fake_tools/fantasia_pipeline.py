@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""fantasia_pipeline.py de pega: escribe outputs/ en el directorio actual."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _bench_comun import dormir, leer_fasta, gos_sinteticos, semilla
+
+fasta = sys.argv[1]
+device = sys.argv[sys.argv.index("--device") + 1] if "--device" in sys.argv else "cpu"
+for opcion in ("--lookup-npz", "--annotations-json", "--accessions-json"):
+    assert opcion in sys.argv, f"falta {opcion}"
+
+registros = leer_fasta(fasta)
+if "--embeddings-npy" in sys.argv:
+    # embeddings precalculados (almacén de FANTASIA4): sólo la búsqueda en la lookup
+    ids = sys.argv[sys.argv.index("--embeddings-npy") + 1][:-len(".npy")] + ".ids.txt"
+    with open(ids) as f:
+        assert [l.strip() for l in f] == [p for p, _ in registros], "embeddings desalineados con el FASTA"
+    dormir("fantasia", 0)
+else:
+    dormir("fantasia", len(registros))
+os.makedirs("outputs", exist_ok=True)
+with open("outputs/fantasia_topgo.tsv", "w") as out:
+    for prot, seq in registros:
+        out.write(f"{prot}\t{', '.join(gos_sinteticos(seq, 2 + semilla(seq) % 9, desplazamiento=2))}\n")
+with open("outputs/run_info.txt", "w") as out:
+    out.write(f"device\t{device}\nproteinas\t{len(registros)}\n")
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""generate_gopredsim_input_files.sh de pega: --infile X --outpath Y --prott5 --prefix P."""
+
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _bench_comun import dormir, leer_fasta
+
+args = sys.argv[1:]
+infile = args[args.index("--infile") + 1]
+outpath = args[args.index("--outpath") + 1]
+prefix = args[args.index("--prefix") + 1]
+
+dormir("gen", len(leer_fasta(infile)))
+stem = os.path.splitext(os.path.basename(infile))[0]
+shutil.copy(infile, os.path.join(os.path.dirname(infile), f"{stem}_cdhit100.pep"))
+shutil.copy(infile, os.path.join(outpath, f"{prefix}_input.fasta"))
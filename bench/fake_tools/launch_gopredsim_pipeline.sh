@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""launch_gopredsim_pipeline.sh de pega: -c RUN -x PREFIJO -m prott5 -o RUN."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _bench_comun import dormir, leer_fasta, gos_sinteticos, semilla
+
+args = sys.argv[1:]
+run = args[args.index("-c") + 1]
+prefix = args[args.index("-x") + 1]
+out = args[args.index("-o") + 1]
+
+registros = leer_fasta(os.path.join(run, f"{prefix}_input.fasta"))
+print(f"GoPredSim (benchmark) {prefix}: {len(registros)} proteínas, CUDA={os.environ.get('CUDA_VISIBLE_DEVICES', '')}")
+dormir("gopredsim", len(registros))
+destino = os.path.join(out, f"{prefix}_prott5")
+os.makedirs(destino, exist_ok=True)
+with open(os.path.join(destino, "gopredsim_prott5_1_bpo.txt"), "w") as f:
+    for prot, seq in registros:
+        for go in gos_sinteticos(seq, 1 + semilla(seq) % 7, desplazamiento=3):
+            f.write(f"{prot}\t{go}\t0.{semilla(prot + go) % 100:02d}\n")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Ejecutor mínimo de un DAG de tareas con dos pools de recursos:
+  - CPU: número de núcleos; cada tarea declara cuántos ocupa;
+  - GPU: lista de dispositivos; una tarea GPU recibe uno en exclusiva.
+
+Las tareas independientes se lanzan a la vez en cuanto tienen sus
+dependencias hechas y recursos libres, de modo que el tiempo total se acerca
+a max(trabajo CPU, trabajo GPU) en lugar de a su suma. Si una tarea falla,
+sus dependientes se saltan y el resto del grafo sigue.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Callable
+
+
+@dataclass
+class Tarea:
+    nombre: str
+    funcion: Callable[..., None]  # funcion(device) si gpu, funcion() si no
+    deps: list = field(default_factory=list)
+    cpus: int = 1
+    gpu: bool = False
+
+
+def ejecutar_dag(tareas, cpus: int, gpus=()):
+    """
+    Ejecuta la lista de Tareas respetando dependencias y recursos.
+    Devuelve {nombre: "ok" | "fail" | "skip"} y el tiempo de cada tarea.
+    """
+    por_nombre = {t.nombre: t for t in tareas}
+    for t in tareas:
+        for d in t.deps:
+            if d not in por_nombre:
+                raise ValueError(f"La tarea {t.nombre} depende de {d}, que no existe")
+        if t.gpu and not gpus:
+            raise ValueError(f"La tarea {t.nombre} necesita GPU y no hay dispositivos")
+
+    estado, tiempos = {}, {}
+    pendientes = list(tareas)
+    cpus_libres = int(cpus)
+    gpus_libres = list(gpus)
+    en_marcha = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, len(tareas))) as ex:
+        while pendientes or en_marcha:
+            # se saltan las tareas cuyas dependencias fallaron
+            for t in list(pendientes):
+                if any(estado.get(d) in ("fail", "skip") for d in t.deps):
+                    print(f"[SKIP] {t.nombre}: falló una dependencia")
+                    estado[t.nombre] = "skip"
+                    pendientes.remove(t)
+
+            # las GPU primero: suelen ser el camino crítico
+            listas = [t for t in pendientes if all(estado.get(d) == "ok" for d in t.deps)]
+            listas.sort(key=lambda t: not t.gpu)
+            for t in listas:
+                necesita = min(t.cpus, int(cpus))  # una tarea nunca pide más que el total
+                if necesita > cpus_libres or (t.gpu and not gpus_libres):
+                    continue
+                cpus_libres -= necesita
+                device = gpus_libres.pop(0) if t.gpu else None
+                args = (device,) if t.gpu else ()
+                print(f"[RUN ] {t.nombre}" + (f" en {device}" if device else "") + f" ({necesita} cpu)")
+                fut = ex.submit(t.funcion, *args)
+                en_marcha[fut] = (t, necesita, device, time.time())
+                pendientes.remove(t)
+
+            if not en_marcha:
+                if pendientes:
+                    # nada en marcha y nada lanzable: dependencias imposibles
+                    for t in pendientes:
+                        estado[t.nombre] = "skip"
+                    break
+                continue
+
+            hechos, _ = wait(list(en_marcha), return_when=FIRST_COMPLETED)
+            for fut in hechos:
+                t, necesita, device, inicio = en_marcha.pop(fut)
+                cpus_libres += necesita
+                if device is not None:
+                    gpus_libres.append(device)
+                tiempos[t.nombre] = time.time() - inicio
+                try:
+                    fut.result()
+                    estado[t.nombre] = "ok"
+                    print(f"[DONE] {t.nombre} ({tiempos[t.nombre]:.1f} s)")
+                except Exception as e:
+                    estado[t.nombre] = "fail"
+                    print(f"[FAIL] {t.nombre}. Detalle: {e}")
+    return estado, tiempos
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Pool de dispositivos (GPUs y, opcionalmente, workers CPU) para los pasos de
+embeddings. Cada especie en marcha recibe un dispositivo en exclusiva; el
+resto espera en cola. Los proteomas pequeños pueden ir a un worker "cpu" si
+queda alguno libre antes que una GPU.
+
+Los dispositivos son simples cadenas ("cuda:0", "cuda:1", "cpu"), así que se
+puede probar sin GPU con una lista ficticia y un ejecutable de pega.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+
+def leer_dispositivos(por_defecto, variable: str = "FANTASIA_DEVICES"):
+    """Lista de dispositivos: variable de entorno "cuda:0,cuda:1" o la de CONFIG."""
+    texto = os.environ.get(variable, "")
+    if texto.strip():
+        return [d.strip() for d in texto.split(",") if d.strip()]
+    return list(por_defecto)
+
+
+def entorno_dispositivo(device: str) -> str:
+    """Asignación CUDA_VISIBLE_DEVICES para un dispositivo ("cpu" → ninguna GPU)."""
+    if device.startswith("cuda:"):
+        return f"CUDA_VISIBLE_DEVICES={device.split(':', 1)[1]}"
+    return "CUDA_VISIBLE_DEVICES="
+
+
+class PoolDispositivos:
+    """
+    Reparte dispositivos en exclusiva entre hilos.
+      - gpus: lista de dispositivos GPU ("cuda:N");
+      - cpu_workers: número de plazas "cpu" adicionales;
+      - cpu_max_seqs: sólo los proteomas con <= cpu_max_seqs secuencias
+        pueden ir a una plaza cpu (0 = nunca).
+    """
+
+    def __init__(self, gpus, cpu_workers: int = 0, cpu_max_seqs: int = 0):
+        self.libres_gpu = list(gpus)
+        self.n_gpus = len(self.libres_gpu)
+        self.libres_cpu = ["cpu"] * int(cpu_workers)
+        self.n_cpu = len(self.libres_cpu)
+        self.cpu_max_seqs = int(cpu_max_seqs)
+        self.cond = threading.Condition()
+        if not self.libres_gpu and not self.libres_cpu:
+            raise ValueError("El pool de dispositivos está vacío")
+
+    @property
+    def capacidad(self) -> int:
+        """Número total de dispositivos (trabajos simultáneos posibles)."""
+        return self.n_gpus + self.n_cpu
+
+    def _puede_cpu(self, n_seqs) -> bool:
+        if self.n_gpus == 0:
+            return True  # pool sólo-CPU: todo va a cpu
+        return n_seqs is not None and 0 < self.cpu_max_seqs and n_seqs <= self.cpu_max_seqs
+
+    def adquirir(self, n_seqs=None) -> str:
+        """Bloquea hasta que haya un dispositivo adecuado y lo devuelve."""
+        with self.cond:
+            while True:
+                if self.libres_gpu:
+                    return self.libres_gpu.pop(0)
+                if self.libres_cpu and self._puede_cpu(n_seqs):
+                    return self.libres_cpu.pop()
+                self.cond.wait()
+
+    def liberar(self, device: str):
+        with self.cond:
+            if device == "cpu":
+                self.libres_cpu.append(device)
+            else:
+                self.libres_gpu.append(device)
+            self.cond.notify_all()
+
+    @contextmanager
+    def reservar(self, n_seqs=None):
+        device = self.adquirir(n_seqs)
+        try:
+            yield device
+        finally:
+            self.liberar(device)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Caché persistente de hits de DIAMOND direccionada por contenido.
+
+Clave: (huella de la secuencia, identidad del .dmnd, parámetros de búsqueda).
+Así, las secuencias idénticas entre versiones de ensamblaje o cultivares no se
+vuelven a buscar: sólo se lanza DIAMOND con las que no están en la caché y
+luego se reconstruye el .o6.txt completo con los IDs de la ejecución actual.
+
+Se guarda en un SQLite (un único fichero, seguro con varios procesos) y se
+recorta por tamaño expulsando las entradas usadas hace más tiempo (LRU).
+"""
+
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+
+
+def identidad_db(db: str) -> str:
+    """Identidad de un .dmnd: ruta absoluta + tamaño + mtime."""
+    p = Path(db).resolve()
+    st = p.stat()
+    return f"{p}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def espacio_cache(db: str, *params) -> str:
+    """Espacio de claves para una base y un juego de parámetros de búsqueda."""
+    texto = "\t".join([identidad_db(db)] + [str(x) for x in params])
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+
+class CacheDiamond:
+    """Caché de hits por (espacio, huella de secuencia) en un fichero SQLite."""
+
+    def __init__(self, path, max_bytes: int):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self.con = sqlite3.connect(str(self.path), timeout=120)
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS hits ("
+            " espacio TEXT NOT NULL, digest TEXT NOT NULL, lineas TEXT NOT NULL,"
+            " bytes INTEGER NOT NULL, usado REAL NOT NULL,"
+            " PRIMARY KEY (espacio, digest))"
+        )
+        self.con.execute("CREATE INDEX IF NOT EXISTS hits_usado ON hits(usado)")
+        self.con.commit()
+
+    def close(self):
+        self.con.close()
+
+    def buscar(self, espacio: str, digests):
+        """Devuelve {digest: [líneas sin qseqid]} de las huellas presentes."""
+        encontrados = {}
+        digests = list(digests)
+        ahora = time.time()
+        for i in range(0, len(digests), 500):
+            trozo = digests[i:i + 500]
+            marcas = ",".join("?" * len(trozo))
+            filas = self.con.execute(
+                f"SELECT digest, lineas FROM hits WHERE espacio=? AND digest IN ({marcas})",
+                [espacio] + trozo,
+            ).fetchall()
+            for digest, lineas in filas:
+                encontrados[digest] = lineas.split("\n") if lineas else []
+            self.con.executemany(
+                "UPDATE hits SET usado=? WHERE espacio=? AND digest=?",
+                [(ahora, espacio, d) for d, _ in filas],
+            )
+        self.con.commit()
+        return encontrados
+
+    def guardar(self, espacio: str, hits_por_digest: dict):
+        """Guarda {digest: [líneas sin qseqid]} (lista vacía = sin hits)."""
+        ahora = time.time()
+        filas = []
+        for digest, lineas in hits_por_digest.items():
+            texto = "\n".join(lineas)
+            filas.append((espacio, digest, texto, len(texto) + len(digest) + 64, ahora))
+        self.con.executemany(
+            "INSERT OR REPLACE INTO hits (espacio, digest, lineas, bytes, usado) VALUES (?,?,?,?,?)",
+            filas,
+        )
+        self.con.commit()
+        self.recortar()
+
+    def tamano(self) -> int:
+        return self.con.execute("SELECT COALESCE(SUM(bytes), 0) FROM hits").fetchone()[0]
+
+    def recortar(self):
+        """Expulsa las entradas menos usadas hasta quedar por debajo de max_bytes."""
+        total = self.tamano()
+        if total <= self.max_bytes:
+            return 0
+        sobrante = total - int(self.max_bytes * 0.9)  # margen para no recortar en cada guardado
+        borrados, liberado = [], 0
+        for espacio, digest, b in self.con.execute(
+                "SELECT espacio, digest, bytes FROM hits ORDER BY usado ASC"):
+            borrados.append((espacio, digest))
+            liberado += b
+            if liberado >= sobrante:
+                break
+        self.con.executemany("DELETE FROM hits WHERE espacio=? AND digest=?", borrados)
+        self.con.commit()
+        self.con.execute("VACUUM")
+        print(f"[INFO] Caché DIAMOND recortada: {len(borrados)} entradas, {liberado / 1e6:.1f} MB")
+        return len(borrados)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Almacén persistente de embeddings por secuencia (ProtT5 u otro modelo).
+
+Un embedding sólo depende de la secuencia y del modelo, así que se guarda por
+(modelo, huella de la secuencia): al cambiar la lookup o el umbral de
+distancia, o al repetir una especie con pocas proteínas nuevas, sólo se
+calculan las secuencias que no están. Si están todas, no hace falta GPU.
+
+En disco (directorio del almacén):
+  indice.sqlite     modelos (dim, dtype, fichero, filas) y entradas
+                    (modelo, digest) → fila, con bytes y último uso (LRU)
+  {modelo}.emb      matriz cruda filas x dim, ampliable por el final y leída
+                    con np.memmap (sin cargarla)
+Al superar max_bytes se expulsan las entradas usadas hace más tiempo; sus
+filas quedan libres y se reutilizan en los siguientes guardados, así que el
+fichero no crece por encima del máximo alcanzado.
+
+La función de embedding es intercambiable (EMBEBEDORES): "prott5" usa
+transformers/torch en el dispositivo indicado y "prueba" es una composición
+de aminoácidos en CPU para probar sin GPU ni modelo. Para que FANTASIA use
+estos embeddings en lugar de calcularlos, su pipeline tiene que estar
+parcheado para leerlos (ver OPCION_EMBEDDINGS en FANTASIA4.py) y calcularlos
+igual que el Embebedor elegido.
+"""
+
+import hashlib
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from fasta_utils import digest_secuencia
+from length_batching import agrupar_por_longitud
+from manifest import ruta_temporal, publicar
+
+LOTE = 32  # secuencias por llamada a la función de embedding
+MODELO_PROTT5 = "Rostlab/prot_t5_xl_half_uniref50-enc"
+AMINOACIDOS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+# funciones de embedding =======================================================
+@dataclass(frozen=True)
+class Embebedor:
+    """Modelo (identificador de la caché), dimensión y función (secuencias, device) → array n x dim."""
+    modelo: str
+    dim: int
+    funcion: Callable
+
+
+def embeber_prueba(secuencias, device: str = "cpu"):
+    """Composición de aminoácidos (20 dimensiones): determinista y barata."""
+    matriz = np.zeros((len(secuencias), len(AMINOACIDOS)), dtype=np.float32)
+    for i, seq in enumerate(secuencias):
+        seq = seq.upper()
+        for j, aa in enumerate(AMINOACIDOS):
+            matriz[i, j] = seq.count(aa)
+        matriz[i] /= max(1, len(seq))
+    return matriz
+
+
+_modelos = {}
+
+
+def embeber_prott5(secuencias, device: str = "cuda:0"):
+    """
+    Embedding por proteína de ProtT5: media de los residuos (sin el token
+    final). Sólo es intercambiable con el del pipeline si éste usa el mismo
+    modelo, precisión y pooling.
+    """
+    import torch
+    from transformers import T5EncoderModel, T5Tokenizer
+
+    if device not in _modelos:
+        tokenizer = T5Tokenizer.from_pretrained(MODELO_PROTT5, do_lower_case=False)
+        modelo = T5EncoderModel.from_pretrained(MODELO_PROTT5).to(device).eval()
+        if device == "cpu":
+            modelo = modelo.float()
+        _modelos[device] = (tokenizer, modelo)
+    tokenizer, modelo = _modelos[device]
+
+    textos = [" ".join(seq.upper().translate(str.maketrans("UZOB", "XXXX"))) for seq in secuencias]
+    lote = tokenizer(textos, add_special_tokens=True, padding="longest", return_tensors="pt")
+    with torch.no_grad():
+        salida = modelo(input_ids=lote["input_ids"].to(device),
+                        attention_mask=lote["attention_mask"].to(device)).last_hidden_state
+    matriz = np.zeros((len(secuencias), salida.shape[-1]), dtype=np.float32)
+    for i, seq in enumerate(secuencias):
+        matriz[i] = salida[i, :len(seq)].float().mean(dim=0).cpu().numpy()
+    return matriz
+
+
+EMBEBEDORES = {
+    "prott5": Embebedor(MODELO_PROTT5, 1024, embeber_prott5),
+    "prueba": Embebedor("composicion_aa_v1", len(AMINOACIDOS), embeber_prueba),
+}
+
+
+# almacén ======================================================================
+class CacheEmbeddings:
+    """Embeddings de un modelo por huella de secuencia (índice SQLite + matriz mapeada)."""
+
+    def __init__(self, directorio, modelo: str, dim: int, max_bytes: int, dtype: str = "float32"):
+        self.dir = Path(directorio)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.modelo, self.dim, self.dtype = modelo, int(dim), np.dtype(dtype)
+        self.max_bytes = int(max_bytes)
+        self.bytes_fila = self.dim * self.dtype.itemsize
+        # autocommit: las transacciones se abren a mano (BEGIN / BEGIN IMMEDIATE)
+        self.con = sqlite3.connect(str(self.dir / "indice.sqlite"), timeout=120, isolation_level=None)
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS modelos ("
+            " modelo TEXT PRIMARY KEY, dim INTEGER NOT NULL, dtype TEXT NOT NULL,"
+            " fichero TEXT NOT NULL, filas INTEGER NOT NULL)"
+        )
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS emb ("
+            " modelo TEXT NOT NULL, digest TEXT NOT NULL, fila INTEGER NOT NULL,"
+            " bytes INTEGER NOT NULL, usado REAL NOT NULL,"
+            " PRIMARY KEY (modelo, digest))"
+        )
+        self.con.execute("CREATE INDEX IF NOT EXISTS emb_usado ON emb(usado)")
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS libres (modelo TEXT NOT NULL, fila INTEGER NOT NULL,"
+            " PRIMARY KEY (modelo, fila))"
+        )
+        fichero = hashlib.sha1(modelo.encode("utf-8")).hexdigest()[:16] + ".emb"
+        self.con.execute("INSERT OR IGNORE INTO modelos VALUES (?,?,?,?,0)",
+                         (modelo, self.dim, self.dtype.str, fichero))
+        dim_guardada, dtype_guardado, fichero = self.con.execute(
+            "SELECT dim, dtype, fichero FROM modelos WHERE modelo=?", (modelo,)).fetchone()
+        if dim_guardada != self.dim or dtype_guardado != self.dtype.str:
+            raise ValueError(f"{modelo}: el almacén tiene dim={dim_guardada} dtype={dtype_guardado}, "
+                             f"no dim={self.dim} dtype={self.dtype.str}")
+        self.datos = self.dir / fichero
+
+    def close(self):
+        self.con.close()
+
+    def _matriz(self):
+        if not self.datos.exists():
+            return None
+        filas = self.datos.stat().st_size // self.bytes_fila
+        if filas == 0:
+            return None
+        return np.memmap(self.datos, dtype=self.dtype, mode="r", shape=(filas, self.dim))
+
+    def obtener(self, digests):
+        """{digest: vector} de las huellas presentes (copias; marca su uso)."""
+        digests = list(dict.fromkeys(digests))
+        encontrados = {}
+        # consulta y lectura en la misma transacción: ninguna expulsión puede
+        # reutilizar esas filas mientras tanto
+        self.con.execute("BEGIN")
+        try:
+            filas = {}
+            for i in range(0, len(digests), 500):
+                trozo = digests[i:i + 500]
+                marcas = ",".join("?" * len(trozo))
+                filas.update(self.con.execute(
+                    f"SELECT digest, fila FROM emb WHERE modelo=? AND digest IN ({marcas})",
+                    [self.modelo] + trozo).fetchall())
+            if filas:
+                matriz = self._matriz()
+                for digest, fila in filas.items():
+                    encontrados[digest] = np.array(matriz[fila])
+        finally:
+            self.con.execute("COMMIT")
+        if encontrados:
+            ahora = time.time()
+            self.con.execute("BEGIN IMMEDIATE")
+            self.con.executemany("UPDATE emb SET usado=? WHERE modelo=? AND digest=?",
+                                 [(ahora, self.modelo, d) for d in encontrados])
+            self.con.execute("COMMIT")
+        return encontrados
+
+    def presentes(self, digests) -> int:
+        """Cuántas de las huellas están en el almacén (sin leer los vectores)."""
+        digests = list(dict.fromkeys(digests))
+        n = 0
+        for i in range(0, len(digests), 500):
+            trozo = digests[i:i + 500]
+            marcas = ",".join("?" * len(trozo))
+            n += self.con.execute(f"SELECT COUNT(*) FROM emb WHERE modelo=? AND digest IN ({marcas})",
+                                  [self.modelo] + trozo).fetchone()[0]
+        return n
+
+    def guardar(self, vectores: dict):
+        """Guarda {digest: vector} en filas libres o al final de la matriz."""
+        if not vectores:
+            return
+        ahora = time.time()
+        self.con.execute("BEGIN IMMEDIATE")  # un único escritor: las filas no se pisan
+        try:
+            existentes, digests = set(), list(vectores)
+            for i in range(0, len(digests), 500):
+                trozo = digests[i:i + 500]
+                marcas = ",".join("?" * len(trozo))
+                existentes.update(d for d, in self.con.execute(
+                    f"SELECT digest FROM emb WHERE modelo=? AND digest IN ({marcas})", [self.modelo] + trozo))
+            nuevos = [(d, v) for d, v in vectores.items() if d not in existentes]
+            libres = [f for f, in self.con.execute(
+                "SELECT fila FROM libres WHERE modelo=? ORDER BY fila LIMIT ?", (self.modelo, len(nuevos)))]
+            filas = self.con.execute("SELECT filas FROM modelos WHERE modelo=?", (self.modelo,)).fetchone()[0]
+            asignadas = libres + list(range(filas, filas + len(nuevos) - len(libres)))
+            with open(self.datos, "r+b" if self.datos.exists() else "w+b") as f:
+                for (digest, vector), fila in zip(nuevos, asignadas):
+                    fila_bytes = np.ascontiguousarray(vector, dtype=self.dtype).reshape(self.dim).tobytes()
+                    f.seek(fila * self.bytes_fila)
+                    f.write(fila_bytes)
+            self.con.executemany("DELETE FROM libres WHERE modelo=? AND fila=?",
+                                 [(self.modelo, f) for f in libres])
+            self.con.execute("UPDATE modelos SET filas=? WHERE modelo=?",
+                             (max([filas] + [f + 1 for f in asignadas]), self.modelo))
+            self.con.executemany(
+                "INSERT INTO emb (modelo, digest, fila, bytes, usado) VALUES (?,?,?,?,?)",
+                [(self.modelo, d, f, self.bytes_fila + len(d) + 64, ahora)
+                 for (d, _), f in zip(nuevos, asignadas)])
+            self.con.execute("COMMIT")
+        except BaseException:
+            self.con.execute("ROLLBACK")
+            raise
+        self.recortar()
+
+    def tamano(self) -> int:
+        return self.con.execute("SELECT COALESCE(SUM(bytes), 0) FROM emb").fetchone()[0]
+
+    def recortar(self):
+        """Expulsa las entradas menos usadas (de cualquier modelo) hasta quedar por debajo de max_bytes."""
+        if self.tamano() <= self.max_bytes:
+            return 0
+        self.con.execute("BEGIN IMMEDIATE")
+        sobrante = self.tamano() - int(self.max_bytes * 0.9)  # margen para no recortar en cada guardado
+        borrados, liberado = [], 0
+        for modelo, digest, fila, b in self.con.execute(
+                "SELECT modelo, digest, fila, bytes FROM emb ORDER BY usado ASC"):
+            borrados.append((modelo, digest, fila))
+            liberado += b
+            if liberado >= sobrante:
+                break
+        self.con.executemany("DELETE FROM emb WHERE modelo=? AND digest=?", [(m, d) for m, d, _ in borrados])
+        self.con.executemany("INSERT OR IGNORE INTO libres VALUES (?,?)", [(m, f) for m, _, f in borrados])
+        self.con.execute("COMMIT")
+        print(f"[INFO] Caché de embeddings recortada: {len(borrados)} entradas, {liberado / 1e6:.1f} MB")
+        return len(borrados)
+
+    def embeddings(self, secuencias, embeber, device: str = "cpu", lote: int = LOTE, presupuesto_tokens=None):
+        """
+        Matriz len(secuencias) x dim en el orden dado. Sólo se llama a
+        `embeber` con las secuencias (únicas) que no están en el almacén, en
+        lotes de `lote` secuencias o, con presupuesto_tokens, agrupadas por
+        longitud sin pasar de ese número de tokens con relleno.
+        Devuelve (matriz, n calculadas).
+        """
+        digests = [digest_secuencia(s) for s in secuencias]
+        vectores = self.obtener(digests)
+        pendientes = {}
+        for digest, seq in zip(digests, secuencias):
+            if digest not in vectores:
+                pendientes.setdefault(digest, seq)
+        pendientes = list(pendientes.items())
+        if presupuesto_tokens:
+            grupos = agrupar_por_longitud([len(seq) for _, seq in pendientes], presupuesto_tokens)
+        else:
+            grupos = [range(i, min(i + lote, len(pendientes))) for i in range(0, len(pendientes), lote)]
+        for grupo in grupos:
+            trozo = [pendientes[i] for i in grupo]
+            calculados = embeber([seq for _, seq in trozo], device)
+            nuevos = {digest: calculados[j] for j, (digest, _) in enumerate(trozo)}
+            self.guardar(nuevos)
+            vectores.update(nuevos)
+        matriz = np.zeros((len(secuencias), self.dim), dtype=self.dtype)
+        for i, digest in enumerate(digests):
+            matriz[i] = vectores[digest]
+        return matriz, len(pendientes)
+
+
+def escribir_embeddings(ids, matriz, out_npy: Path):
+    """Matriz en .npy y los IDs (mismo orden, uno por línea) en .ids.txt al lado."""
+    out_npy = Path(out_npy)
+    tmp = ruta_temporal(out_npy)
+    with tmp.open("wb") as f:
+        np.save(f, matriz)
+    publicar(tmp, out_npy)
+    ids_path = out_npy.with_suffix(".ids.txt")
+    tmp = ruta_temporal(ids_path)
+    tmp.write_text("".join(f"{i}\n" for i in ids), encoding="utf-8")
+    publicar(tmp, ids_path)
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Dónde se ejecutan los pasos externos: en esta máquina o en la cola del clúster.
+
+instrumentation.ejecutar y supervisor.ejecutar_async (y con ellos DIAMOND,
+AHRD, FANTASIA, GoPredSim y TopGO) no lanzan el comando directamente sino a
+través del ejecutor activo, con los Recursos (cpus, memoria, gpus, horas)
+que declara cada paso:
+  - "local" (EjecutorLocal): proceso hijo en esta máquina, como siempre, pero
+    sólo cuando quedan núcleos y memoria libres para lo que pide el paso
+    (nunca más que el total de la máquina, así que un paso grande acaba
+    entrando solo);
+  - "lotes" (EjecutorLotes): un script por paso que se envía a un gestor de
+    colas tipo SLURM (sbatch / squeue / scancel). En el nodo el script
+    ejecuta `python executor.py --medir ...`, que corre el comando, mide su
+    CPU y RSS como instrumentation.esperar y deja el código de salida en
+    estado.json; el padre sondea ese fichero (y la cola, para los trabajos
+    que mueren sin escribirlo). DIR_TRABAJOS debe estar en un disco
+    compartido con los nodos.
+
+Con "lotes" cada hilo del script espera a su trabajo, así que el número de
+pasos en la cola a la vez lo siguen marcando MAX_ESPECIES_PARALELO, DEVICES,
+etc. Las GPU las asigna el gestor: FANTASIA_DEVICES="cuda:0,cuda:0,..."
+da N especies a la vez, cada una viendo su GPU como cuda:0.
+
+Configuración por variables de entorno (también se puede llamar a `usar`):
+    EJECUTOR=local|lotes, EJECUTOR_DIR, EJECUTOR_COLA, EJECUTOR_OPCIONES,
+    EJECUTOR_ENVIAR, EJECUTOR_CONSULTAR, EJECUTOR_CANCELAR, EJECUTOR_INTERVALO,
+    EJECUTOR_CPUS, EJECUTOR_MEM_GB
+"""
+
+import itertools
+import json
+import math
+import os
+import re
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from instrumentation import lanzar, esperar
+from manifest import ruta_temporal, publicar
+
+EJECUTOR = os.environ.get("EJECUTOR", "local")
+DIR_TRABAJOS = Path(os.environ.get("EJECUTOR_DIR", "trabajos_lotes"))  # scripts, logs y estado de cada trabajo
+COLA = os.environ.get("EJECUTOR_COLA", "")  # partición ("" = la de por defecto)
+OPCIONES = os.environ.get("EJECUTOR_OPCIONES", "")  # opciones #SBATCH adicionales, p.ej. "--account=lab"
+ENVIAR = os.environ.get("EJECUTOR_ENVIAR", "sbatch --parsable")
+CONSULTAR = os.environ.get("EJECUTOR_CONSULTAR", "squeue -h -o %T -j")
+CANCELAR = os.environ.get("EJECUTOR_CANCELAR", "scancel")
+INTERVALO = float(os.environ.get("EJECUTOR_INTERVALO", "30"))  # segundos entre sondeos
+ESPERA_ESTADO = 120  # segundos que se espera a estado.json cuando el trabajo ya no está en la cola (NFS lento)
+
+ESTADOS_FINALES = {"COMPLETED", "FAILED", "CANCELLED", "TIMEOUT", "OUT_OF_MEMORY", "NODE_FAIL",
+                   "PREEMPTED", "BOOT_FAIL", "DEADLINE"}
+VARIABLES_DEL_GESTOR = {"CUDA_VISIBLE_DEVICES"}  # las pone el gestor en el nodo según las gpus pedidas
+
+
+@dataclass(frozen=True)
+class Recursos:
+    """Lo que necesita un paso (en "lotes", lo que se pide al gestor)."""
+    cpus: int = 1
+    mem_gb: float = 4
+    gpus: int = 0
+    horas: float = 24
+
+
+def memoria_gb(texto: str) -> float:
+    """GB de una cantidad estilo -Xmx ("2g", "512m", "1t")."""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmgt]?)b?\s*", str(texto).lower())
+    if not m:
+        raise ValueError(f"Cantidad de memoria no reconocida: {texto}")
+    return float(m.group(1)) * {"k": 2 ** -20, "m": 2 ** -10, "": 1, "g": 1, "t": 2 ** 10}[m.group(2)]
+
+
+def _memoria_maquina_gb() -> float:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2 ** 30
+    except (ValueError, OSError):
+        return math.inf
+
+
+# local ========================================================================
+@dataclass
+class _TrabajoLocal:
+    proc: subprocess.Popen
+    inicio: float
+    reserva: tuple
+    grupo: bool
+
+
+class EjecutorLocal:
+    """Procesos hijos en esta máquina, limitados por núcleos y memoria."""
+
+    nombre = "local"
+
+    def __init__(self, cpus=None, mem_gb=None):
+        self.cpus = int(cpus or os.environ.get("EJECUTOR_CPUS") or os.cpu_count() or 1)
+        self.mem_gb = float(mem_gb or os.environ.get("EJECUTOR_MEM_GB") or _memoria_maquina_gb())
+        self.cpus_libres, self.mem_libre = self.cpus, self.mem_gb
+        self.cond = threading.Condition()
+
+    def _reservar(self, recursos: Recursos):
+        # un paso nunca pide más que el total: si no, no entraría nunca
+        cpus, mem = min(recursos.cpus, self.cpus), min(recursos.mem_gb, self.mem_gb)
+        with self.cond:
+            while cpus > self.cpus_libres or mem > self.mem_libre:
+                self.cond.wait()
+            self.cpus_libres -= cpus
+            self.mem_libre -= mem
+        return cpus, mem
+
+    def _liberar(self, reserva):
+        with self.cond:
+            self.cpus_libres += reserva[0]
+            self.mem_libre += reserva[1]
+            self.cond.notify_all()
+
+    def enviar(self, cmd, recursos: Recursos = None, nombre: str = "paso", **popen_kwargs):
+        """Lanza el comando en cuanto caben sus recursos (bloquea hasta entonces)."""
+        reserva = self._reservar(recursos or Recursos())
+        try:
+            proc, inicio = lanzar(cmd, **popen_kwargs)
+        except BaseException:
+            self._liberar(reserva)
+            raise
+        return _TrabajoLocal(proc, inicio, reserva, bool(popen_kwargs.get("start_new_session")))
+
+    def esperar(self, trabajo: _TrabajoLocal) -> dict:
+        try:
+            return esperar(trabajo.proc, trabajo.inicio)
+        finally:
+            self._liberar(trabajo.reserva)
+
+    def cancelar(self, trabajo: _TrabajoLocal):
+        try:
+            if trabajo.grupo:
+                os.killpg(trabajo.proc.pid, signal.SIGTERM)  # con sus hijos
+            else:
+                trabajo.proc.terminate()
+        except ProcessLookupError:
+            pass
+
+
+# cola de lotes ================================================================
+@dataclass
+class _TrabajoLotes:
+    id: str
+    nombre: str
+    directorio: Path
+    log: Path
+    inicio: float
+    cancelado: bool = False
+
+    @property
+    def estado(self) -> Path:
+        return self.directorio / "estado.json"
+
+
+class EjecutorLotes:
+    """
+    Un script por paso enviado a un gestor de colas. enviar/consultar/cancelar
+    son comandos (por defecto los de SLURM) a los que se añade el script o el
+    id del trabajo; el de pruebas está en bench/fake_tools (sbatch, squeue,
+    scancel de pega que ejecutan el script en local y escriben ficheros de estado).
+    """
+
+    nombre = "lotes"
+    _contador = itertools.count(1)
+
+    def __init__(self, directorio=None, cola=None, opciones=None, enviar=None, consultar=None,
+                 cancelar=None, intervalo=None):
+        self.directorio = Path(directorio or DIR_TRABAJOS).resolve()
+        self.cola = COLA if cola is None else cola
+        self.opciones = shlex.split(OPCIONES if opciones is None else opciones)
+        self.cmd_enviar = shlex.split(enviar or ENVIAR)
+        self.cmd_consultar = shlex.split(consultar or CONSULTAR)
+        self.cmd_cancelar = shlex.split(cancelar or CANCELAR)
+        self.intervalo = INTERVALO if intervalo is None else float(intervalo)
+
+    def _script(self, trabajo: _TrabajoLotes, cmd, recursos: Recursos, cwd, env, shell) -> str:
+        minutos = max(1, math.ceil(recursos.horas * 60))
+        lineas = ["#!/bin/bash",
+                  f"#SBATCH --job-name={trabajo.nombre}",
+                  f"#SBATCH --output={trabajo.log}",
+                  f"#SBATCH --cpus-per-task={recursos.cpus}",
+                  f"#SBATCH --mem={math.ceil(recursos.mem_gb * 1024)}M",
+                  f"#SBATCH --time={minutos // 60}:{minutos % 60:02d}:00"]
+        if recursos.gpus:
+            lineas.append(f"#SBATCH --gres=gpu:{recursos.gpus}")
+        if self.cola:
+            lineas.append(f"#SBATCH --partition={self.cola}")
+        lineas += [f"#SBATCH {opcion}" for opcion in self.opciones]
+        # el entorno del nodo es el del envío; sólo se añade lo que el paso cambia
+        for clave, valor in sorted((env or {}).items()):
+            if clave not in VARIABLES_DEL_GESTOR and os.environ.get(clave) != valor:
+                lineas.append(f"export {clave}={shlex.quote(valor)}")
+        runner = [sys.executable, str(Path(__file__).resolve()), "--medir", str(trabajo.estado),
+                  "--cwd", str(Path(cwd or ".").resolve())]
+        if shell:
+            runner += ["--shell", "--", cmd]
+        else:
+            runner += ["--"] + [str(c) for c in cmd]
+        lineas.append("exec " + " ".join(shlex.quote(str(a)) for a in runner))
+        return "\n".join(lineas) + "\n"
+
+    def enviar(self, cmd, recursos: Recursos = None, nombre: str = "paso", cwd=None, env=None,
+               shell=False, stdout=None, stderr=None, start_new_session=False):
+        """
+        Escribe el script del paso y lo envía; devuelve el trabajo. stdout puede
+        ser un fichero abierto (su ruta pasa a ser la salida del trabajo).
+        """
+        recursos = recursos or Recursos()
+        nombre = re.sub(r"[^\w.-]", "_", nombre)
+        directorio = self.directorio / f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self._contador)}-{nombre}"
+        directorio.mkdir(parents=True)
+        log = getattr(stdout, "name", None)
+        log = Path(log) if isinstance(log, str) else directorio / "salida.log"
+        trabajo = _TrabajoLotes("", nombre, directorio, log.resolve(), time.perf_counter())
+        script = directorio / "trabajo.sh"
+        script.write_text(self._script(trabajo, cmd, recursos, cwd, env, shell), encoding="utf-8")
+        res = subprocess.run(self.cmd_enviar + [str(script)], capture_output=True, text=True)
+        if res.returncode != 0:
+            raise OSError(f"No se pudo enviar {script}: {res.stderr.strip() or res.stdout.strip()}")
+        trabajo.id = res.stdout.strip().split(";")[0]  # sbatch --parsable: id[;cluster]
+        print(f"[INFO] {nombre} enviado a la cola (trabajo {trabajo.id}); log: {trabajo.log}")
+        return trabajo
+
+    def _leer_estado(self, trabajo: _TrabajoLotes):
+        try:
+            return json.loads(trabajo.estado.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _estado_cola(self, trabajo: _TrabajoLotes):
+        """Estado en la cola, None si ya no aparece, "?" si no se pudo consultar."""
+        try:
+            res = subprocess.run(self.cmd_consultar + [trabajo.id], capture_output=True, text=True, timeout=60)
+        except (OSError, subprocess.SubprocessError):
+            return "?"
+        if res.returncode != 0:
+            return "?"
+        lineas = [l.strip() for l in res.stdout.splitlines() if l.strip()]
+        return lineas[0] if lineas else None
+
+    def esperar(self, trabajo: _TrabajoLotes) -> dict:
+        """Sondea hasta que el trabajo deja estado.json (o desaparece de la cola sin dejarlo)."""
+        fuera_de_cola = None
+        while True:
+            medida = self._leer_estado(trabajo)
+            if medida is not None:
+                break
+            estado = "CANCELLED" if trabajo.cancelado else self._estado_cola(trabajo)
+            if estado is None or estado.split()[0] in ESTADOS_FINALES:
+                fuera_de_cola = fuera_de_cola or time.perf_counter()
+                if trabajo.cancelado or time.perf_counter() - fuera_de_cola > ESPERA_ESTADO:
+                    medida = {"codigo": -signal.SIGTERM if trabajo.cancelado else -1,
+                              "estado_cola": estado or "desaparecido"}
+                    break
+            time.sleep(self.intervalo)
+        total = time.perf_counter() - trabajo.inicio
+        medida.setdefault("segundos", total)
+        medida.update(ejecutor=self.nombre, trabajo=trabajo.id, segundos_cola=round(max(0.0, total - medida["segundos"]), 3))
+        if medida["codigo"] != 0:
+            print(f"[WARN] Trabajo {trabajo.id} ({trabajo.nombre}) terminó con código {medida['codigo']}; log: {trabajo.log}")
+        return medida
+
+    def cancelar(self, trabajo: _TrabajoLotes):
+        trabajo.cancelado = True
+        try:
+            subprocess.run(self.cmd_cancelar + [trabajo.id], capture_output=True, timeout=60)
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"[WARN] No se pudo cancelar el trabajo {trabajo.id}: {e}")
+
+
+# ejecutor activo ==============================================================
+_activo = None
+_cerrojo = threading.Lock()
+
+
+def crear(nombre: str):
+    if nombre == "local":
+        return EjecutorLocal()
+    if nombre == "lotes":
+        return EjecutorLotes()
+    raise ValueError(f"Ejecutor desconocido: {nombre} (local o lotes)")
+
+
+def ejecutor_actual():
+    """El ejecutor de este proceso (EJECUTOR, o el que se haya fijado con `usar`)."""
+    global _activo
+    with _cerrojo:
+        if _activo is None:
+            _activo = crear(EJECUTOR)
+        return _activo
+
+
+def usar(ejecutor):
+    """Fija el ejecutor ("local", "lotes" o una instancia); devuelve el anterior."""
+    global _activo
+    with _cerrojo:
+        anterior, _activo = _activo, crear(ejecutor) if isinstance(ejecutor, str) else ejecutor
+    return anterior
+
+
+# lado del nodo ================================================================
+def medir_en_nodo(estado: Path, cmd, cwd: str, shell: bool) -> int:
+    """Ejecuta el comando del trabajo y escribe su medida en `estado`; devuelve el código."""
+    try:
+        proc, inicio = lanzar(cmd, cwd=cwd, shell=shell)
+        medida = esperar(proc, inicio)
+    except OSError as e:
+        print(f"[FAIL] No se pudo lanzar {cmd}: {e}", file=sys.stderr)
+        medida = {"codigo": 127, "segundos": 0.0, "error": str(e)}
+    medida["host"] = socket.gethostname()
+    tmp = ruta_temporal(estado)
+    tmp.write_text(json.dumps(medida), encoding="utf-8")
+    publicar(tmp, estado)
+    return medida["codigo"]
+
+
+if __name__ == "__main__":
+    # python3 executor.py --medir estado.json --cwd DIR [--shell] -- cmd...
+    args = sys.argv[1:]
+    if len(args) < 6 or args[0] != "--medir" or args[2] != "--cwd" or "--" not in args:
+        print(__doc__)
+        sys.exit(2)
+    separador = args.index("--")
+    shell = "--shell" in args[4:separador]
+    cmd = args[separador + 1:]
+    codigo = medir_en_nodo(Path(args[1]), cmd[0] if shell else cmd, args[3], shell)
+    sys.exit(codigo if 0 <= codigo < 256 else 1)
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Forma precompilada y mapeable en memoria de los assets de FANTASIA
+(LOOKUP lookup_table.npz, ANN annotations.json, ACC accessions.json).
+
+El .npz comprimido se descomprime en memoria nueva en cada proceso y los JSON
+se convierten en dicts de Python: decenas de segundos y varios GB por
+proceso. Compilados una vez (por versión de los ficheros) a .npy sin
+comprimir, se abren con np.load(mmap_mode="r"): varios procesos comparten
+las mismas páginas de la caché del sistema y abrir los assets es inmediato.
+
+Formato en DESTINO (un prefijo por fichero fuente, su nombre sin extensión):
+  {pref}.{array}.npy            cada array del .npz, tal cual
+  JSON lista de cadenas         {pref}.valores.npy (S, UTF-8)
+  JSON lista de listas          {pref}.offsets.npy (u64, n+1) + ids.npy (u32) + vocab.npy
+  JSON {clave: [cadenas]}       {pref}.claves.npy (S, ordenadas) + offsets + ids + vocab
+  JSON {clave: cadena}          {pref}.claves.npy + ids.npy + vocab.npy
+  JSON {clave: número}          {pref}.claves.npy + valores.npy
+Las cadenas de las listas (términos GO…) se internan: vocab.npy guarda cada
+una una vez e ids.npy sus índices. assets.json guarda la identidad de cada
+fuente (ruta+tamaño+mtime) y se escribe el último.
+
+Lo que devuelve `cargar` para un JSON no es un list/dict sino una vista de
+sólo lectura (ListaCadenas y ListaInternada son Sequence, MapaInternado es
+Mapping): sirve para indexar, len, in, iterar y .get/.keys/.items/.values,
+que es todo lo que fantasia_pipeline.py debe hacer con la lookup. No sirve
+para isinstance(x, dict) o (x, list) (da False), json.dumps ni modificarla
+(ambos TypeError). Antes de activar FANTASIA4.ASSETS_COMPILADOS con otra
+versión del pipeline hay que comprobar que sólo los indexa;
+tests/test_fantasia_assets.py cubre esas operaciones a través del worker.
+
+Uso:
+    python fantasia_assets.py DESTINO lookup_table.npz annotations.json accessions.json
+"""
+
+import json
+import sys
+import time
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+
+import numpy as np
+
+from manifest import identidad_fichero, ruta_temporal, publicar
+
+VERSION_ASSETS = 1
+METADATOS = "assets.json"
+
+
+class NpzResidente(dict):
+    """Arrays de un .npz ya cargados (o mapeados), con la interfaz de NpzFile que se suele usar."""
+
+    @property
+    def files(self):
+        return list(self)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+# compilación ==================================================================
+def _cadenas(valores):
+    codificadas = [v.encode("utf-8") for v in valores]
+    return np.array(codificadas, dtype=f"S{max([1] + [len(c) for c in codificadas])}")
+
+
+def _guardar(array, path: Path):
+    tmp = ruta_temporal(path)
+    with tmp.open("wb") as f:
+        np.save(f, array)
+    publicar(tmp, path)
+
+
+def _internar(listas):
+    """(offsets u64, ids u32, vocab) de una secuencia de listas de cadenas."""
+    vocab, ids, offsets = {}, [], [0]
+    for lista in listas:
+        for termino in lista:
+            if not isinstance(termino, str):
+                raise ValueError(f"Valor no soportado en una lista: {termino!r}")
+            ids.append(vocab.setdefault(termino, len(vocab)))
+        offsets.append(len(ids))
+    return (np.array(offsets, dtype=np.uint64), np.array(ids, dtype=np.uint32),
+            _cadenas(sorted(vocab, key=vocab.get)))
+
+
+def _es_lista_cadenas(valores) -> bool:
+    return all(isinstance(v, str) for v in valores)
+
+
+def compilar_json(fuente, destino: Path, pref: str) -> str:
+    """Compila un JSON de los de FANTASIA; devuelve el tipo de estructura."""
+    with open(fuente, encoding="utf-8") as f:
+        datos = json.load(f)
+
+    if isinstance(datos, list):
+        if _es_lista_cadenas(datos):
+            _guardar(_cadenas(datos), destino / f"{pref}.valores.npy")
+            return "lista"
+        if all(isinstance(v, list) for v in datos):
+            offsets, ids, vocab = _internar(datos)
+            for nombre, array in (("offsets", offsets), ("ids", ids), ("vocab", vocab)):
+                _guardar(array, destino / f"{pref}.{nombre}.npy")
+            return "lista_listas"
+
+    elif isinstance(datos, dict):
+        claves = sorted(datos, key=lambda k: k.encode("utf-8"))
+        valores = [datos[k] for k in claves]
+        _guardar(_cadenas(claves), destino / f"{pref}.claves.npy")
+        if all(isinstance(v, list) for v in valores):
+            offsets, ids, vocab = _internar(valores)
+            for nombre, array in (("offsets", offsets), ("ids", ids), ("vocab", vocab)):
+                _guardar(array, destino / f"{pref}.{nombre}.npy")
+            return "mapa_listas"
+        if _es_lista_cadenas(valores):
+            offsets, ids, vocab = _internar([v] for v in valores)
+            _guardar(ids, destino / f"{pref}.ids.npy")
+            _guardar(vocab, destino / f"{pref}.vocab.npy")
+            return "mapa_cadenas"
+        if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in valores):
+            _guardar(np.array(valores), destino / f"{pref}.valores.npy")
+            return "mapa_numeros"
+
+    raise ValueError(f"Estructura de {fuente} no soportada para compilar")
+
+
+def compilar_npz(fuente, destino: Path, pref: str):
+    """Cada array del .npz a un .npy sin comprimir (de uno en uno: memoria = el mayor)."""
+    nombres = []
+    with np.load(fuente, allow_pickle=False) as npz:
+        for nombre in npz.files:
+            _guardar(npz[nombre], destino / f"{pref}.{nombre}.npy")
+            nombres.append(nombre)
+    return nombres
+
+
+def compilar_assets(fuentes, destino):
+    """Compila todas las fuentes en `destino` y escribe assets.json al final."""
+    destino = Path(destino)
+    destino.mkdir(parents=True, exist_ok=True)
+    metadatos = {"version": VERSION_ASSETS, "fuentes": {}}
+    for fuente in fuentes:
+        fuente = Path(fuente).resolve()
+        pref = fuente.stem
+        entrada = {"identidad": identidad_fichero(fuente), "prefijo": pref}
+        if fuente.suffix == ".npz":
+            entrada.update(tipo="npz", arrays=compilar_npz(fuente, destino, pref))
+        else:
+            entrada.update(tipo=compilar_json(fuente, destino, pref))
+        metadatos["fuentes"][str(fuente)] = entrada
+        print(f"[DONE] {fuente.name} → {destino}/{pref}.* ({entrada['tipo']})")
+    tmp = ruta_temporal(destino / METADATOS)
+    tmp.write_text(json.dumps(metadatos, indent=1), encoding="utf-8")
+    publicar(tmp, destino / METADATOS)
+
+
+# carga ========================================================================
+class _Vocabulario:
+    def __init__(self, vocab):
+        self._vocab = vocab
+        self._cadenas = None
+
+    def __getitem__(self, i):
+        if self._cadenas is None:
+            self._cadenas = [v.decode("utf-8") for v in self._vocab]
+        return self._cadenas[i]
+
+
+class ListaCadenas(Sequence):
+    """Lista de cadenas sobre un array S mapeado."""
+
+    def __init__(self, valores):
+        self.valores = valores
+
+    def __len__(self):
+        return len(self.valores)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [v.decode("utf-8") for v in self.valores[i]]
+        return self.valores[i].decode("utf-8")
+
+
+class ListaInternada(Sequence):
+    """Lista de listas de cadenas internadas (offsets + ids + vocab)."""
+
+    def __init__(self, offsets, ids, vocab):
+        self.offsets, self.ids, self.vocab = offsets, ids, _Vocabulario(vocab)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def ids_de(self, i):
+        """Ids internados de la posición i (vista sin copia)."""
+        return self.ids[int(self.offsets[i]):int(self.offsets[i + 1])]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return [self.vocab[j] for j in self.ids_de(i)]
+
+
+class MapaInternado(Mapping):
+    """
+    Mapa de sólo lectura sobre claves ordenadas (búsqueda binaria) con
+    valores internados (listas o cadenas) o numéricos. Itera en orden de
+    clave, no en el del JSON original.
+    """
+
+    def __init__(self, claves, tipo, offsets=None, ids=None, vocab=None, valores=None):
+        self.claves, self.tipo = claves, tipo
+        self.offsets, self.ids, self.valores = offsets, ids, valores
+        self.vocab = _Vocabulario(vocab) if vocab is not None else None
+
+    def _posicion(self, clave) -> int:
+        if not isinstance(clave, str):
+            return -1
+        b = clave.encode("utf-8")
+        if len(b) > self.claves.dtype.itemsize:
+            return -1
+        i = int(np.searchsorted(self.claves, b))
+        return i if i < len(self.claves) and self.claves[i] == b else -1
+
+    def ids_de(self, clave):
+        """Ids internados de la clave (vista sin copia); KeyError si no está."""
+        i = self._posicion(clave)
+        if i < 0:
+            raise KeyError(clave)
+        if self.tipo == "mapa_cadenas":
+            return self.ids[i:i + 1]
+        return self.ids[int(self.offsets[i]):int(self.offsets[i + 1])]
+
+    def __getitem__(self, clave):
+        if self.tipo == "mapa_numeros":
+            i = self._posicion(clave)
+            if i < 0:
+                raise KeyError(clave)
+            return self.valores[i].item()
+        ids = self.ids_de(clave)
+        if self.tipo == "mapa_cadenas":
+            return self.vocab[int(ids[0])]
+        return [self.vocab[j] for j in ids]
+
+    def __contains__(self, clave):
+        return self._posicion(clave) >= 0
+
+    def __len__(self):
+        return len(self.claves)
+
+    def __iter__(self):
+        return (c.decode("utf-8") for c in self.claves)
+
+
+class AssetsFantasia:
+    """Assets compilados en un directorio; cada fuente se abre mapeada en memoria."""
+
+    def __init__(self, destino):
+        self.destino = Path(destino)
+        self.path = self.destino / METADATOS
+
+    def metadatos(self) -> dict:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def al_dia(self, fuentes) -> bool:
+        metadatos = self.metadatos()
+        if metadatos.get("version") != VERSION_ASSETS:
+            return False
+        compiladas = metadatos.get("fuentes", {})
+        for fuente in fuentes:
+            fuente = Path(fuente).resolve()
+            entrada = compiladas.get(str(fuente))
+            if entrada is None or entrada.get("identidad") != identidad_fichero(fuente):
+                return False
+        return True
+
+    def asegurar(self, fuentes):
+        if self.al_dia(fuentes):
+            return self
+        print(f"[RUN ] Compilando assets de FANTASIA → {self.destino}")
+        compilar_assets(fuentes, self.destino)
+        return self
+
+    def _npy(self, pref, nombre):
+        return np.load(self.destino / f"{pref}.{nombre}.npy", mmap_mode="r")
+
+    def cargar(self, fuente):
+        """Equivalente mapeado de np.load(fuente) / json.load(open(fuente))."""
+        entrada = self.metadatos().get("fuentes", {}).get(str(Path(fuente).resolve()))
+        if entrada is None:
+            raise KeyError(f"{fuente} no está compilado en {self.destino}")
+        pref, tipo = entrada["prefijo"], entrada["tipo"]
+        if tipo == "npz":
+            return NpzResidente((nombre, self._npy(pref, nombre)) for nombre in entrada["arrays"])
+        if tipo == "lista":
+            return ListaCadenas(self._npy(pref, "valores"))
+        if tipo == "lista_listas":
+            return ListaInternada(*(self._npy(pref, n) for n in ("offsets", "ids", "vocab")))
+        claves = self._npy(pref, "claves")
+        if tipo == "mapa_listas":
+            return MapaInternado(claves, tipo, *(self._npy(pref, n) for n in ("offsets", "ids", "vocab")))
+        if tipo == "mapa_cadenas":
+            return MapaInternado(claves, tipo, ids=self._npy(pref, "ids"), vocab=self._npy(pref, "vocab"))
+        return MapaInternado(claves, tipo, valores=self._npy(pref, "valores"))
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        return
+    destino, fuentes = Path(sys.argv[1]), sys.argv[2:]
+    assets = AssetsFantasia(destino).asegurar(fuentes)
+    for fuente in fuentes:
+        inicio = time.perf_counter()
+        objeto = assets.cargar(fuente)
+        print(f"[INFO] {Path(fuente).name}: {len(objeto)} entradas, abierto en "
+              f"{time.perf_counter() - inicio:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Worker persistente de FANTASIA4 (modo lote).
+
+En lugar de un `python3 fantasia_pipeline.py` nuevo por especie, un único
+proceso hijo por dispositivo ejecuta fantasia_pipeline.py una vez por especie
+(runpy, como __main__, con su sys.argv y en su directorio de staging) sin
+salir entre una y otra. Así:
+  - torch, transformers y el resto de importaciones se hacen una vez;
+  - las cargas de los ficheros de la lookup (np.load del .npz, json.load de
+    annotations/accessions) y los from_pretrained del modelo ProtT5 se
+    memorizan: la segunda especie los recibe ya en memoria (y en la GPU).
+    El pipeline debe tratarlos como de sólo lectura.
+  - con assets compilados (fantasia_assets.py), esas cargas devuelven
+    directamente los arrays mapeados en memoria, sin descomprimir ni parsear;
+    json.load da entonces vistas Sequence/Mapping, no list/dict.
+
+Fuera del modo lote, un proceso suelto también puede usar los compilados:
+    python3 fantasia_worker.py --compilados DIR fantasia_pipeline.py args...
+
+Si una especie falla (excepción o sys.exit != 0) el worker sigue con la
+siguiente. Si el worker muere (segfault, OOM), el padre marca esa especie
+como fallida y arranca otro para las demás; las salidas ya publicadas de las
+especies terminadas no se tocan.
+"""
+
+import functools
+import json
+import multiprocessing
+import os
+import resource
+import runpy
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+
+from instrumentation import ejecutar, registrar
+
+ESPERA_CIERRE = 30  # segundos para que el worker salga limpio antes de terminarlo
+
+
+# lado del worker ==============================================================
+def _memorizar_cargas(assets, compilados=None):
+    """
+    Envuelve np.load / json.load / from_pretrained para no repetir cargas de
+    los assets (con `compilados`, se sirven ya mapeados desde ese directorio).
+    """
+    rutas = {str(Path(a).resolve()) for a in assets}
+    cache = {}
+    if compilados:
+        from fantasia_assets import AssetsFantasia  # necesita numpy
+        mapeados = AssetsFantasia(compilados)
+        for ruta in rutas:
+            cache[ruta] = mapeados.cargar(ruta)
+
+    def clave_ruta(origen):
+        # una ruta (str o Path) tal cual; un fichero abierto, por su .name
+        nombre = origen if isinstance(origen, (str, os.PathLike)) else getattr(origen, "name", None)
+        if isinstance(nombre, (str, os.PathLike)):
+            ruta = str(Path(nombre).resolve())
+            if ruta in rutas:
+                return ruta
+        return None
+
+    json_load = json.load
+
+    @functools.wraps(json_load)
+    def json_load_memo(fp, *args, **kwargs):
+        clave = clave_ruta(fp)
+        if clave is None or args or kwargs:
+            return json_load(fp, *args, **kwargs)
+        if clave not in cache:
+            cache[clave] = json_load(fp)
+        return cache[clave]
+
+    json.load = json_load_memo
+
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    if np is not None:
+        np_load = np.load
+
+        @functools.wraps(np_load)
+        def np_load_memo(file, *args, **kwargs):
+            clave = clave_ruta(file)
+            if clave is None or kwargs.get("mmap_mode"):
+                return np_load(file, *args, **kwargs)
+            if clave not in cache:
+                datos = np_load(file, *args, **kwargs)
+                if hasattr(datos, "files"):
+                    from fantasia_assets import NpzResidente
+                    with datos:
+                        datos = NpzResidente((k, datos[k]) for k in datos.files)
+                cache[clave] = datos
+            return cache[clave]
+
+        np.load = np_load_memo
+
+    try:
+        import transformers
+    except ImportError:
+        return
+    for nombre in ("T5EncoderModel", "T5Tokenizer", "T5TokenizerFast", "AutoModel", "AutoTokenizer"):
+        clase = getattr(transformers, nombre, None)
+        if clase is None:
+            continue
+        original = clase.from_pretrained
+
+        def from_pretrained_memo(*args, _original=original, _nombre=nombre, **kwargs):
+            clave = ("modelo", _nombre, repr(args), repr(sorted(kwargs.items())))
+            if clave not in cache:
+                cache[clave] = _original(*args, **kwargs)
+            return cache[clave]
+
+        clase.from_pretrained = from_pretrained_memo
+
+
+def _ejecutar_script(argv, cwd) -> int:
+    """Ejecuta el script como __main__ con argv en cwd; devuelve su código de salida."""
+    anterior_cwd, anterior_argv = os.getcwd(), sys.argv
+    try:
+        os.chdir(cwd)
+        sys.argv = list(argv)
+        runpy.run_path(argv[0], run_name="__main__")
+        return 0
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        return e.code if isinstance(e.code, int) else 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.argv = anterior_argv
+        os.chdir(anterior_cwd)
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+def servir(conn, script, assets, compilados=None):
+    """Bucle del worker: recibe (argv, cwd), ejecuta y devuelve la medida."""
+    sys.path.insert(0, str(Path(script).resolve().parent))  # imports hermanos del pipeline
+    _memorizar_cargas(assets, compilados)
+    while True:
+        try:
+            tarea = conn.recv()
+        except EOFError:
+            break
+        if tarea is None:
+            break
+        argv, cwd = tarea
+        antes = resource.getrusage(resource.RUSAGE_SELF)
+        inicio = time.perf_counter()
+        codigo = _ejecutar_script(argv, cwd)
+        despues = resource.getrusage(resource.RUSAGE_SELF)
+        conn.send({
+            "codigo": codigo,
+            "segundos": time.perf_counter() - inicio,
+            "cpu_user": despues.ru_utime - antes.ru_utime,
+            "cpu_sys": despues.ru_stime - antes.ru_stime,
+            "max_rss_kb": despues.ru_maxrss,
+        })
+    conn.close()
+
+
+# lado del padre ===============================================================
+class TrabajadorFantasia:
+    """
+    Proceso worker ligado a un dispositivo. Lo usa un único hilo a la vez (el
+    que lo tiene reservado con TrabajadoresPorDispositivo.reservar): con un
+    solo Pipe, dos especies a la vez recibirían la una el resultado de la otra.
+    """
+
+    def __init__(self, script, assets=(), compilados=None):
+        self.script = str(script)
+        self.assets = [str(a) for a in assets]
+        self.compilados = str(compilados) if compilados else None
+        self.proc = None
+        self.conn = None
+        self.especies = 0
+        self.en_uso = threading.Lock()
+
+    def _arrancar(self):
+        ctx = multiprocessing.get_context("spawn")  # sin heredar hilos ni estado CUDA del padre
+        self.conn, hijo = ctx.Pipe()
+        self.proc = ctx.Process(target=servir, args=(hijo, self.script, self.assets, self.compilados), daemon=True)
+        self.proc.start()
+        hijo.close()
+        self.especies = 0
+        print(f"[INFO] Worker FANTASIA4 arrancado (pid {self.proc.pid})")
+
+    def _descartar(self):
+        if self.conn is not None:
+            self.conn.close()
+        if self.proc is not None:
+            self.proc.join(timeout=1)
+            if self.proc.is_alive():
+                self.proc.kill()
+                self.proc.join()
+        self.proc = self.conn = None
+
+    def ejecutar(self, cmd, paso: str, especie=None, entradas=(), salidas=(), n_proteinas=None, cwd=None,
+                 recursos=None):
+        """
+        Como instrumentation.ejecutar con cmd = ["python3", script, args...],
+        pero en el worker (ya en marcha en esta máquina: `recursos` no se usa). Un código distinto de 0 (o la muerte del worker)
+        lanza CalledProcessError; el worker muerto se reemplaza en la siguiente.
+        """
+        if not self.en_uso.acquire(blocking=False):
+            raise RuntimeError(f"Worker FANTASIA4 en uso por otro hilo (especie {especie})")
+        try:
+            if self.proc is None or not self.proc.is_alive():
+                self._descartar()
+                self._arrancar()
+            argv = [str(c) for c in cmd[1:]]  # sin el intérprete
+            inicio = time.perf_counter()
+            try:
+                self.conn.send((argv, str(Path(cwd or ".").resolve())))
+                medida = self.conn.recv()
+                self.especies += 1
+            except (EOFError, OSError):
+                self.proc.join(timeout=5)
+                codigo = self.proc.exitcode
+                print(f"[WARN] El worker FANTASIA4 murió con {especie} (código {codigo}); se arrancará otro")
+                self._descartar()
+                medida = {"codigo": codigo if codigo else -1, "segundos": time.perf_counter() - inicio}
+        finally:
+            self.en_uso.release()
+        registrar(paso, especie, estado="ok" if medida["codigo"] == 0 else "fail", cmd=cmd,
+                  entradas=entradas, salidas=salidas, n_proteinas=n_proteinas, worker=True, **medida)
+        if medida["codigo"] != 0:
+            raise subprocess.CalledProcessError(medida["codigo"], cmd)
+        return 0
+
+    def cerrar(self):
+        if self.proc is None:
+            return
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.proc.join(timeout=ESPERA_CIERRE)
+        self._descartar()
+
+
+class TrabajadoresPorDispositivo:
+    """
+    TrabajadorFantasia por dispositivo, prestados en exclusiva. Normalmente
+    hay uno por dispositivo, pero las plazas "cpu" del pool (y las especies
+    con todos los embeddings en el almacén, que van a "cpu" sin pasar por el
+    pool) se llaman igual: si el de "cpu" está prestado, se crea otro.
+    """
+
+    def __init__(self, script, assets=(), compilados=None):
+        self.script, self.assets, self.compilados = script, assets, compilados
+        self.libres = {}
+        self.todos = []
+        self.cerrojo = threading.Lock()
+
+    @contextmanager
+    def reservar(self, device: str):
+        with self.cerrojo:
+            libres = self.libres.setdefault(device, [])
+            if libres:
+                trabajador = libres.pop()
+            else:
+                trabajador = TrabajadorFantasia(self.script, self.assets, self.compilados)
+                self.todos.append(trabajador)
+        try:
+            yield trabajador
+        finally:
+            with self.cerrojo:
+                self.libres[device].append(trabajador)
+
+    def cerrar(self):
+        for trabajador in self.todos:
+            trabajador.cerrar()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+        return False
+
+
+class LanzadorCompilados:
+    """
+    Fuera del modo lote: un proceso nuevo por especie, pero arrancado a través
+    de este módulo para que lea los assets compilados (mapeados) en lugar de
+    descomprimir el .npz y parsear los JSON. Misma interfaz que los trabajadores.
+    """
+
+    def __init__(self, compilados):
+        self.compilados = str(compilados)
+
+    @contextmanager
+    def reservar(self, device: str):
+        yield self
+
+    def ejecutar(self, cmd, paso: str, especie=None, entradas=(), salidas=(), n_proteinas=None, cwd=None,
+                 recursos=None):
+        cmd = [cmd[0], str(Path(__file__).resolve()), "--compilados", self.compilados] + list(cmd[1:])
+        return ejecutar(cmd, paso, especie, entradas=entradas, salidas=salidas, n_proteinas=n_proteinas, cwd=cwd,
+                        recursos=recursos)
+
+    def cerrar(self):
+        pass
+
+
+if __name__ == "__main__":
+    # python3 fantasia_worker.py --compilados DIR script args...
+    if len(sys.argv) < 4 or sys.argv[1] != "--compilados":
+        print(__doc__)
+        sys.exit(2)
+    compilados, argv = sys.argv[2], sys.argv[3:]
+    fuentes = json.loads((Path(compilados) / "assets.json").read_text(encoding="utf-8"))["fuentes"]
+    sys.path.insert(0, str(Path(argv[0]).resolve().parent))
+    _memorizar_cargas(list(fuentes), compilados)
+    sys.exit(_ejecutar_script(argv, os.getcwd()))
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Índice persistente accesión → (offset, longitud) sobre FASTAs enormes de
+UniProt (uniprot_sprot / uniprot_trembl), para sacar en segundos un FASTA de
+referencia con sólo los sujetos con hit de una especie en lugar de pasarle a
+AHRD el TrEMBL entero.
+
+Formato en disco ({nombre_fasta}.accidx en el directorio de índices):
+  registros de ancho fijo ordenados por accesión:
+    accesión (ASCII, rellena con \\0 hasta `ancho`) | offset u64 | longitud u32
+  que se consultan con búsqueda binaria sobre un mmap (sin cargarlos).
+Al lado va {nombre_fasta}.accidx.json con la identidad del FASTA (ruta,
+tamaño, mtime y sha1 del primer MB): si cambia la release (r2025_01 →
+r2025_02) o se reemplaza el fichero, el índice se reconstruye.
+"""
+
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+
+from fasta_utils import accesion_corta
+from manifest import ruta_temporal, publicar
+
+VERSION_INDICE = 1
+POSICION = struct.Struct("<QI")   # offset, longitud
+REGISTROS_POR_TROZO = 5_000_000   # registros ordenados en memoria al construir
+
+_cerrojos = {}
+_cerrojo_global = threading.Lock()
+
+
+def identidad_fasta(fasta) -> dict:
+    """Identidad de la release: ruta, tamaño, mtime y sha1 del primer MB."""
+    p = Path(fasta).resolve()
+    st = p.stat()
+    with p.open("rb") as f:
+        cabeza = hashlib.sha1(f.read(1 << 20)).hexdigest()
+    return {"fasta": str(p), "tamano": st.st_size, "mtime_ns": st.st_mtime_ns,
+            "cabeza": cabeza, "version": VERSION_INDICE}
+
+
+def _registros(fasta):
+    """(accesión, offset, longitud) de cada registro, en orden de fichero."""
+    with open(fasta, "rb") as f:
+        tamano = os.fstat(f.fileno()).st_size
+        if tamano == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:1] == b">":
+                inicio = 0
+            else:
+                inicio = mm.find(b"\n>") + 1
+                if inicio == 0:
+                    return
+            while True:
+                siguiente = mm.find(b"\n>", inicio)
+                fin = tamano if siguiente < 0 else siguiente + 1
+                fin_cab = mm.find(b"\n", inicio, fin)
+                cabecera = mm[inicio + 1:fin if fin_cab < 0 else fin_cab].split(maxsplit=1)
+                if cabecera:
+                    yield accesion_corta(cabecera[0].decode("ascii", "replace")), inicio, fin - inicio
+                if siguiente < 0:
+                    break
+                inicio = fin
+
+
+def _escribir_trozo(lote, path: Path):
+    lote.sort()
+    with path.open("w", encoding="ascii", errors="replace") as out:
+        for acc, off, lon in lote:
+            out.write(f"{acc}\t{off}\t{lon}\n")
+
+
+def construir_indice(fasta, indice: Path):
+    """
+    Recorre el FASTA una vez y escribe el índice ordenado. Con FASTAs de
+    cientos de millones de registros se ordena por trozos en disco y se
+    mezclan, sin tenerlo todo en memoria.
+    """
+    indice = Path(indice)
+    indice.parent.mkdir(parents=True, exist_ok=True)
+    trozos, lote, ancho = [], [], 1
+    try:
+        for acc, off, lon in _registros(fasta):
+            lote.append((acc, off, lon))
+            ancho = max(ancho, len(acc.encode("ascii", "replace")))
+            if len(lote) >= REGISTROS_POR_TROZO:
+                trozos.append(ruta_temporal(indice.with_name(f"{indice.name}.trozo{len(trozos)}")))
+                _escribir_trozo(lote, trozos[-1])
+                lote = []
+        trozos.append(ruta_temporal(indice.with_name(f"{indice.name}.trozo{len(trozos)}")))
+        _escribir_trozo(lote, trozos[-1])
+        del lote
+
+        fmt = struct.Struct(f"<{ancho}sQI")
+        tmp = ruta_temporal(indice)
+        n, anterior = 0, None
+        abiertos = [t.open(encoding="ascii") for t in trozos]
+        try:
+            with tmp.open("wb") as out:
+                for line in heapq.merge(*abiertos, key=lambda l: l.split("\t", 1)[0]):
+                    acc, off, lon = line.rstrip("\n").split("\t")
+                    if acc == anterior:
+                        continue  # accesión repetida: vale la primera
+                    out.write(fmt.pack(acc.encode("ascii"), int(off), int(lon)))
+                    anterior = acc
+                    n += 1
+        finally:
+            for f in abiertos:
+                f.close()
+    finally:
+        for t in trozos:
+            t.unlink(missing_ok=True)
+
+    info = identidad_fasta(fasta)
+    info.update({"ancho": ancho, "registros": n})
+    tmp_info = ruta_temporal(indice.with_name(indice.name + ".json"))
+    tmp_info.write_text(json.dumps(info, indent=1), encoding="utf-8")
+    # primero los datos, luego la identidad: un índice a medias nunca parece válido
+    publicar(tmp, indice)
+    publicar(tmp_info, indice.with_name(indice.name + ".json"))
+    return n
+
+
+class IndiceFasta:
+    """Índice accesión → registro de un FASTA, construido la primera vez que se usa."""
+
+    def __init__(self, fasta, indice_dir):
+        self.fasta = Path(fasta)
+        self.path = Path(indice_dir) / f"{self.fasta.name}.accidx"
+        self.info_path = self.path.with_name(self.path.name + ".json")
+        with _cerrojo_global:
+            self.cerrojo = _cerrojos.setdefault(str(self.path.resolve()), threading.Lock())
+
+    def al_dia(self) -> bool:
+        try:
+            info = json.loads(self.info_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        if not self.path.exists():
+            return False
+        guardado = {k: info.get(k) for k in ("fasta", "tamano", "mtime_ns", "cabeza", "version")}
+        return guardado == identidad_fasta(self.fasta)
+
+    def asegurar(self):
+        """Construye (o reconstruye, si cambió la release) el índice."""
+        with self.cerrojo:
+            if self.al_dia():
+                return
+            print(f"[RUN ] Indexando {self.fasta} → {self.path}")
+            n = construir_indice(self.fasta, self.path)
+            print(f"[DONE] Índice de {self.fasta.name}: {n} accesiones")
+
+    def buscar(self, accesiones):
+        """{accesión: (offset, longitud)} de las que están en el FASTA."""
+        self.asegurar()
+        ancho = json.loads(self.info_path.read_text(encoding="utf-8"))["ancho"]
+        tam_reg = ancho + POSICION.size
+        encontradas = {}
+        with self.path.open("rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return encontradas
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                n = len(mm) // tam_reg
+                for acc in accesiones:
+                    clave = acc.encode("ascii", "replace")
+                    if len(clave) > ancho:
+                        continue
+                    clave = clave.ljust(ancho, b"\0")
+                    lo, hi = 0, n
+                    while lo < hi:
+                        mid = (lo + hi) // 2
+                        if mm[mid * tam_reg:mid * tam_reg + ancho] < clave:
+                            lo = mid + 1
+                        else:
+                            hi = mid
+                    if lo < n and mm[lo * tam_reg:lo * tam_reg + ancho] == clave:
+                        ini = lo * tam_reg + ancho
+                        encontradas[acc] = POSICION.unpack(mm[ini:ini + POSICION.size])
+        return encontradas
+
+    def extraer(self, accesiones, out_path: Path):
+        """
+        Escribe en out_path (atómicamente) los registros de las accesiones, en
+        orden de fichero. Devuelve (encontradas, ausentes).
+        """
+        accesiones = set(accesiones)
+        posiciones = sorted(self.buscar(accesiones).values())
+        out_path = Path(out_path)
+        tmp = ruta_temporal(out_path)
+        with self.fasta.open("rb") as f, tmp.open("wb") as out:
+            for off, lon in posiciones:
+                out.write(os.pread(f.fileno(), lon, off))
+        publicar(tmp, out_path)
+        return len(posiciones), len(accesiones) - len(posiciones)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Utilidades FASTA compartidas por los scripts de anotación
+(annotation_with_diamond.py, FANTASIA4.py, annotation_FANTASIA.py).
+"""
+
+import gzip
+import hashlib
+import os
+from pathlib import Path
+
+
+def leer_fasta(fasta):
+    """
+    Recorre un FASTA en streaming y devuelve (id, secuencia) por registro.
+    El id es la primera palabra de la cabecera, como hacen DIAMOND y AHRD.
+    """
+    prot, trozos = None, []
+    with open(fasta, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith(">"):
+                if prot is not None:
+                    yield prot, "".join(trozos)
+                cabecera = line[1:].split(maxsplit=1)
+                prot, trozos = (cabecera[0] if cabecera else ""), []
+            else:
+                trozos.append(line.strip())
+    if prot is not None:
+        yield prot, "".join(trozos)
+
+
+def contar_secuencias(fasta) -> int:
+    """Número de registros de un FASTA (líneas que empiezan por ">")."""
+    with open(fasta, "rb") as f:
+        return sum(1 for line in f if line.startswith(b">"))
+
+
+def digest_secuencia(seq: str) -> str:
+    """Huella de una secuencia (sha1 sobre la secuencia en mayúsculas)."""
+    return hashlib.sha1(seq.upper().encode("ascii", "replace")).hexdigest()
+
+
+def accesion_corta(sujeto: str) -> str:
+    """'sp|P12345|NOMBRE_HUMAN' → 'P12345' (como la shortAccession de AHRD)."""
+    if "|" in sujeto:
+        partes = sujeto.split("|")
+        if len(partes) >= 2 and partes[1]:
+            return partes[1]
+    return sujeto
+
+
+def escribir_fasta(registros, out_path: Path, ancho: int = 60):
+    """Escribe [(id, secuencia)] en FASTA con líneas de `ancho` residuos."""
+    with Path(out_path).open("w", encoding="utf-8") as out:
+        for prot, seq in registros:
+            out.write(f">{prot}\n")
+            for i in range(0, len(seq), ancho):
+                out.write(seq[i:i + ancho] + "\n")
+
+
+def deduplicar_fasta(fasta, unique_fasta: Path, mapa_tsv: Path):
+    """
+    Colapsa secuencias idénticas en una sola pasada: escribe un FASTA con una
+    secuencia por huella (representante = primer ID que la lleva) y un TSV
+    id<TAB>representante con todos los IDs originales en su orden.
+    Devuelve (n_total, n_unicas). Siempre reescribe: decidir si hace falta es
+    cosa del manifiesto de quien lo llama.
+    """
+    unique_fasta, mapa_tsv = Path(unique_fasta), Path(mapa_tsv)
+
+    unique_fasta.parent.mkdir(parents=True, exist_ok=True)
+    tmp_fa = unique_fasta.with_name(unique_fasta.name + ".tmp")
+    tmp_mapa = mapa_tsv.with_name(mapa_tsv.name + ".tmp")
+    representantes = {}
+    n_total = 0
+    with tmp_fa.open("w", encoding="utf-8") as fa, tmp_mapa.open("w", encoding="utf-8") as mapa:
+        for prot, seq in leer_fasta(fasta):
+            n_total += 1
+            digest = digest_secuencia(seq)
+            rep = representantes.get(digest)
+            if rep is None:
+                rep = representantes[digest] = prot
+                fa.write(f">{prot}\n{seq}\n")
+            mapa.write(f"{prot}\t{rep}\n")
+    tmp_fa.replace(unique_fasta)
+    tmp_mapa.replace(mapa_tsv)
+    print(f"[INFO] Deduplicado {Path(fasta).name}: {n_total} secuencias → {len(representantes)} únicas")
+    return n_total, len(representantes)
+
+
+def leer_mapa_dedup(mapa_tsv: Path):
+    """Lee el TSV id<TAB>representante y devuelve [(id, representante)] en orden."""
+    pares = []
+    with Path(mapa_tsv).open(encoding="utf-8") as f:
+        for line in f:
+            prot, _, rep = line.rstrip("\n").partition("\t")
+            if prot:
+                pares.append((prot, rep or prot))
+    return pares
+
+
+def expandir_tabla(tabla: Path, out_path: Path, mapa_tsv: Path):
+    """
+    Reparte una tabla calculada sobre representantes (DIAMOND, AHRD, FANTASIA…)
+    a todos los IDs originales. Las líneas cuya primera columna no es un
+    representante (cabeceras, comentarios) se mantienen al principio; el resto
+    se escribe en el orden original de IDs, igual que sin deduplicar.
+    """
+    pares = leer_mapa_dedup(mapa_tsv)
+    reps = {rep for _, rep in pares}
+    cabecera, grupos = [], {}
+    with Path(tabla).open(encoding="utf-8") as f:
+        for line in f:
+            prot, sep, resto = line.partition("\t")
+            if sep and prot in reps:
+                grupos.setdefault(prot, []).append(resto)
+            else:
+                cabecera.append(line)
+
+    out_path = Path(out_path)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as out:
+        out.writelines(cabecera)
+        for prot, rep in pares:
+            for resto in grupos.get(rep, []):
+                out.write(f"{prot}\t{resto}")
+    tmp.replace(out_path)
+
+
+def expandir_directorio(origen: Path, destino: Path, mapa_tsv: Path,
+                        sufijos=(".tsv", ".txt", ".csv")):
+    """
+    Re-expande un directorio de salidas (p.ej. `outputs` de FANTASIA): las
+    tablas se pasan por expandir_tabla y el resto de ficheros se copia tal
+    cual. Se escribe en un directorio temporal y se renombra al terminar.
+    """
+    import shutil
+
+    origen, destino = Path(origen), Path(destino)
+    tmp = destino.with_name(destino.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    for fichero in origen.rglob("*"):
+        if not fichero.is_file():
+            continue
+        final = tmp / fichero.relative_to(origen)
+        final.parent.mkdir(parents=True, exist_ok=True)
+        if fichero.suffix in sufijos:
+            expandir_tabla(fichero, final, mapa_tsv)
+        else:
+            shutil.copy2(fichero, final)
+    tmp.mkdir(parents=True, exist_ok=True)
+    tmp.replace(destino)
+
+
+BLOQUE = 16 << 20  # bytes leídos de golpe al normalizar
+
+
+def abrir_binario(path):
+    """Abre un FASTA en binario con buffer grande; detecta gzip por la cabecera."""
+    with open(path, "rb") as f:
+        magia = f.read(2)
+    if magia == b"\x1f\x8b":
+        return gzip.open(path, "rb")
+    return open(path, "rb", buffering=1 << 20)
+
+
+def normalizar_fasta(fasta, clean_fasta: Path, quitar=b".*", min_len: int = 0,
+                     max_len: int = 0, ancho: int = 60, indice: bool = True):
+    """
+    Normalizador FASTA de una sola pasada (sustituye a `sed -r 's/ .+//'`):
+      - recorta la cabecera a la primera palabra;
+      - elimina de las líneas de secuencia los caracteres de `quitar` (. y *);
+      - acepta entrada gzip;
+      - descarta secuencias con longitud < min_len o > max_len (0 = sin límite);
+      - reenvuelve a `ancho` residuos y escribe un índice .fai
+        (nombre, longitud, offset, residuos/línea, bytes/línea).
+    Escribe en .tmp y renombra al final: una ejecución interrumpida nunca deja
+    un fichero "limpio" a medias. Devuelve (n_escritas, n_descartadas).
+    """
+    clean_fasta = Path(clean_fasta)
+    clean_fasta.parent.mkdir(parents=True, exist_ok=True)
+    tmp = clean_fasta.with_name(clean_fasta.name + ".tmp")
+    fai = clean_fasta.with_name(clean_fasta.name + ".fai")
+    tmp_fai = fai.with_name(fai.name + ".tmp")
+
+    escritas = descartadas = 0
+    offset = 0
+    filas_fai = []
+
+    with abrir_binario(fasta) as entrada, open(tmp, "wb", buffering=1 << 20) as out:
+        def volcar(cabecera, seq):
+            nonlocal escritas, descartadas, offset
+            if len(seq) < min_len or (max_len and len(seq) > max_len):
+                descartadas += 1
+                return
+            linea_cab = b">" + cabecera + b"\n"
+            out.write(linea_cab)
+            offset += len(linea_cab)
+            filas_fai.append(f"{cabecera.decode()}\t{len(seq)}\t{offset}\t{ancho}\t{ancho + 1}\n")
+            lineas = [seq[i:i + ancho] for i in range(0, len(seq), ancho)]
+            if lineas:
+                out.write(b"\n".join(lineas) + b"\n")
+            offset += len(seq) + -(-len(seq) // ancho)
+            escritas += 1
+
+        # se procesa por bloques grandes partiendo en registros por b"\n>";
+        # translate() quita saltos de línea y caracteres no deseados en C
+        borrar = b"\r\n\t " + quitar
+        resto, primero = b"\n", True
+        while True:
+            bloque = entrada.read(BLOQUE)
+            registros = (resto + bloque).split(b"\n>")
+            if primero:
+                registros.pop(0)  # lo que haya antes del primer ">" (nada en un FASTA válido)
+                primero = False
+            resto = registros.pop() if bloque and registros else b""
+            for registro in registros:
+                linea_cab, _, cuerpo = registro.partition(b"\n")
+                partes = linea_cab.split(None, 1)
+                volcar(partes[0] if partes else b"", cuerpo.translate(None, borrar))
+            if not bloque:
+                break
+
+    if indice:
+        with open(tmp_fai, "w", encoding="utf-8") as f:
+            f.writelines(filas_fai)
+        os.replace(tmp_fai, fai)
+    os.replace(tmp, clean_fasta)  # el FASTA limpio se publica el último
+    return escritas, descartadas
+
+
+def partir_fasta(fasta, n: int, out_dir: Path, plantilla: str = "shard_{:03d}.faa"):
+    """
+    Parte un FASTA en n trozos contiguos equilibrados por número de residuos
+    (no de secuencias), conservando el orden: concatenar los resultados de los
+    trozos en orden da el mismo orden que el FASTA original.
+    Devuelve la lista de rutas (algún trozo puede quedar vacío si n > secuencias).
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    n = max(1, int(n))
+    total = sum(len(seq) for _, seq in leer_fasta(fasta))
+    objetivo = total / n
+
+    rutas = [out_dir / plantilla.format(i) for i in range(n)]
+    i, acumulado = 0, 0
+    out = rutas[0].open("w", encoding="utf-8")
+    try:
+        for prot, seq in leer_fasta(fasta):
+            # se pasa al siguiente trozo cuando éste ya tiene su parte de residuos
+            while i < n - 1 and acumulado >= objetivo * (i + 1):
+                out.close()
+                i += 1
+                out = rutas[i].open("w", encoding="utf-8")
+            out.write(f">{prot}\n{seq}\n")
+            acumulado += len(seq)
+    finally:
+        out.close()
+    for ruta in rutas[i + 1:]:
+        ruta.touch()
+    return rutas
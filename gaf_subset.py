@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Subconjuntos del GAF de UniProt (goa_uniprot_all.gaf, >100 GB) con sólo las
+accesiones que aparecen como sujeto en los hits de DIAMOND de cada especie.
+
+AHRD lee el GAF entero por especie para quedarse con unas pocas miles de
+accesiones; con el subconjunto lee unos MB. Se hace una única pasada por el
+GAF para todas las especies pendientes.
+
+Las líneas se copian tal cual (incluidas las NOT y los comentarios '!'), así
+que la reference_go_regex de AHRD sigue decidiendo qué anotaciones valen
+exactamente igual que con el GAF completo.
+"""
+
+from pathlib import Path
+
+from fasta_utils import accesion_corta
+from manifest import ruta_temporal, publicar
+
+PREFIJO_GAF = b"UniProtKB\t"  # la reference_go_regex sólo acepta estas líneas
+
+
+def accesiones_hits(tablas):
+    """Accesiones (columna sseqid) de una o varias tablas DIAMOND outfmt 6."""
+    accs = set()
+    for tabla in tablas:
+        with Path(tabla).open(encoding="utf-8") as f:
+            for line in f:
+                campos = line.split("\t", 2)
+                if len(campos) >= 2 and campos[1]:
+                    acc = accesion_corta(campos[1].strip())
+                    accs.add(acc)
+                    # las isoformas (P12345-2) se anotan en el GAF con la canónica
+                    accs.add(acc.split("-", 1)[0])
+    return accs
+
+
+def subconjuntos_gaf(gaf, grupos):
+    """
+    Una sola pasada por el GAF repartiendo líneas entre varios subconjuntos.
+      grupos: {ruta_salida: conjunto de accesiones}
+    Cada salida se escribe en temporal y se publica al terminar.
+    Devuelve {ruta_salida: líneas escritas}.
+    """
+    grupos = {Path(k): v for k, v in grupos.items()}
+    destinos = list(grupos)
+    # accesión → índices de los subconjuntos que la quieren
+    por_acc = {}
+    for i, ruta in enumerate(destinos):
+        for acc in grupos[ruta]:
+            por_acc.setdefault(acc.encode("utf-8"), []).append(i)
+
+    tmps = [ruta_temporal(r) for r in destinos]
+    salidas = [t.open("wb") for t in tmps]
+    cuentas = [0] * len(destinos)
+    try:
+        with open(gaf, "rb") as f:
+            for line in f:
+                if line.startswith(b"!"):
+                    for out in salidas:
+                        out.write(line)
+                    continue
+                if not line.startswith(PREFIJO_GAF):
+                    continue
+                fin = line.find(b"\t", len(PREFIJO_GAF))
+                if fin < 0:
+                    continue
+                for i in por_acc.get(line[len(PREFIJO_GAF):fin], ()):
+                    salidas[i].write(line)
+                    cuentas[i] += 1
+    except BaseException:
+        for out, tmp in zip(salidas, tmps):
+            out.close()
+            tmp.unlink(missing_ok=True)
+        raise
+    for out in salidas:
+        out.close()
+    for tmp, ruta in zip(tmps, destinos):
+        publicar(tmp, ruta)
+    return dict(zip(destinos, cuentas))
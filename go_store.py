@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Almacén compacto accesión → términos GO compilado a partir del GAF de UniProt
+(sustituye al paso externo uniprot_GO_mapper).
+
+El GAF se compila una vez (por release) en un único fichero binario que se
+abre con mmap:
+  cabecera  | magia "GOSTORE1", ancho de clave u32, n accesiones u64, n términos u64
+  claves    | n accesiones de `ancho` bytes (rellenas con \\0), ordenadas
+  offsets   | n+1 u64: los términos de la accesión i son terminos[off[i]:off[i+1]]
+  terminos  | u32 con el número del GO (GO:0008150 → 8150), ordenados y sin repetir
+La consulta es una búsqueda binaria sobre las claves: no se carga nada en memoria.
+
+Se aplican las mismas reglas que la reference_go_regex de AHRD:
+  ^UniProtKB\\t(acc)\\t[^\\t]+\\t(?!NOT\\|)[^\\t]*\\t(GO:\\d+)
+es decir, sólo líneas UniProtKB, con símbolo no vacío y cuyo calificador no
+empiece por "NOT|".
+"""
+
+import heapq
+import json
+import mmap
+import re
+import shutil
+import struct
+import threading
+from pathlib import Path
+
+from fasta_utils import abrir_binario, accesion_corta
+from manifest import identidad_fichero, ruta_temporal, publicar
+
+MAGIA = b"GOSTORE1"
+CABECERA = struct.Struct("<8sIQQ")
+OFFSET = struct.Struct("<Q")
+TERMINO = struct.Struct("<I")
+PARES_POR_TROZO = 20_000_000   # pares (accesión, GO) ordenados en memoria al compilar
+_GO = re.compile(rb"GO:(\d+)")
+
+_cerrojos = {}
+_cerrojo_global = threading.Lock()
+
+
+def formato_go(n: int) -> str:
+    return f"GO:{n:07d}"
+
+
+def _pares_gaf(gaf):
+    """(accesión, número GO) de cada línea que aceptaría la reference_go_regex."""
+    with abrir_binario(gaf) as f:
+        for line in f:
+            if not line.startswith(b"UniProtKB\t"):
+                continue
+            campos = line.split(b"\t", 5)
+            if len(campos) < 5 or not campos[1] or not campos[2]:
+                continue
+            if campos[3].startswith(b"NOT|"):
+                continue
+            go = _GO.match(campos[4])
+            if go:
+                yield campos[1].decode("ascii", "replace"), int(go.group(1))
+
+
+def _escribir_trozo(lote, path: Path):
+    lote.sort()
+    with path.open("w", encoding="ascii", errors="replace") as out:
+        for acc, go in lote:
+            out.write(f"{acc}\t{go}\n")
+
+
+def compilar_gaf(gaf, destino: Path):
+    """
+    Compila el GAF en el almacén binario. Los pares se ordenan por trozos en
+    disco y se mezclan, así que la memoria no depende del tamaño del GAF.
+    Devuelve (n_accesiones, n_terminos).
+    """
+    destino = Path(destino)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    partes = {k: ruta_temporal(destino.with_name(f"{destino.name}.{k}"))
+              for k in ("claves", "offsets", "terminos")}
+    trozos, lote, ancho = [], [], 1
+    try:
+        for acc, go in _pares_gaf(gaf):
+            lote.append((acc, go))
+            ancho = max(ancho, len(acc))
+            if len(lote) >= PARES_POR_TROZO:
+                trozos.append(ruta_temporal(destino.with_name(f"{destino.name}.trozo{len(trozos)}")))
+                _escribir_trozo(lote, trozos[-1])
+                lote = []
+        trozos.append(ruta_temporal(destino.with_name(f"{destino.name}.trozo{len(trozos)}")))
+        _escribir_trozo(lote, trozos[-1])
+        del lote
+
+        n_acc, n_terminos = 0, 0
+        abiertos = [t.open(encoding="ascii") for t in trozos]
+        try:
+            with partes["claves"].open("wb") as claves, \
+                 partes["offsets"].open("wb") as offsets, \
+                 partes["terminos"].open("wb") as terminos:
+                actual, gos = None, set()
+
+                def volcar():
+                    nonlocal n_acc, n_terminos
+                    claves.write(actual.encode("ascii", "replace").ljust(ancho, b"\0"))
+                    offsets.write(OFFSET.pack(n_terminos))
+                    for go in sorted(gos):
+                        terminos.write(TERMINO.pack(go))
+                    n_acc += 1
+                    n_terminos += len(gos)
+
+                for line in heapq.merge(*abiertos, key=lambda l: l.split("\t", 1)[0]):
+                    acc, _, go = line.rstrip("\n").partition("\t")
+                    if acc != actual:
+                        if actual is not None:
+                            volcar()
+                        actual, gos = acc, set()
+                    gos.add(int(go))
+                if actual is not None:
+                    volcar()
+                offsets.write(OFFSET.pack(n_terminos))
+        finally:
+            for f in abiertos:
+                f.close()
+
+        tmp = ruta_temporal(destino)
+        with tmp.open("wb") as out:
+            out.write(CABECERA.pack(MAGIA, ancho, n_acc, n_terminos))
+            for k in ("claves", "offsets", "terminos"):
+                with partes[k].open("rb") as parte:
+                    shutil.copyfileobj(parte, out)
+        publicar(tmp, destino)
+    finally:
+        for t in trozos + list(partes.values()):
+            t.unlink(missing_ok=True)
+    return n_acc, n_terminos
+
+
+class AlmacenGO:
+    """
+    Consulta accesión → GO sobre el fichero compilado. Si se da `gaf`, el
+    almacén se (re)compila cuando falta o cuando cambia el GAF.
+    """
+
+    def __init__(self, path, gaf=None):
+        self.path = Path(path)
+        self.gaf = gaf
+        self.info_path = self.path.with_name(self.path.name + ".json")
+        self.mm = None
+        with _cerrojo_global:
+            self.cerrojo = _cerrojos.setdefault(str(self.path.resolve()), threading.Lock())
+
+    def al_dia(self) -> bool:
+        if not self.path.exists():
+            return False
+        if self.gaf is None:
+            return True
+        try:
+            info = json.loads(self.info_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        return info.get("gaf") == identidad_fichero(self.gaf)
+
+    def asegurar(self):
+        with self.cerrojo:
+            if self.al_dia():
+                return
+            print(f"[RUN ] Compilando {self.gaf} → {self.path}")
+            n_acc, n_terminos = compilar_gaf(self.gaf, self.path)
+            tmp = ruta_temporal(self.info_path)
+            tmp.write_text(json.dumps({"gaf": identidad_fichero(self.gaf),
+                                       "accesiones": n_acc, "terminos": n_terminos}, indent=1),
+                           encoding="utf-8")
+            publicar(tmp, self.info_path)
+            print(f"[DONE] Almacén GO: {n_acc} accesiones, {n_terminos} anotaciones")
+
+    def abrir(self):
+        if self.mm is not None:
+            return self
+        self.asegurar()
+        with self.path.open("rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magia, self.ancho, self.n, self.n_terminos = CABECERA.unpack_from(self.mm, 0)
+        if magia != MAGIA:
+            raise ValueError(f"{self.path} no es un almacén GO")
+        self.ini_claves = CABECERA.size
+        self.ini_offsets = self.ini_claves + self.n * self.ancho
+        self.ini_terminos = self.ini_offsets + (self.n + 1) * OFFSET.size
+        return self
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+    def _posicion(self, acc: str) -> int:
+        clave = acc.encode("ascii", "replace")
+        if len(clave) > self.ancho:
+            return -1
+        clave = clave.ljust(self.ancho, b"\0")
+        lo, hi = 0, self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            ini = self.ini_claves + mid * self.ancho
+            if self.mm[ini:ini + self.ancho] < clave:
+                lo = mid + 1
+            else:
+                hi = mid
+        ini = self.ini_claves + lo * self.ancho
+        return lo if lo < self.n and self.mm[ini:ini + self.ancho] == clave else -1
+
+    def terminos(self, acc: str):
+        """Números GO de una accesión ([] si no tiene anotaciones válidas)."""
+        self.abrir()
+        i = self._posicion(acc)
+        if i < 0:
+            return []
+        desde, hasta = struct.unpack_from("<QQ", self.mm, self.ini_offsets + i * OFFSET.size)
+        return list(struct.unpack_from(f"<{hasta - desde}I", self.mm,
+                                       self.ini_terminos + desde * TERMINO.size))
+
+    def go_de(self, acc: str):
+        """Términos GO de una accesión ('sp|P12345|…' o 'P12345') como 'GO:0008150'."""
+        return [formato_go(n) for n in self.terminos(accesion_corta(acc))]
+
+    def anotar_tablas(self, tablas, solo_mejor: bool = False):
+        """
+        GO por proteína a partir de tablas DIAMOND outfmt 6: unión de los GO
+        de sus sujetos (con solo_mejor, sólo del primer hit de cada tabla,
+        que DIAMOND escribe ordenado por bitscore).
+        Devuelve {proteína: [GO…]} en orden de aparición.
+        """
+        self.abrir()
+        cache, por_prot = {}, {}
+        for tabla in tablas:
+            vistas = set()
+            with Path(tabla).open(encoding="utf-8") as f:
+                for line in f:
+                    campos = line.split("\t", 2)
+                    if len(campos) < 2:
+                        continue
+                    prot, sujeto = campos[0], accesion_corta(campos[1].strip())
+                    if solo_mejor and prot in vistas:
+                        continue
+                    vistas.add(prot)
+                    if sujeto not in cache:
+                        cache[sujeto] = self.terminos(sujeto)
+                    por_prot.setdefault(prot, set()).update(cache[sujeto])
+        return {prot: [formato_go(n) for n in sorted(gos)] for prot, gos in por_prot.items()}
+
+
+def escribir_anotacion(anotaciones, out_path: Path, proteinas=None):
+    """
+    TSV proteína<TAB>GO, GO… (mismo formato de lista que AHRD, legible por
+    analysis.py). Con `proteinas`, se escriben todas en ese orden, con la
+    columna GO vacía si no tienen. Escritura atómica.
+    """
+    out_path = Path(out_path)
+    tmp = ruta_temporal(out_path)
+    with tmp.open("w", encoding="utf-8") as out:
+        out.write("Protein-Accession\tGene-Ontology-Term\n")
+        for prot in (proteinas if proteinas is not None else anotaciones):
+            out.write(f"{prot}\t{', '.join(anotaciones.get(prot, []))}\n")
+    publicar(tmp, out_path)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Instrumentación de los pasos de los pipelines e informe de ejecución.
+
+Todos los pasos externos (DIAMOND, AHRD, FANTASIA, GoPredSim, TopGO) se
+lanzan con `ejecutar` (o, los asíncronos, con supervisor.ejecutar_async) a
+través del ejecutor activo (executor.py: en local o en la cola de lotes), que
+usa Popen + os.wait4 para obtener el rusage de ese hijo en concreto: tiempo
+de reloj, CPU user/sys, RSS máximo (p.ej. de la JVM de AHRD) y código de
+salida. Los pasos en el propio proceso (limpieza del FASTA) se miden con
+`medir`, y los que se saltan por estar ya hechos con `saltado`.
+
+Cada paso añade una línea JSON a INFORME (por defecto informe_ejecucion.jsonl
+en el directorio actual; la variable INFORME_EJECUCION lo cambia).
+
+Resumen de un informe (especies y pasos más lentos):
+    python instrumentation.py [informe.jsonl] [n]
+"""
+
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+INFORME = Path(os.environ.get("INFORME_EJECUCION", "informe_ejecucion.jsonl"))
+ACTIVO = True
+
+_cerrojo = threading.Lock()
+
+
+def _pipeline() -> str:
+    return Path(sys.argv[0]).stem if sys.argv and sys.argv[0] else "?"
+
+
+def _bytes(rutas) -> int:
+    total = 0
+    for r in rutas or ():
+        p = Path(r)
+        try:
+            if p.is_dir():
+                total += sum(f.stat().st_size for f in p.rglob("*") if f.is_file())
+            elif p.exists():
+                total += p.stat().st_size
+        except OSError:
+            pass
+    return total
+
+
+def registrar(paso: str, especie=None, estado: str = "ok", segundos: float = 0.0, codigo=None,
+              cpu_user=None, cpu_sys=None, max_rss_kb=None, entradas=(), salidas=(),
+              n_proteinas=None, cmd=None, **extra):
+    """Añade un registro al informe (una línea JSON)."""
+    if not ACTIVO:
+        return
+    fila = {
+        "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "pipeline": _pipeline(),
+        "host": socket.gethostname(),
+        "paso": paso,
+        "especie": especie,
+        "estado": estado,
+        "codigo": codigo,
+        "segundos": round(segundos, 3),
+        "cpu_user": None if cpu_user is None else round(cpu_user, 3),
+        "cpu_sys": None if cpu_sys is None else round(cpu_sys, 3),
+        "max_rss_mb": None if max_rss_kb is None else round(max_rss_kb / 1024, 1),
+        "bytes_entrada": _bytes(entradas),
+        "bytes_salida": _bytes(salidas),
+        "proteinas": n_proteinas,
+        "proteinas_por_s": round(n_proteinas / segundos, 1) if n_proteinas and segundos > 0 and estado == "ok" else None,
+        "cmd": cmd if cmd is None or isinstance(cmd, str) else " ".join(str(c) for c in cmd),
+    }
+    fila.update(extra)
+    linea = json.dumps(fila, ensure_ascii=False) + "\n"
+    with _cerrojo:
+        INFORME.parent.mkdir(parents=True, exist_ok=True)
+        with INFORME.open("a", encoding="utf-8") as f:
+            f.write(linea)
+
+
+def lanzar(cmd, **popen_kwargs):
+    """Popen del paso; devuelve (proceso, instante de inicio) para `esperar`."""
+    if isinstance(cmd, (list, tuple)):
+        cmd = [str(c) for c in cmd]
+    return subprocess.Popen(cmd, **popen_kwargs), time.perf_counter()
+
+
+def esperar(proc, inicio: float):
+    """
+    Espera al hijo con os.wait4 (bloqueante) y devuelve su medida:
+    {codigo, segundos, cpu_user, cpu_sys, max_rss_kb} de ese proceso.
+    """
+    _, status, uso = os.wait4(proc.pid, 0)
+    codigo = os.waitstatus_to_exitcode(status)
+    proc.returncode = codigo  # ya recogido: Popen no debe volver a esperarlo
+    return {
+        "codigo": codigo,
+        "segundos": time.perf_counter() - inicio,
+        "cpu_user": uso.ru_utime,
+        "cpu_sys": uso.ru_stime,
+        "max_rss_kb": uso.ru_maxrss,  # KB en Linux
+    }
+
+
+def ejecutar(cmd, paso: str, especie=None, entradas=(), salidas=(), n_proteinas=None,
+             check: bool = True, extra=None, recursos=None, **popen_kwargs):
+    """
+    Sustituto de subprocess.run(cmd, check=True, ...) que mide y registra el
+    paso. Con check, un código distinto de 0 lanza CalledProcessError (los
+    scripts lo siguen capturando igual). Devuelve el código de salida.
+    `extra` son campos adicionales del registro (p.ej. {"xmx": "8g"}) y
+    `recursos` (executor.Recursos) lo que el paso pide al ejecutor.
+    """
+    from executor import ejecutor_actual  # executor importa este módulo
+    extra = extra or {}
+    ejecutor = ejecutor_actual()
+    try:
+        trabajo = ejecutor.enviar(cmd, recursos, f"{paso}.{especie}" if especie else paso, **popen_kwargs)
+    except OSError:
+        registrar(paso, especie, estado="fail", cmd=cmd, entradas=entradas, n_proteinas=n_proteinas, **extra)
+        raise
+    medida = ejecutor.esperar(trabajo)
+    registrar(paso, especie, estado="ok" if medida["codigo"] == 0 else "fail", cmd=cmd,
+              entradas=entradas, salidas=salidas, n_proteinas=n_proteinas, **medida, **extra)
+    if check and medida["codigo"] != 0:
+        raise subprocess.CalledProcessError(medida["codigo"], cmd)
+    return medida["codigo"]
+
+
+@contextmanager
+def medir(paso: str, especie=None, entradas=(), salidas=(), n_proteinas=None):
+    """
+    Mide un paso que corre dentro del propio proceso (CPU del proceso entero;
+    el RSS es el máximo del proceso hasta ese momento).
+    """
+    antes = resource.getrusage(resource.RUSAGE_SELF)
+    inicio = time.perf_counter()
+    estado = "ok"
+    try:
+        yield
+    except BaseException:
+        estado = "fail"
+        raise
+    finally:
+        despues = resource.getrusage(resource.RUSAGE_SELF)
+        registrar(paso, especie, estado=estado, segundos=time.perf_counter() - inicio,
+                  cpu_user=despues.ru_utime - antes.ru_utime, cpu_sys=despues.ru_stime - antes.ru_stime,
+                  max_rss_kb=despues.ru_maxrss, entradas=entradas, salidas=salidas, n_proteinas=n_proteinas)
+
+
+def saltado(paso: str, especie=None, segundos: float = 0.0, salidas=()):
+    """Registra un paso que no se ejecuta por estar al día (y lo que costó comprobarlo)."""
+    registrar(paso, especie, estado="saltado", segundos=segundos, salidas=salidas)
+
+
+# resumen ======================================================================
+def leer_informe(path: Path):
+    filas = []
+    with Path(path).open(encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    filas.append(json.loads(line))
+                except ValueError:
+                    continue
+    return filas
+
+
+def resumen(path: Path = INFORME, n: int = 10):
+    """Imprime los pasos agregados, las especies y los pasos individuales más lentos."""
+    filas = leer_informe(path)
+    if not filas:
+        print(f"[WARN] Informe vacío: {path}")
+        return
+
+    por_paso = {}
+    for f in filas:
+        p = por_paso.setdefault(f["paso"], {"ok": 0, "fail": 0, "saltado": 0, "segundos": 0.0,
+                                            "segundos_saltado": 0.0, "rss": 0.0})
+        p[f["estado"]] = p.get(f["estado"], 0) + 1
+        if f["estado"] == "saltado":
+            p["segundos_saltado"] += f["segundos"]
+        else:
+            p["segundos"] += f["segundos"]
+        p["rss"] = max(p["rss"], f.get("max_rss_mb") or 0.0)
+
+    print(f"Informe: {path} ({len(filas)} registros)\n")
+    print(f"{'paso':<28}{'ok':>6}{'fail':>6}{'salt.':>7}{'segundos':>12}{'s saltados':>12}{'RSS máx MB':>12}")
+    for paso, p in sorted(por_paso.items(), key=lambda x: -x[1]["segundos"]):
+        print(f"{paso:<28}{p['ok']:>6}{p['fail']:>6}{p['saltado']:>7}{p['segundos']:>12.1f}"
+              f"{p['segundos_saltado']:>12.2f}{p['rss']:>12.1f}")
+
+    por_especie = {}
+    for f in filas:
+        if f.get("especie") and f["estado"] != "saltado":
+            por_especie[f["especie"]] = por_especie.get(f["especie"], 0.0) + f["segundos"]
+    if por_especie:
+        print(f"\nEspecies más lentas (suma de pasos ejecutados):")
+        for especie, segundos in sorted(por_especie.items(), key=lambda x: -x[1])[:n]:
+            print(f"  {especie:<40}{segundos:>12.1f} s")
+
+    print(f"\nPasos más lentos:")
+    for f in sorted((f for f in filas if f["estado"] != "saltado"), key=lambda f: -f["segundos"])[:n]:
+        rendimiento = f" {f['proteinas_por_s']} prot/s" if f.get("proteinas_por_s") else ""
+        rss = f" {f['max_rss_mb']} MB" if f.get("max_rss_mb") is not None else ""
+        print(f"  {f['paso']:<24}{str(f.get('especie') or '-'):<32}{f['segundos']:>10.1f} s"
+              f"  [{f['estado']}]{rss}{rendimiento}")
+
+
+if __name__ == "__main__":
+    resumen(Path(sys.argv[1]) if len(sys.argv) > 1 else INFORME,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 10)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Preparación de un FASTA para los embeddings: lotes por longitud y ventanas.
+
+Con las proteínas en su orden original, cada lote de la GPU se rellena hasta
+la más larga (de 30 a 30.000 residuos: casi todo relleno) y unas pocas
+proteínas gigantes agotan la memoria y tumban la especie entera. Aquí:
+  - las proteínas más largas que `max_len` se parten en ventanas solapadas
+    (`solape` residuos), cada una una pieza con su propio ID;
+  - las piezas se ordenan por longitud y se agrupan en lotes cuyo coste con
+    relleno (n piezas x la más larga) no pasa de `presupuesto` tokens;
+  - un manifiesto TSV (pieza, proteína, orden original, ventana, inicio, fin,
+    lote) permite devolver las tablas de resultados por pieza a los IDs y al
+    orden originales (recombinar_tabla: las ventanas de una proteína se unen).
+Las proteínas sin partir conservan su ID, así que sin ventanas las salidas
+recombinadas son las de siempre.
+
+agrupar_por_longitud y ventanas son funciones puras (sin GPU ni ficheros).
+"""
+
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+
+from fasta_utils import leer_fasta
+from manifest import ruta_temporal, publicar
+
+SEPARADOR_VENTANA = "__ventana"
+CABECERA_MANIFIESTO = "#pieza\tproteina\torden\tventana\tinicio\tfin\tlote\n"
+
+
+@dataclass(frozen=True)
+class Pieza:
+    """Trozo [inicio, fin) de la proteína `prot` (orden = posición en el FASTA original)."""
+    id: str
+    prot: str
+    orden: int
+    ventana: int
+    inicio: int
+    fin: int
+
+    @property
+    def longitud(self) -> int:
+        return self.fin - self.inicio
+
+
+def ventanas(longitud: int, max_len: int, solape: int):
+    """
+    [(inicio, fin)] que cubren `longitud` residuos con ventanas de como mucho
+    max_len y `solape` residuos compartidos; la última acaba en el final.
+    """
+    if max_len <= 0 or longitud <= max_len:
+        return [(0, longitud)]
+    if not 0 <= solape < max_len:
+        raise ValueError(f"El solape ({solape}) debe ser menor que la ventana ({max_len})")
+    paso = max_len - solape
+    inicios = list(range(0, longitud - max_len, paso)) + [longitud - max_len]
+    return [(i, i + max_len) for i in inicios]
+
+
+def trocear(registros, max_len: int, solape: int):
+    """[(Pieza, secuencia)] de [(id, secuencia)], partiendo las proteínas largas."""
+    piezas = []
+    for orden, (prot, seq) in enumerate(registros):
+        tramos = ventanas(len(seq), max_len, solape)
+        for k, (inicio, fin) in enumerate(tramos):
+            pieza_id = prot if len(tramos) == 1 else f"{prot}{SEPARADOR_VENTANA}{k + 1}"
+            piezas.append((Pieza(pieza_id, prot, orden, k, inicio, fin), seq[inicio:fin]))
+    return piezas
+
+
+def agrupar_por_longitud(longitudes, presupuesto: int):
+    """
+    Índices agrupados en lotes, de más largas a más cortas, de forma que
+    len(lote) * max(longitud del lote) <= presupuesto. Una secuencia que por
+    sí sola supera el presupuesto va en un lote propio.
+    """
+    orden = sorted(range(len(longitudes)), key=lambda i: (-longitudes[i], i))
+    lotes, actual, mas_larga = [], [], 0
+    for i in orden:
+        if actual and (len(actual) + 1) * mas_larga > presupuesto:
+            lotes.append(actual)
+            actual = []
+        if not actual:
+            mas_larga = max(1, longitudes[i])
+        actual.append(i)
+    if actual:
+        lotes.append(actual)
+    return lotes
+
+
+def preparar_lotes(fasta, out_fasta: Path, manifiesto: Path, presupuesto: int,
+                   max_len: int, solape: int, ancho: int = 60):
+    """
+    Escribe las piezas del FASTA ordenadas por lotes de longitud y su
+    manifiesto. Devuelve (n proteínas, n piezas, n lotes).
+    """
+    registros = list(leer_fasta(fasta))
+    piezas = trocear(registros, max_len, solape)
+    lotes = agrupar_por_longitud([p.longitud for p, _ in piezas], presupuesto)
+
+    out_fasta, manifiesto = Path(out_fasta), Path(manifiesto)
+    tmp_fa, tmp_mf = ruta_temporal(out_fasta), ruta_temporal(manifiesto)
+    with tmp_fa.open("w", encoding="utf-8") as fa, tmp_mf.open("w", encoding="utf-8") as mf:
+        mf.write(CABECERA_MANIFIESTO)
+        for n_lote, lote in enumerate(lotes):
+            for i in lote:
+                pieza, seq = piezas[i]
+                fa.write(f">{pieza.id}\n")
+                for k in range(0, len(seq), ancho):
+                    fa.write(seq[k:k + ancho] + "\n")
+                mf.write(f"{pieza.id}\t{pieza.prot}\t{pieza.orden}\t{pieza.ventana}"
+                         f"\t{pieza.inicio}\t{pieza.fin}\t{n_lote}\n")
+    publicar(tmp_fa, out_fasta)
+    publicar(tmp_mf, manifiesto)
+    return len(registros), len(piezas), len(lotes)
+
+
+def leer_manifiesto(manifiesto: Path):
+    """[Pieza] en el orden del manifiesto."""
+    piezas = []
+    with Path(manifiesto).open(encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            pieza_id, prot, orden, ventana, inicio, fin, _ = line.rstrip("\n").split("\t")
+            piezas.append(Pieza(pieza_id, prot, int(orden), int(ventana), int(inicio), int(fin)))
+    return piezas
+
+
+def _proteinas_en_orden(piezas):
+    return [prot for _, prot in sorted({(p.orden, p.prot) for p in piezas})]
+
+
+def recombinar_tabla(tabla: Path, out_path: Path, manifiesto: Path):
+    """
+    Devuelve una tabla por pieza (1ª columna = ID de pieza) a las proteínas
+    originales y a su orden. Reglas:
+      - proteínas sin partir: sus líneas tal cual, en su orden;
+      - proteínas partidas, si TODA la tabla es de "formato lista" (dos
+        columnas, pieza<TAB>elemento, elemento… y una sola línea por pieza,
+        como fantasia_topgo.tsv): una línea con la unión de los elementos de
+        sus ventanas, en orden de primera aparición;
+      - proteínas partidas en cualquier otra tabla (varias columnas o varias
+        líneas por pieza, p.ej. pares proteína-GO con su puntuación): las
+        líneas de todas sus ventanas sin repetir las idénticas. Un mismo
+        término con puntuaciones distintas en dos ventanas queda dos veces:
+        no se elige entre ellas;
+      - líneas cuya 1ª columna no es una pieza (cabeceras, comentarios): al
+        principio, tal cual.
+    """
+    piezas = leer_manifiesto(manifiesto)
+    prot_de = {p.id: p.prot for p in piezas}
+    partidas = {p.prot for p in piezas if p.id != p.prot}
+    cabecera, por_prot, por_pieza = [], {}, {}
+    formato_lista = True
+    with Path(tabla).open(encoding="utf-8") as f:
+        for line in f:
+            pieza_id, sep, resto = line.rstrip("\n").partition("\t")
+            prot = prot_de.get(pieza_id) if sep else None
+            if prot is None:
+                cabecera.append(line)
+                continue
+            por_prot.setdefault(prot, []).append(resto)
+            por_pieza[pieza_id] = por_pieza.get(pieza_id, 0) + 1
+            if "\t" in resto or por_pieza[pieza_id] > 1:
+                formato_lista = False
+
+    out_path = Path(out_path)
+    tmp = ruta_temporal(out_path)
+    with tmp.open("w", encoding="utf-8") as out:
+        out.writelines(cabecera)
+        for prot in _proteinas_en_orden(piezas):
+            lineas = por_prot.get(prot, [])
+            if prot in partidas and formato_lista:
+                elementos = dict.fromkeys(e.strip() for resto in lineas for e in resto.split(",") if e.strip())
+                lineas = [", ".join(elementos)] if lineas else []
+            elif prot in partidas:
+                lineas = list(dict.fromkeys(lineas))
+            for resto in lineas:
+                out.write(f"{prot}\t{resto}\n")
+    publicar(tmp, out_path)
+
+
+def recombinar_directorio(origen: Path, destino: Path, manifiesto: Path,
+                          sufijos=(".tsv", ".txt", ".csv")):
+    """Como expandir_directorio: las tablas se recombinan y el resto se copia."""
+    origen, destino = Path(origen), Path(destino)
+    tmp = ruta_temporal(destino)
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for fichero in origen.rglob("*"):
+        if not fichero.is_file():
+            continue
+        final = tmp / fichero.relative_to(origen)
+        final.parent.mkdir(parents=True, exist_ok=True)
+        if fichero.suffix in sufijos:
+            recombinar_tabla(fichero, final, manifiesto)
+        else:
+            shutil.copy2(fichero, final)
+    publicar(tmp, destino)
+
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Manifiesto por especie de los pasos ya hechos, con huellas de lo que los produjo.
+
+Cada paso guarda una huella (sha1) de:
+  - el contenido de sus ficheros de entrada (FASTA, tablas de hits…);
+  - la identidad de las bases de datos y herramientas (ruta+tamaño+mtime o
+    `diamond version`), sin leer ficheros de cientos de GB;
+  - sus parámetros.
+Un paso está "al día" si su huella coincide con la guardada y sus salidas
+existen con el tamaño registrado. Si cambia una base, un parámetro o una
+entrada, o el paso murió a medias, vuelve a ejecutarse sólo ese paso (y los
+que dependen de él, porque su entrada cambia).
+
+Las salidas se escriben en rutas temporales (ruta_temporal) y se publican con
+un rename atómico al terminar bien.
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+# salidas que ya existían antes de usar manifiestos: con True se adoptan (con
+# aviso) en lugar de recalcular días de trabajo, pero sólo si parecen completas
+# (no vacías y, los ficheros, terminados en salto de línea) y el paso no usa un
+# log como marca de terminado. Por defecto no: una salida sin manifiesto puede
+# ser de una ejecución que murió a medias.
+ADOPTAR_EXISTENTES = False
+
+_huellas = {}
+_versiones = {}
+_cerrojos = {}
+_cerrojo_global = threading.Lock()
+
+
+def huella_fichero(path) -> str:
+    """sha1 del contenido (memorizado por ruta+tamaño+mtime durante la ejecución)."""
+    p = Path(path)
+    st = p.stat()
+    clave = (str(p.resolve()), st.st_size, st.st_mtime_ns)
+    if clave not in _huellas:
+        h = hashlib.sha1()
+        with p.open("rb") as f:
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloque)
+        _huellas[clave] = h.hexdigest()
+    return _huellas[clave]
+
+
+def identidad_fichero(path) -> str:
+    """Identidad barata de ficheros enormes (bases de datos, jars): ruta+tamaño+mtime."""
+    p = Path(path)
+    if not p.exists():
+        return f"{p}:ausente"
+    if p.is_dir():
+        st = p.stat()
+        return f"{p.resolve()}:dir:{st.st_mtime_ns}"
+    st = p.stat()
+    return f"{p.resolve()}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def version_herramienta(cmd) -> str:
+    """Salida de `cmd` (p.ej. ["diamond", "version"]), memorizada; "?" si falla."""
+    clave = tuple(str(c) for c in cmd)
+    if clave not in _versiones:
+        try:
+            res = subprocess.run(clave, capture_output=True, text=True, timeout=60)
+            _versiones[clave] = (res.stdout or res.stderr).strip() or "?"
+        except (OSError, subprocess.SubprocessError):
+            _versiones[clave] = "?"
+    return _versiones[clave]
+
+
+def huella_paso(entradas=None, bases=None, parametros=None, herramientas=None) -> str:
+    """
+    Huella de un paso:
+      entradas: {nombre: ruta} → contenido (sha1);
+      bases: {nombre: ruta} → identidad (ruta+tamaño+mtime);
+      parametros / herramientas: {nombre: valor}.
+    """
+    datos = {
+        "entradas": {k: huella_fichero(v) for k, v in sorted((entradas or {}).items())},
+        "bases": {k: identidad_fichero(v) for k, v in sorted((bases or {}).items())},
+        "parametros": {k: str(v) for k, v in sorted((parametros or {}).items())},
+        "herramientas": {k: str(v) for k, v in sorted((herramientas or {}).items())},
+    }
+    texto = json.dumps(datos, sort_keys=True)
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+
+def ruta_temporal(path) -> Path:
+    """Ruta temporal junto a la final (mismo sistema de ficheros → rename atómico)."""
+    p = Path(path)
+    return p.with_name(f".{p.name}.tmp{os.getpid()}")
+
+
+def publicar(tmp, final):
+    """Mueve la salida temporal a su ruta final de forma atómica."""
+    os.replace(tmp, final)
+
+
+def parece_completa(path: Path) -> bool:
+    """Salida previa adoptable: directorio con algún fichero o fichero no vacío acabado en salto de línea."""
+    path = Path(path)
+    if path.is_dir():
+        return any(f.is_file() and f.stat().st_size > 0 for f in path.rglob("*"))
+    try:
+        with path.open("rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+    except OSError:
+        return False  # no existe o está vacío (seek antes del inicio)
+
+
+def _tamano(path: Path) -> int:
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+    return path.stat().st_size
+
+
+class Manifiesto:
+    """Fichero JSON {paso: {huella, salidas: {ruta: tamaño}, terminado}}."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with _cerrojo_global:
+            self.cerrojo = _cerrojos.setdefault(str(self.path.resolve()), threading.Lock())
+
+    def _leer(self):
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def al_dia(self, paso: str, huella: str, salidas, adoptable: bool = True) -> bool:
+        """
+        True si el paso se hizo con esta huella y sus salidas siguen intactas.
+        adoptable=False para los pasos cuya salida es un log (existe aunque el
+        paso muera): nunca se adoptan sin manifiesto.
+        """
+        salidas = [Path(s) for s in salidas]
+        with self.cerrojo:
+            entrada = self._leer().get(paso)
+        if entrada is None:
+            if ADOPTAR_EXISTENTES and adoptable and salidas and all(parece_completa(s) for s in salidas):
+                print(f"[INFO] {self.path} {paso}: salida previa sin manifiesto, se adopta")
+                self.registrar(paso, huella, salidas)
+                return True
+            return False
+        if entrada.get("huella") != huella:
+            print(f"[INFO] {self.path} {paso}: entradas/parámetros/versiones cambiados, se rehace")
+            return False
+        for s in salidas:
+            if not s.exists() or _tamano(s) != entrada.get("salidas", {}).get(str(s)):
+                print(f"[INFO] {self.path} {paso}: salida ausente o incompleta ({s}), se rehace")
+                return False
+        return True
+
+    def registrado(self, paso: str, salidas) -> bool:
+        """
+        True si el paso consta como hecho y sus salidas siguen como se
+        registraron (sin comparar huella): para quien no puede recalcularla.
+        """
+        with self.cerrojo:
+            entrada = self._leer().get(paso)
+        if entrada is None:
+            return False
+        registradas = entrada.get("salidas", {})
+        return all(Path(s).exists() and _tamano(Path(s)) == registradas.get(str(Path(s))) for s in salidas)
+
+    def huella_de(self, paso: str) -> str:
+        """Huella registrada de un paso ("" si no está): sirve para encadenar pasos."""
+        with self.cerrojo:
+            return self._leer().get(paso, {}).get("huella", "")
+
+    def registrar(self, paso: str, huella: str, salidas):
+        """Marca el paso como hecho (sólo tras publicar sus salidas)."""
+        with self.cerrojo:
+            datos = self._leer()
+            datos[paso] = {
+                "huella": huella,
+                "salidas": {str(Path(s)): _tamano(Path(s)) for s in salidas},
+                "terminado": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = ruta_temporal(self.path)
+            tmp.write_text(json.dumps(datos, indent=1, sort_keys=True), encoding="utf-8")
+            publicar(tmp, self.path)
+
+    def olvidar(self, paso: str):
+        with self.cerrojo:
+            datos = self._leer()
+            if datos.pop(paso, None) is not None:
+                tmp = ruta_temporal(self.path)
+                tmp.write_text(json.dumps(datos, indent=1, sort_keys=True), encoding="utf-8")
+                publicar(tmp, self.path)
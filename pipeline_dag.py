@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Uso:
+1) Edita la sección CONFIG de abajo y la de cada script (annotation_with_diamond.py,
+   FANTASIA4.py / annotation_FANTASIA.py): rutas de bases, OUTDIR, etc.
+2) Ejecuta:  python pipeline_dag.py
+3) Por especie se lanzan como tareas de un mismo grafo:
+     limpieza → DIAMOND DB1 → DIAMOND DB2 → AHRD                  (CPU)
+     limpieza → FANTASIA4                                          (GPU)
+       o bien  primer paso (CPU) → GoPredSim (GPU) → TopGO (CPU)
+   y al final la comparación de analysis.py con todas las especies.
+   Las tareas CPU y GPU de especies distintas se solapan.
+"""
+
+import asyncio
+import os
+from pathlib import Path
+
+import annotation_with_diamond as homologia
+import FANTASIA4 as fantasia4
+import annotation_FANTASIA as gopredsim
+from dag import Tarea, ejecutar_dag
+from device_pool import leer_dispositivos
+from manifest import Manifiesto
+
+
+# ========================= CONFIGURACIÓN =====================================
+TSV = "/data/users/sgarjua/ann_diamond_test/species.tsv"   # especie<TAB>ruta_fasta
+EMBEDDING = "fantasia4"     # "fantasia4" (FANTASIA4.py) o "gopredsim" (annotation_FANTASIA.py)
+CPUS = os.cpu_count() or 1  # núcleos del pool CPU
+DEVICES = ["cuda:0"]        # pool GPU (FANTASIA_DEVICES="cuda:0,cuda:1" lo sobreescribe)
+AHRD_CPUS = 2               # núcleos que se reservan para cada JVM de AHRD
+FOF_COMPARACION = "/data/users/sgarjua/fof_analisis_resultados.tsv"  # TSV que se genera para analysis.py
+COMPARAR = True             # lanzar analysis.py al final (la tabla de FANTASIA4 es FANTASIA4.RESULTADO_TOPGO)
+# =============================================================================
+
+
+def _exigir(ok, paso: str, manifiesto=None, registro: str = "", salidas=()):
+    """
+    Las funciones de los scripts avisan con [FAIL] y devuelven False: aquí se
+    corta. Con `manifiesto`, el paso además tiene que constar en él con sus
+    salidas intactas: que el fichero exista no basta (puede ser de una
+    ejecución anterior).
+    """
+    if not ok:
+        raise RuntimeError(f"{paso}: falló")
+    if manifiesto is not None and not manifiesto.registrado(registro, salidas):
+        raise RuntimeError(f"{paso}: {registro} no consta como hecho en {manifiesto.path}")
+
+
+def tareas_especie(species: str, fasta: str, cpus_diamond: int):
+    """Tareas de una especie y las rutas de sus resultados finales.
+
+    La ruta del resultado de FANTASIA4 sólo se conoce al terminar su tarea: la fila
+    se devuelve como lista y esa tarea rellena su último elemento.
+    """
+    emb = fantasia4 if EMBEDDING == "fantasia4" else gopredsim
+    outdir = Path(homologia.OUTDIR)
+    clean_fasta = emb.OUTDIR / species / f"{Path(fasta).stem}.clean.faa"
+    sprot = outdir / f"{species}.{Path(homologia.DB1).stem}.o6.txt"
+    trembl = outdir / f"{species}.{Path(homologia.DB2).stem}.o6.txt"
+    ahrd_out = outdir / f"{species}.proteins.funct_ahrd.tsv"
+    manifiesto = homologia.manifiesto_especie(outdir, species)
+
+    def limpiar():
+        clean_fasta.parent.mkdir(parents=True, exist_ok=True)
+        _exigir(emb.fasta_cleaner(fasta, clean_fasta), "limpieza", Manifiesto(clean_fasta.parent / "manifest.json"),
+                f"limpieza_{clean_fasta.name}", [clean_fasta])
+
+    def diamond_db1():
+        ok = homologia.buscar_diamond(species, str(clean_fasta), homologia.DB1, outdir, threads=cpus_diamond)
+        _exigir(ok, "DIAMOND DB1", manifiesto, f"diamond_{Path(homologia.DB1).stem}", [sprot])
+
+    def diamond_db2():
+        ok = homologia.diamond_db2(species, str(clean_fasta), outdir, threads=cpus_diamond)
+        _exigir(ok, "DIAMOND DB2", manifiesto, f"diamond_{Path(homologia.DB2).stem}", [trembl])
+
+    def ahrd():
+        _exigir(homologia.ahrd_especie(species, str(clean_fasta), outdir), "AHRD", manifiesto, "ahrd", [ahrd_out])
+
+    t = lambda paso: f"{paso}:{species}"
+    tareas = [
+        Tarea(t("limpieza"), limpiar),
+        Tarea(t("diamond_db1"), diamond_db1, [t("limpieza")], cpus=cpus_diamond),
+        Tarea(t("diamond_db2"), diamond_db2, [t("diamond_db1")], cpus=cpus_diamond),
+        Tarea(t("ahrd"), ahrd, [t("diamond_db2")], cpus=AHRD_CPUS),
+    ]
+
+    if EMBEDDING == "fantasia4":
+        fantasia_run = fantasia4.OUTDIR / species / "fantasia4_run"
+        resultado = None
+
+        def fantasia(device):
+            fantasia_run.mkdir(parents=True, exist_ok=True)
+            _exigir(fantasia4.run_fantasia(str(clean_fasta), fantasia_run, device), "FANTASIA4")
+            # aquí sí se puede recalcular la huella: el manifiesto tiene que estar al día
+            if not fantasia4.fantasia_al_dia(str(clean_fasta), fantasia_run):
+                raise RuntimeError(f"FANTASIA4: {fantasia_run / 'outputs'} no está al día en su manifiesto")
+            tabla = fantasia4.tabla_topgo(fantasia_run)
+            if tabla is None:
+                raise RuntimeError(f"FANTASIA4: no encuentro la tabla TopGO en {fantasia_run / 'outputs'}")
+            fila[2] = tabla
+
+        tareas.append(Tarea(t("fantasia"), fantasia, [t("limpieza")], gpu=True))
+        ultima = t("fantasia")
+    else:
+        fantasia_run = gopredsim.OUTDIR / species / "fantasia_run"
+        manifiesto_run = Manifiesto(fantasia_run / "manifest.json")
+        prefix = gopredsim.prefijo_especie(species)
+        resultado = fantasia_run / f"{Path(fasta).stem}.FANTASIA_TopGO.txt"
+
+        def primer_paso():
+            fantasia_run.mkdir(parents=True, exist_ok=True)
+            _exigir(gopredsim.firt_step(species, clean_fasta, prefix, fantasia_run), "GoPredSim prep",
+                    manifiesto_run, "primer_paso", [gopredsim.OUTDIR / species / f"{clean_fasta.stem}_cdhit100.pep"])
+
+        def gpsm(device):
+            _exigir(asyncio.run(gopredsim.second_step(prefix, fantasia_run, device)), "GoPredSim",
+                    manifiesto_run, "gopredsim", [fantasia_run / f"{prefix}.log"])
+
+        def topgo():
+            _exigir(gopredsim.topgo_step(prefix, fantasia_run, fasta), "TopGO",
+                    manifiesto_run, f"topgo_{resultado.name}", [resultado])
+
+        tareas += [
+            Tarea(t("gpsm_prep"), primer_paso, [t("limpieza")]),
+            Tarea(t("gpsm"), gpsm, [t("gpsm_prep")], gpu=True),
+            Tarea(t("topgo"), topgo, [t("gpsm")]),
+        ]
+        ultima = t("topgo")
+
+    fila = [species, ahrd_out, resultado]
+    return tareas, [t("ahrd"), ultima], fila
+
+
+def comparar(filas):
+    """Escribe el TSV de entrada de analysis.py y lanza la comparación.
+
+    Se llama desde el hilo principal con el grafo ya terminado: analysis.main()
+    abre un ProcessPoolExecutor y hacer fork con los hilos del grafo vivos puede
+    dejar bloqueado al hijo.
+    """
+    import analysis  # matplotlib sólo hace falta en este paso
+
+    fof = Path(FOF_COMPARACION)
+    with fof.open("w", encoding="utf-8") as f:
+        for species, hom, fan in filas:
+            f.write(f"{species}\t{hom}\t{fan}\n")
+    analysis.TSV = str(fof)
+    analysis.main()
+
+
+# =============================================================================
+def main():
+    tsv_path = Path(TSV)
+    if not tsv_path.exists():
+        print(f"[ERROR] No encuentro el TSV: {tsv_path}")
+        return
+    Path(homologia.OUTDIR).mkdir(parents=True, exist_ok=True)
+
+    especies = homologia.leer_especies(tsv_path)
+    cpus_diamond = homologia.threads_por_trabajo(CPUS, min(homologia.MAX_ESPECIES_PARALELO, max(1, len(especies))))
+
+    tareas, finales, filas = [], [], []
+    for species, fasta in especies:
+        ts, fin, fila = tareas_especie(species, fasta, cpus_diamond)
+        tareas += ts
+        finales += fin
+        filas.append(fila)
+
+    estado, tiempos = ejecutar_dag(tareas, CPUS, leer_dispositivos(DEVICES))
+    fallos = [n for n, e in estado.items() if e != "ok"]
+    print(f"\n{len(estado) - len(fallos)}/{len(estado)} tareas completadas; "
+          f"suma de tiempos {sum(tiempos.values()):.1f} s")
+    for nombre in fallos:
+        print(f"  [{estado[nombre].upper()}] {nombre}")
+
+    if COMPARAR and filas:
+        if any(estado.get(n) != "ok" for n in finales):
+            print("[WARN] Comparación omitida: faltan resultados finales")
+        else:
+            comparar(filas)
+
+    print("\nTodo terminado. ✔")
+
+if __name__ == "__main__":
+    main()
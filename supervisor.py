@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Supervisor asíncrono de procesos externos (sustituye a screen + sondeo).
+
+Lanza el comando como proceso hijo con su salida volcada directamente al log,
+espera con asyncio (sin sondear) y devuelve el código de salida real en cuanto
+el hijo termina. Mientras tanto el bucle de eventos puede atender otros pasos
+(p.ej. el TopGO de otra especie).
+
+La espera se hace con os.wait4 en un hilo (instrumentation.esperar) para que
+el paso quede en el informe de ejecución con su CPU y RSS máximo. El comando
+pasa por el ejecutor activo (executor.py), así que con "lotes" el hijo es un
+trabajo de la cola y lo que se espera (y se cancela) es ese trabajo.
+"""
+
+import asyncio
+import os
+import subprocess
+from pathlib import Path
+
+from executor import ejecutor_actual
+from instrumentation import registrar
+
+
+def entorno_con(asignaciones: str = ""):
+    """
+    Copia de os.environ con asignaciones estilo shell añadidas, p.ej.
+    "CUDA_VISIBLE_DEVICES=1 OMP_NUM_THREADS=4".
+    """
+    env = dict(os.environ)
+    for asignacion in asignaciones.split():
+        clave, _, valor = asignacion.partition("=")
+        if clave:
+            env[clave] = valor
+    return env
+
+
+async def ejecutar_async(cmd, log_path: Path, cwd=None, env=None, paso=None, especie=None,
+                         entradas=(), salidas=(), n_proteinas=None, recursos=None) -> int:
+    """
+    Ejecuta `cmd` (lista) escribiendo stdout+stderr en log_path y devuelve
+    su código de salida. Si la tarea se cancela, termina el proceso hijo.
+    El paso (por defecto, el nombre del ejecutable) se registra en el informe;
+    `recursos` (executor.Recursos) es lo que pide al ejecutor.
+    """
+    paso = paso or Path(str(cmd[0])).name
+    log_path = Path(log_path)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    ejecutor = ejecutor_actual()
+    with log_path.open("wb") as log:
+        # enviar puede bloquear (hasta que haya recursos libres): en un hilo
+        envio = asyncio.ensure_future(asyncio.to_thread(
+            ejecutor.enviar,
+            cmd,
+            recursos,
+            f"{paso}.{especie}" if especie else paso,
+            cwd=str(cwd) if cwd else None,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,  # grupo propio: se puede matar con sus hijos
+        ))
+        espera = None
+        try:
+            trabajo = await asyncio.shield(envio)
+            espera = asyncio.ensure_future(asyncio.to_thread(ejecutor.esperar, trabajo))
+            medida = await asyncio.shield(espera)
+        except asyncio.CancelledError:
+            trabajo = await envio
+            ejecutor.cancelar(trabajo)
+            medida = await (espera or asyncio.to_thread(ejecutor.esperar, trabajo))
+            registrar(paso, especie, estado="cancelado", cmd=cmd, entradas=entradas,
+                      n_proteinas=n_proteinas, **medida)
+            raise
+    registrar(paso, especie, estado="ok" if medida["codigo"] == 0 else "fail", cmd=cmd,
+              entradas=entradas, salidas=salidas or [log_path], n_proteinas=n_proteinas, **medida)
+    return medida["codigo"]
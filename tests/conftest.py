@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+
+# los módulos del repositorio están en la raíz (sin paquete)
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+"""analysis.py: especies sin GOs en un lado, Venn guardado sin ventana y
+misma tabla que la versión anterior, en memoria y en streaming."""
+
+import csv
+import io
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("matplotlib_venn")
+import matplotlib  # noqa: E402
+
+matplotlib.use("Agg")
+
+import analysis  # noqa: E402
+from analysis import ResultadoEspecie  # noqa: E402
+
+
+def test_solape_sin_gos_en_un_lado():
+    res = ResultadoEspecie("sp", h=(10, 20, 8, 2, 2.0, 80.0), f=(10, 0, 0, 10, 0.0, 0.0), total_solapados=0)
+    assert (res.solape_h, res.solape_f) == (0.0, 0.0)
+    assert res.fila()[-1] == "0.000 | 0.000"
+    total = analysis.calc_total([res, ResultadoEspecie("sp2", h=(5, 4, 4, 1, 1.0, 80.0),
+                                                       f=(5, 8, 5, 0, 1.6, 100.0), total_solapados=2)])
+    assert total[0][-1] == "25.0 | 12.5"
+
+
+def test_venn_se_guarda(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis, "OUTFILE", tmp_path / "tabla.tsv")
+    venn = analysis.diagrama_venn(10, 8, 3)
+    assert venn == tmp_path / "tabla.venn.png" and venn.stat().st_size > 0
+
+
+# fixture ======================================================================
+
+def escribir_resultados(path, rng, n_prot, prefijo_go):
+    """
+    Resultados desordenados, con proteínas repetidas (a veces la última línea
+    sin GO), GO repetidos en una línea, cabecera y comentarios.
+    """
+    lineas = []
+    for i in range(n_prot):
+        for _ in range(rng.choice((1, 1, 1, 2, 3))):
+            if rng.random() < 0.2:
+                gos = ""
+            else:
+                gos = ", ".join(f"GO:{prefijo_go}{rng.randrange(12):03d}" for _ in range(rng.randrange(1, 6)))
+            lineas.append(f"prot{i:03d}\tdesc\t{gos}\n")
+    rng.shuffle(lineas)
+    path.write_text("Protein-Accession\tDescription\tGO\n# comentario\n" + "".join(lineas), encoding="utf-8")
+    return path
+
+
+def especies_fixture(tmp_path, n_especies=7, n_prot=40, semilla=3):
+    import random
+    rng = random.Random(semilla)
+    especies = []
+    for e in range(n_especies):
+        hom = escribir_resultados(tmp_path / f"sp{e}.hom.tsv", rng, n_prot + 3 * e, "0000")
+        fan = escribir_resultados(tmp_path / f"sp{e}.fan.tsv", rng, n_prot + 5 * e, "0000")
+        especies.append((f"sp{e}", hom, fan))
+    return especies
+
+
+# referencia: analysis.py antes de pasar a enteros/CSR y a la tabla en memoria
+
+def calc_stats_base(file, resultados, destino):
+    id_sin_go = gos_totales = protes = 0
+    for line in file:
+        line = line.strip()
+        parts = line.split("\t")
+        if not line or line.startswith("#") or line.startswith("Protein-Accession"):
+            continue
+        prot = parts[0].strip() if parts else ""
+        if not prot:
+            continue
+        protes += 1
+        if prot not in resultados:
+            resultados[prot] = [[], []]
+        gos_field = parts[-1].strip() if parts else ""
+        if "GO:" in gos_field:
+            gos = [g.strip() for g in gos_field.split(",") if g.strip()]
+            resultados[prot][destino] = gos
+            gos_totales += len(gos)
+        else:
+            id_sin_go += 1
+    id_con_go = protes - id_sin_go
+    gos_por_prote = (gos_totales / protes) if protes else 0.0
+    cobertura = (id_con_go / protes) * 100
+    return protes, gos_totales, id_con_go, id_sin_go, gos_por_prote, cobertura
+
+
+def fila_base(species, homologia, fantasia):
+    resultados = {}
+    with homologia.open(encoding="utf-8") as hom:
+        protes_h, gos_totales_h, id_con_go_h, id_sin_go_h, gos_por_prote_h, cobertura_h = calc_stats_base(hom, resultados, 0)
+    with fantasia.open(encoding="utf-8") as fan:
+        protes_f, gos_totales_f, id_con_go_f, id_sin_go_f, gos_por_prote_f, cobertura_f = calc_stats_base(fan, resultados, 1)
+    total_solapados = sum(len(set(h) & set(f)) for h, f in resultados.values())
+    solape_h = (total_solapados / gos_totales_h) * 100
+    solape_f = (total_solapados / gos_totales_f) * 100
+    return [
+        species,
+        f"{protes_h} | {protes_f}",
+        f"{id_con_go_h} | {id_con_go_f}",
+        f"{id_sin_go_h} | {id_sin_go_f}",
+        f"{cobertura_h:.3f} | {cobertura_f:.3f}",
+        f"{gos_por_prote_h:.3f} | {gos_por_prote_f:.3f}",
+        f"{gos_totales_h} | {gos_totales_f}",
+        total_solapados,
+        f"{solape_h:.3f} | {solape_f:.3f}"
+    ]
+
+
+def calc_total_base(outfile):
+    """La fila MEDIA se calculaba releyendo el TSV escrito (valores ya en .3f)."""
+    sumas = [0] * 15
+    n = 0
+    with outfile.open(encoding="utf-8") as tsv:
+        for line in tsv:
+            line = line.strip()
+            if line.startswith("Especie"):
+                continue
+            parts = line.split("\t")
+            n += 1
+            for col, (i, tipo) in enumerate(((1, int), (2, int), (3, int), (4, float), (5, float), (6, int))):
+                h, f = parts[i].split(" | ")
+                sumas[2 * col] += tipo(h)
+                sumas[2 * col + 1] += tipo(f)
+            sumas[12] += int(parts[7])
+            h, f = parts[8].split(" | ")
+            sumas[13] += float(h)
+            sumas[14] += float(f)
+    protes_h, protes_f = sumas[0], sumas[1]
+    m = [s / n for s in sumas]
+    return [
+        "MEDIA",
+        f"{protes_h} | {protes_f}",
+        f"{m[2]:.1f} | {m[3]:.1f}",
+        f"{m[4]:.1f} | {m[5]:.1f}",
+        f"{m[6]:.1f} | {m[7]:.1f}",
+        f"{m[8]:.1f} | {m[9]:.1f}",
+        f"{m[10]:.1f} | {m[11]:.1f}",
+        f"{m[12]:.1f}",
+        f"{m[13]:.1f} | {m[14]:.1f}"
+    ]
+
+
+def como_tsv(filas):
+    buf = io.StringIO()
+    csv.writer(buf, delimiter="\t").writerows(filas)
+    return buf.getvalue().splitlines()
+
+
+def test_tabla_igual_que_la_version_anterior(tmp_path):
+    especies = especies_fixture(tmp_path)
+
+    filas = [fila_base(*e) for e in especies]
+    tabla_base = tmp_path / "base.tsv"
+    with tabla_base.open("w", newline="", encoding="utf-8") as tsv:
+        w = csv.writer(tsv, delimiter="\t")
+        w.writerow(["Especie", "..."])
+        w.writerows(filas)
+    esperado = como_tsv(filas + [calc_total_base(tabla_base)])
+
+    resultados = [analysis.analizar_especie(*e) for e in especies]
+    obtenido = como_tsv([r.fila() for r in resultados] + [analysis.calc_total(resultados)[0]])
+    assert obtenido == esperado
+
+
+@pytest.mark.parametrize("max_lineas", [1_000_000, 7])
+def test_streaming_igual_que_en_memoria(tmp_path, monkeypatch, max_lineas):
+    # prot_b: la última línea sin GO (vale la anterior); prot_a repetida y
+    # todo desordenado
+    hom = tmp_path / "a.hom.tsv"
+    hom.write_text("Protein-Accession\tDescription\tGO\n"
+                   "prot_c\tx\tGO:0000003\n"
+                   "prot_b\tx\tGO:0000001, GO:0000002\n"
+                   "prot_a\tx\tGO:0000009\n"
+                   "prot_b\tx\t\n"
+                   "prot_a\tx\tGO:0000001, GO:0000001\n", encoding="utf-8")
+    fan = tmp_path / "a.fan.tsv"
+    fan.write_text("prot_b\tx\tGO:0000002\n"
+                   "prot_d\tx\tGO:0000003\n"
+                   "prot_a\tx\tGO:0000001\n"
+                   "prot_c\tx\t\n", encoding="utf-8")
+    especies = [("a", hom, fan)] + especies_fixture(tmp_path, n_especies=3)
+
+    monkeypatch.setattr(analysis, "MAX_LINEAS_MEMORIA", max_lineas)
+    monkeypatch.setattr(analysis, "DIR_TEMPORAL", str(tmp_path))
+    monkeypatch.setattr(analysis, "MODO_STREAMING", False)
+    en_memoria = [analysis.analizar_especie(*e) for e in especies]
+    monkeypatch.setattr(analysis, "MODO_STREAMING", True)
+    streaming = [analysis.analizar_especie(*e) for e in especies]
+
+    assert streaming == en_memoria
+    assert en_memoria[0].total_solapados == 2   # prot_a: GO:0000001, prot_b: GO:0000002
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""Pool de dispositivos: préstamo en exclusiva, plazas cpu y devolución aunque falle el paso."""
+
+import threading
+
+import pytest
+
+from device_pool import PoolDispositivos, entorno_dispositivo, leer_dispositivos
+
+
+def test_cada_dispositivo_en_exclusiva():
+    pool = PoolDispositivos(["cuda:0", "cuda:1"])
+    assert pool.capacidad == 2
+    assert {pool.adquirir(), pool.adquirir()} == {"cuda:0", "cuda:1"}
+    assert pool.libres_gpu == []
+
+
+def test_espera_hasta_que_se_libera():
+    pool = PoolDispositivos(["cuda:0"])
+    device = pool.adquirir()
+    recibidos = []
+    hilo = threading.Thread(target=lambda: recibidos.append(pool.adquirir()))
+    hilo.start()
+    hilo.join(0.2)
+    assert hilo.is_alive() and not recibidos  # en cola mientras la GPU está prestada
+    pool.liberar(device)
+    hilo.join(5)
+    assert recibidos == ["cuda:0"]
+
+
+def test_reservar_devuelve_el_dispositivo_si_el_paso_falla():
+    pool = PoolDispositivos(["cuda:0"], cpu_workers=1, cpu_max_seqs=10)
+    with pytest.raises(RuntimeError):
+        with pool.reservar() as device:
+            assert device == "cuda:0"
+            raise RuntimeError("fallo del paso")
+    with pytest.raises(RuntimeError):
+        with pool.reservar(n_seqs=5):
+            with pool.reservar(n_seqs=5) as device:
+                assert device == "cpu"
+                raise RuntimeError("fallo del paso")
+    assert pool.libres_gpu == ["cuda:0"] and pool.libres_cpu == ["cpu"]
+
+
+def test_plaza_cpu_solo_para_proteomas_pequenos():
+    pool = PoolDispositivos(["cuda:0"], cpu_workers=1, cpu_max_seqs=100)
+    assert pool.adquirir(n_seqs=5000) == "cuda:0"
+    assert pool.adquirir(n_seqs=50) == "cpu"
+
+    grande = []
+    hilo = threading.Thread(target=lambda: grande.append(pool.adquirir(n_seqs=5000)))
+    hilo.start()
+    pool.liberar("cpu")  # una plaza cpu libre no sirve a un proteoma grande
+    hilo.join(0.2)
+    assert hilo.is_alive()
+    pool.liberar("cuda:0")
+    hilo.join(5)
+    assert grande == ["cuda:0"]
+
+
+def test_pool_solo_cpu_y_pool_vacio():
+    pool = PoolDispositivos([], cpu_workers=2)
+    assert pool.adquirir() == pool.adquirir(n_seqs=10 ** 6) == "cpu"
+    with pytest.raises(ValueError):
+        PoolDispositivos([])
+
+
+def test_dispositivos_desde_el_entorno(monkeypatch):
+    monkeypatch.setenv("FANTASIA_DEVICES", "cuda:2, cuda:3,")
+    assert leer_dispositivos(["cuda:0"]) == ["cuda:2", "cuda:3"]
+    monkeypatch.delenv("FANTASIA_DEVICES")
+    assert leer_dispositivos(["cuda:0"]) == ["cuda:0"]
+    assert entorno_dispositivo("cuda:1") == "CUDA_VISIBLE_DEVICES=1"
+    assert entorno_dispositivo("cpu") == "CUDA_VISIBLE_DEVICES="
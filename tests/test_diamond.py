@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+"""annotation_with_diamond: caché de hits y shards dan la misma tabla que una búsqueda directa."""
+
+import os
+from pathlib import Path
+
+import pytest
+
+import annotation_with_diamond as awd
+import instrumentation
+
+FAKE_TOOLS = Path(__file__).resolve().parent.parent / "bench" / "fake_tools"
+
+
+@pytest.fixture
+def entorno(tmp_path, monkeypatch):
+    """DIAMOND de pega en el PATH, una DB vacía y un FASTA con secuencias repetidas."""
+    monkeypatch.setenv("PATH", f"{FAKE_TOOLS}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(instrumentation, "INFORME", tmp_path / "informe.jsonl")
+    monkeypatch.setattr(awd, "CACHE_DIAMOND", str(tmp_path / "cache.sqlite"))
+    db = tmp_path / "uniprot_sprot_test.dmnd"
+    db.write_bytes(b"")
+    seqs = ["MKVLAAGIVGLLLA", "ACDEFGHIKLMNPQRSTVWY" * 4, "MSTNPKPQRKTKRNTNRRPQ", "GGGSGGGS", "MKKLLPTAAAGLLLLAAQPAMA"]
+    fasta = tmp_path / "sp.faa"
+    with fasta.open("w", encoding="utf-8") as f:
+        for i in range(40):
+            f.write(f">p{i:02d} desc\n{seqs[i % len(seqs)] + 'W' * (i % 7)}\n")
+    return tmp_path, str(fasta), str(db)
+
+
+def buscar(funcion, base, species, fasta, db, **kw):
+    outdir = base / species
+    outdir.mkdir()
+    assert funcion(species, fasta, db, outdir, **kw)
+    return (outdir / f"{species}.{Path(db).stem}.o6.txt").read_text(encoding="utf-8")
+
+
+def test_cache_acierto_igual_que_fallo(entorno, monkeypatch):
+    base, fasta, db = entorno
+    directa = buscar(awd.run_diamond, base, "directa", fasta, db)
+    assert directa
+
+    fallo = buscar(awd.run_diamond_cacheado, base, "fallo", fasta, db)
+    # segunda vez: todo de la caché, sin lanzar DIAMOND
+    monkeypatch.setattr(awd, "run_diamond", lambda *a, **kw: pytest.fail("DIAMOND con la caché llena"))
+    acierto = buscar(awd.run_diamond_cacheado, base, "acierto", fasta, db)
+    assert fallo == directa
+    assert acierto == directa
+
+
+def test_shards_igual_que_una_ejecucion(entorno):
+    base, fasta, db = entorno
+    directa = buscar(awd.run_diamond, base, "directa", fasta, db)
+    por_shards = buscar(awd.run_diamond_shards, base, "shards", fasta, db, n=3)
+    assert len(list((base / "shards" / "_shards" / "shards.uniprot_sprot_test").glob("shard_*.faa"))) == 3
+    assert por_shards == directa
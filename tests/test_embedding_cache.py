@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""Almacén de embeddings: ida y vuelta, reutilización e invalidación (en CPU, con el embebedor "prueba")."""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from embedding_cache import CacheEmbeddings, EMBEBEDORES, escribir_embeddings  # noqa: E402
+
+PRUEBA = EMBEBEDORES["prueba"]
+SECUENCIAS = ["MKTAYIAKQR", "MSSHHHHHHG", "MKTAYIAKQR", "MALWMRLLPLLALLALWGPD"]
+
+
+class Contador:
+    """Embebedor "prueba" que cuenta las secuencias que se le piden."""
+
+    def __init__(self):
+        self.pedidas = []
+
+    def __call__(self, secuencias, device="cpu"):
+        self.pedidas.extend(secuencias)
+        return PRUEBA.funcion(secuencias, device)
+
+
+def abrir(directorio, max_bytes=10 ** 9):
+    return CacheEmbeddings(directorio, PRUEBA.modelo, PRUEBA.dim, max_bytes)
+
+
+def test_ida_y_vuelta_persistente(tmp_path):
+    vectores = {"a": np.arange(PRUEBA.dim, dtype=np.float32), "b": np.ones(PRUEBA.dim, dtype=np.float32)}
+    cache = abrir(tmp_path)
+    cache.guardar(vectores)
+    cache.close()
+
+    cache = abrir(tmp_path)  # otra instancia: lo leído sale del disco
+    leidos = cache.obtener(["a", "b", "c"])
+    cache.close()
+    assert set(leidos) == {"a", "b"}
+    for clave, vector in vectores.items():
+        np.testing.assert_array_equal(leidos[clave], vector)
+
+
+def test_embeddings_en_orden_y_reutilizados(tmp_path):
+    contador = Contador()
+    cache = abrir(tmp_path)
+    matriz, nuevas = cache.embeddings(SECUENCIAS, contador)
+    assert nuevas == 3  # la repetida se calcula una vez
+    np.testing.assert_allclose(matriz, PRUEBA.funcion(SECUENCIAS))
+
+    contador.pedidas.clear()
+    matriz2, nuevas2 = cache.embeddings(SECUENCIAS, contador)
+    cache.close()
+    assert nuevas2 == 0 and contador.pedidas == []
+    np.testing.assert_array_equal(matriz, matriz2)
+
+
+def test_cambio_de_secuencia_invalida_solo_esa(tmp_path):
+    contador = Contador()
+    cache = abrir(tmp_path)
+    cache.embeddings(SECUENCIAS, contador)
+    contador.pedidas.clear()
+
+    cambiadas = list(SECUENCIAS)
+    cambiadas[1] = "MSSHHHHHHA"  # un residuo distinto
+    matriz, nuevas = cache.embeddings(cambiadas, contador)
+    cache.close()
+    assert nuevas == 1 and contador.pedidas == ["MSSHHHHHHA"]
+    np.testing.assert_allclose(matriz[1], PRUEBA.funcion(["MSSHHHHHHA"])[0])
+
+
+def test_modelo_con_otra_dimension_se_rechaza(tmp_path):
+    abrir(tmp_path).close()
+    with pytest.raises(ValueError):
+        CacheEmbeddings(tmp_path, PRUEBA.modelo, PRUEBA.dim + 1, 10 ** 9)
+
+
+def test_recorte_libera_filas_que_se_reutilizan(tmp_path):
+    cache = abrir(tmp_path, max_bytes=0)
+    cache.guardar({"a": np.zeros(PRUEBA.dim, dtype=np.float32)})
+    assert cache.presentes(["a"]) == 0  # expulsada al superar el máximo
+    cache.guardar({"b": np.ones(PRUEBA.dim, dtype=np.float32)})
+    tamano = cache.datos.stat().st_size
+    cache.close()
+    assert tamano == PRUEBA.dim * 4  # "b" ocupa la fila que dejó "a"
+
+
+def test_escribir_embeddings(tmp_path):
+    matriz = PRUEBA.funcion(SECUENCIAS)
+    escribir_embeddings(["p1", "p2", "p3", "p4"], matriz, tmp_path / "emb.npy")
+    np.testing.assert_array_equal(np.load(tmp_path / "emb.npy"), matriz)
+    assert (tmp_path / "emb.ids.txt").read_text().split() == ["p1", "p2", "p3", "p4"]
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+"""Ejecutores: límite de recursos en local y envío, sondeo y cancelación con la cola de pega de bench/fake_tools."""
+
+import os
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+import executor
+from executor import EjecutorLocal, EjecutorLotes, Recursos, memoria_gb
+
+FAKES = Path(__file__).resolve().parent.parent / "bench" / "fake_tools"
+PYTHON = sys.executable
+
+
+def esperar_hasta(condicion, segundos=10):
+    limite = time.monotonic() + segundos
+    while not condicion():
+        assert time.monotonic() < limite, "tiempo agotado"
+        time.sleep(0.02)
+
+
+# local ========================================================================
+def test_memoria_estilo_xmx():
+    assert memoria_gb("2g") == 2 and memoria_gb("512m") == 0.5 and memoria_gb("1t") == 1024
+    with pytest.raises(ValueError):
+        memoria_gb("mucha")
+
+
+def test_local_espera_a_que_quepan_los_recursos():
+    ejecutor = EjecutorLocal(cpus=2, mem_gb=8)
+    primero = ejecutor.enviar([PYTHON, "-c", "import time; time.sleep(0.3)"], Recursos(cpus=2, mem_gb=1))
+    enviados = []
+    hilo = threading.Thread(target=lambda: enviados.append(
+        ejecutor.enviar([PYTHON, "-c", "pass"], Recursos(cpus=1, mem_gb=1))))
+    hilo.start()
+    hilo.join(0.1)
+    assert hilo.is_alive()  # no quedan núcleos
+    assert ejecutor.esperar(primero)["codigo"] == 0
+    hilo.join(5)
+    assert ejecutor.esperar(enviados[0])["codigo"] == 0
+    assert (ejecutor.cpus_libres, ejecutor.mem_libre) == (2, 8)
+
+
+def test_local_un_paso_mayor_que_la_maquina_entra_solo():
+    ejecutor = EjecutorLocal(cpus=2, mem_gb=4)
+    trabajo = ejecutor.enviar([PYTHON, "-c", "pass"], Recursos(cpus=16, mem_gb=64))
+    assert (ejecutor.cpus_libres, ejecutor.mem_libre) == (0, 0)
+    assert ejecutor.esperar(trabajo)["codigo"] == 0
+    assert (ejecutor.cpus_libres, ejecutor.mem_libre) == (2, 4)
+
+
+def test_local_libera_si_no_se_puede_lanzar():
+    ejecutor = EjecutorLocal(cpus=2, mem_gb=4)
+    with pytest.raises(OSError):
+        ejecutor.enviar(["/no/existe/herramienta"], Recursos(cpus=2))
+    assert ejecutor.cpus_libres == 2
+
+
+# cola de pega =================================================================
+@pytest.fixture
+def cola(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", f"{FAKES}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setenv("COLA_FALSA_DIR", str(tmp_path / "cola"))
+    monkeypatch.setenv("COLA_FALSA_ESPERA", "0")
+    return EjecutorLotes(directorio=tmp_path / "trabajos", cola="gpu", opciones="--account=lab",
+                         enviar="sbatch --parsable", consultar="squeue -h -o %T -j", cancelar="scancel",
+                         intervalo=0.05)
+
+
+def test_envio_y_sondeo(cola, tmp_path):
+    trabajo = cola.enviar([PYTHON, "-c", "print('hola')"], Recursos(cpus=2, mem_gb=1.5, gpus=1, horas=0.5),
+                          nombre="paso de prueba", cwd=tmp_path, env=dict(os.environ, PASO_PRUEBA="1"))
+    script = (trabajo.directorio / "trabajo.sh").read_text()
+    for linea in ("#SBATCH --job-name=paso_de_prueba", "#SBATCH --cpus-per-task=2", "#SBATCH --mem=1536M",
+                  "#SBATCH --time=0:30:00", "#SBATCH --gres=gpu:1", "#SBATCH --partition=gpu",
+                  "#SBATCH --account=lab", "export PASO_PRUEBA=1"):
+        assert linea in script
+    medida = cola.esperar(trabajo)
+    assert medida["codigo"] == 0 and medida["trabajo"] == trabajo.id and medida["ejecutor"] == "lotes"
+    assert "hola" in trabajo.log.read_text()
+
+
+def test_codigo_de_salida_del_nodo(cola):
+    trabajo = cola.enviar([PYTHON, "-c", "import sys; sys.exit(3)"])
+    assert cola.esperar(trabajo)["codigo"] == 3
+
+
+def test_trabajo_que_desaparece_de_la_cola(cola, tmp_path, monkeypatch):
+    # un "sbatch" que da un id pero no arranca nada: squeue deja de verlo y
+    # estado.json no llega nunca
+    monkeypatch.setattr(executor, "ESPERA_ESTADO", 0.1)
+    cola.cmd_enviar = [PYTHON, "-c", "print('4242')"]
+    trabajo = cola.enviar([PYTHON, "-c", "pass"])
+    medida = cola.esperar(trabajo)
+    assert medida["codigo"] == -1 and medida["estado_cola"] == "desaparecido"
+
+
+def test_cancelar_un_trabajo_en_marcha(cola, tmp_path):
+    trabajo = cola.enviar([PYTHON, "-c", "import time; time.sleep(60)"])
+    estado = tmp_path / "cola" / f"{trabajo.id}.estado"
+    esperar_hasta(lambda: estado.exists() and estado.read_text().strip() == "RUNNING")
+    medidas = []
+    hilo = threading.Thread(target=lambda: medidas.append(cola.esperar(trabajo)))
+    hilo.start()
+    cola.cancelar(trabajo)
+    hilo.join(10)
+    assert medidas and medidas[0]["codigo"] == -signal.SIGTERM
+    assert estado.read_text().strip() == "CANCELLED"
+    pid = int((tmp_path / "cola" / f"{trabajo.id}.pid").read_text())
+    esperar_hasta(lambda: not _vivo(pid))
+
+
+def _vivo(pid):
+    try:
+        os.killpg(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_memoria_de_diamond_en_local():
+    import annotation_with_diamond as homologia
+    anterior = executor.usar(EjecutorLocal(cpus=8, mem_gb=16))
+    try:
+        assert homologia.recursos_diamond(4) == Recursos(cpus=4, mem_gb=8, horas=48)
+        executor.usar(EjecutorLotes(intervalo=1))
+        assert homologia.recursos_diamond(4).mem_gb == homologia.RECURSOS_DIAMOND.mem_gb
+    finally:
+        executor.usar(anterior)
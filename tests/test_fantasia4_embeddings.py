@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+"""FANTASIA4 sólo usa el almacén de embeddings con un pipeline que acepta OPCION_EMBEDDINGS."""
+
+import FANTASIA4
+
+
+def test_pipeline_sin_opcion_desactiva_el_almacen(tmp_path, monkeypatch):
+    script = tmp_path / "fantasia_pipeline.py"
+    script.write_text("import argparse\np = argparse.ArgumentParser()\np.add_argument('--device')\n")
+    monkeypatch.setattr(FANTASIA4, "FANTASIA4", str(script))
+    monkeypatch.setattr(FANTASIA4, "CACHE_EMBEDDINGS", str(tmp_path / "almacen"))
+    monkeypatch.setattr(FANTASIA4, "_acepta_embeddings", {})
+    assert not FANTASIA4.pipeline_acepta_embeddings()
+    assert FANTASIA4.abrir_cache_embeddings() is None
+    assert not (tmp_path / "almacen").exists()
+
+
+def test_pipeline_parcheado_lo_acepta(tmp_path, monkeypatch):
+    script = tmp_path / "fantasia_pipeline.py"
+    script.write_text(f"p.add_argument('{FANTASIA4.OPCION_EMBEDDINGS}')\n")
+    monkeypatch.setattr(FANTASIA4, "FANTASIA4", str(script))
+    monkeypatch.setattr(FANTASIA4, "_acepta_embeddings", {})
+    assert FANTASIA4.pipeline_acepta_embeddings()
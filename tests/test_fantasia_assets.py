@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""Assets compilados servidos por el worker: lo que el pipeline puede hacer con ellos y lo que no."""
+
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import fantasia_worker  # noqa: E402
+from fantasia_assets import AssetsFantasia, NpzResidente  # noqa: E402
+
+JSONS = {
+    "accessions": ["P12345", "Q9XYZ1", "A0A0Ñ"],
+    "annotations": [["GO:0000001", "GO:0000002"], [], ["GO:0000002"]],
+    "go_por_acc": {"P12345": ["GO:0000001"], "Q9XYZ1": [], "A0A0Ñ": ["GO:0000002", "GO:0000003"]},
+    "nombres": {"P12345": "quinasa", "Q9XYZ1": "proteína"},
+    "longitudes": {"P12345": 120, "Q9XYZ1": 7.5},
+}
+
+
+@pytest.fixture
+def assets(tmp_path, monkeypatch):
+    """Fuentes de prueba compiladas y el hook del worker instalado (se deshace al terminar)."""
+    fuentes = {}
+    for nombre, datos in JSONS.items():
+        fuentes[nombre] = tmp_path / f"{nombre}.json"
+        fuentes[nombre].write_text(json.dumps(datos, ensure_ascii=False), encoding="utf-8")
+    fuentes["lookup_table"] = tmp_path / "lookup_table.npz"
+    np.savez_compressed(fuentes["lookup_table"], embeddings=np.arange(12, dtype=np.float32).reshape(3, 4),
+                        ids=np.array([0, 1, 2]))
+    compilados = tmp_path / "compilados"
+    AssetsFantasia(compilados).asegurar(fuentes.values())
+
+    monkeypatch.setattr(json, "load", json.load)
+    monkeypatch.setattr(np, "load", np.load)
+    fantasia_worker._memorizar_cargas([str(p) for p in fuentes.values()], compilados)
+    return fuentes
+
+
+def cargar_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_el_pipeline_recibe_las_vistas_mapeadas(assets):
+    acc = cargar_json(assets["accessions"])
+    assert acc is cargar_json(assets["accessions"])  # memorizado: la segunda especie no recarga
+    assert len(acc) == 3 and acc[0] == "P12345" and acc[-1] == "A0A0Ñ" and list(acc) == JSONS["accessions"]
+    assert acc[1:] == JSONS["accessions"][1:] and "Q9XYZ1" in acc
+
+    ann = cargar_json(assets["annotations"])
+    assert [ann[i] for i in range(len(ann))] == JSONS["annotations"] and ann[-1] == ["GO:0000002"]
+
+    go = cargar_json(assets["go_por_acc"])
+    assert go == JSONS["go_por_acc"]  # Mapping compara con dict
+    assert go["A0A0Ñ"] == ["GO:0000002", "GO:0000003"] and go.get("NOEXISTE", []) == []
+    assert "P12345" in go and "NOEXISTE" not in go and 3 not in go
+    assert dict(go.items()) == JSONS["go_por_acc"]
+
+    assert cargar_json(assets["nombres"])["Q9XYZ1"] == "proteína"
+    assert cargar_json(assets["longitudes"]) == JSONS["longitudes"]
+
+    lookup = np.load(assets["lookup_table"])
+    assert isinstance(lookup, NpzResidente) and sorted(lookup.files) == ["embeddings", "ids"]
+    with lookup as datos:
+        assert datos["embeddings"].shape == (3, 4) and datos["embeddings"][2, 3] == 11
+
+
+def test_lo_que_no_admiten_las_vistas(assets):
+    acc, go = cargar_json(assets["accessions"]), cargar_json(assets["go_por_acc"])
+    assert not isinstance(acc, list) and not isinstance(go, dict)
+    with pytest.raises(TypeError):
+        json.dumps(go)
+    with pytest.raises(TypeError):
+        go["P12345"] = []
+    with pytest.raises(TypeError):
+        acc[0] = "X"
+    with pytest.raises(KeyError):
+        go["NOEXISTE"]
+
+
+def test_otros_ficheros_se_leen_normal(assets, tmp_path):
+    otro = tmp_path / "otro.json"
+    otro.write_text('{"a": [1]}')
+    assert cargar_json(otro) == {"a": [1]} and isinstance(cargar_json(otro), dict)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+"""Workers persistentes de FANTASIA4: cada hilo con su worker, sin compartir el Pipe."""
+
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from fantasia_worker import TrabajadoresPorDispositivo
+
+SCRIPT = """
+import sys, time
+time.sleep(float(sys.argv[2]))
+open(sys.argv[1], "w").write(sys.argv[1])
+sys.exit(int(sys.argv[3]))
+"""
+
+
+@pytest.fixture
+def trabajadores(tmp_path, monkeypatch):
+    monkeypatch.setattr("fantasia_worker.registrar", lambda *a, **k: None)
+    script = tmp_path / "pipeline.py"
+    script.write_text(SCRIPT)
+    with TrabajadoresPorDispositivo(script) as t:
+        yield t, script
+
+
+def test_misma_plaza_cpu_a_la_vez_usa_workers_distintos(trabajadores, tmp_path):
+    t, script = trabajadores
+    usados, errores = {}, []
+
+    def especie(nombre, espera):
+        try:
+            with t.reservar("cpu") as trabajador:
+                usados[nombre] = trabajador
+                trabajador.ejecutar([sys.executable, script, tmp_path / nombre, espera, 0], "run_fantasia", nombre)
+        except Exception as e:  # pragma: no cover - se comprueba abajo
+            errores.append(e)
+
+    hilos = [threading.Thread(target=especie, args=(n, e)) for n, e in (("lenta", 1.0), ("rapida", 0.1))]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join(60)
+    assert not errores
+    assert usados["lenta"] is not usados["rapida"]
+    assert (tmp_path / "lenta").read_text().endswith("lenta") and (tmp_path / "rapida").read_text().endswith("rapida")
+
+    with t.reservar("cpu") as trabajador:  # los dos vuelven a quedar libres y se reutilizan
+        assert trabajador in usados.values()
+
+
+def test_un_worker_no_se_comparte(trabajadores, tmp_path):
+    t, script = trabajadores
+    with t.reservar("cuda:0") as trabajador:
+        hilo = threading.Thread(target=trabajador.ejecutar,
+                                args=([sys.executable, script, tmp_path / "a", 1.0, 0], "run_fantasia", "a"))
+        hilo.start()
+        while not trabajador.en_uso.locked():
+            pass
+        with pytest.raises(RuntimeError):
+            trabajador.ejecutar([sys.executable, script, tmp_path / "b", 0, 0], "run_fantasia", "b")
+        hilo.join(60)
+        with pytest.raises(subprocess.CalledProcessError):
+            trabajador.ejecutar([sys.executable, script, tmp_path / "c", 0, 3], "run_fantasia", "c")
+    assert (tmp_path / "a").exists() and not (tmp_path / "b").exists()
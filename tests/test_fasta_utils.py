@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+"""fasta_utils: deduplicado, re-expansión de tablas y normalizado por bloques."""
+
+import pytest
+
+import fasta_utils
+from fasta_utils import deduplicar_fasta, expandir_tabla, leer_fasta, leer_mapa_dedup, normalizar_fasta
+
+
+def test_expandir_tabla_restaura_los_duplicados(tmp_path):
+    fasta = tmp_path / "sp.faa"
+    fasta.write_text(">a desc\nMKV\n>b\nMKV\n>c\nAAA\n>d\nmkv\n>e\nCCC\n", encoding="utf-8")
+    unicas, mapa = tmp_path / "sp.unique.faa", tmp_path / "sp.dedup.tsv"
+    assert deduplicar_fasta(fasta, unicas, mapa) == (5, 3)
+    assert leer_mapa_dedup(mapa) == [("a", "a"), ("b", "a"), ("c", "c"), ("d", "a"), ("e", "e")]
+
+    # tabla sobre los representantes, en otro orden, con cabecera y un
+    # representante con dos líneas; "e" no tiene hits
+    tabla = tmp_path / "sp.unique.o6.txt"
+    tabla.write_text("# cabecera\nc\tsp|P3\t90\na\tsp|P1\t80\na\tsp|P2\t70\n", encoding="utf-8")
+    expandida = tmp_path / "sp.o6.txt"
+    expandir_tabla(tabla, expandida, mapa)
+    assert expandida.read_text(encoding="utf-8") == (
+        "# cabecera\n"
+        "a\tsp|P1\t80\na\tsp|P2\t70\n"
+        "b\tsp|P1\t80\nb\tsp|P2\t70\n"
+        "c\tsp|P3\t90\n"
+        "d\tsp|P1\t80\nd\tsp|P2\t70\n"
+    )
+
+
+def registros_esperados(registros):
+    """Lo que debe salir de normalizar_fasta: id, y secuencia sin . ni *."""
+    return [(prot.split()[0], seq.replace(".", "").replace("*", "")) for prot, seq in registros]
+
+
+@pytest.mark.parametrize("bloque", [1, 2, 3, 5, 7, 64])
+def test_normalizar_con_bloques_pequenos(tmp_path, monkeypatch, bloque):
+    # con bloques de pocos bytes todos los registros cruzan algún límite,
+    # incluido el que cae entre el salto de línea y el ">"
+    registros = [("a desc larga", "MKV.LL*"), ("bb", "A" * 130), ("c x", "C"), ("dd", "KLM*")]
+    fasta = tmp_path / "sp.faa"
+    fasta.write_text("".join(f">{p}\n{s[:50]}\n{s[50:]}\n" for p, s in registros), encoding="utf-8")
+    monkeypatch.setattr(fasta_utils, "BLOQUE", bloque)
+
+    limpio = tmp_path / "sp.clean.faa"
+    assert normalizar_fasta(fasta, limpio) == (4, 0)
+    assert list(leer_fasta(limpio)) == registros_esperados(registros)
+
+
+def test_registro_que_cruza_el_limite_de_bloque(tmp_path):
+    # relleno hasta justo antes del límite de BLOQUE (16 MB); el registro
+    # siguiente empieza a 100 bytes de él y termina 500 bytes después
+    relleno = "M" * 1_000_000
+    registros, tam = [], 0
+    while tam < fasta_utils.BLOQUE - 1_100_000:
+        linea = f">r{len(registros)}\n{relleno}\n"
+        registros.append((f"r{len(registros)}", relleno))
+        tam += len(linea)
+    resto = fasta_utils.BLOQUE - 100 - tam - len(">r_pad\n\n")
+    registros.append(("r_pad", "P" * resto))
+    registros.append(("cruza desc", "ACDEFGHIKL" * 60))
+    fasta = tmp_path / "grande.faa"
+    with fasta.open("w", encoding="utf-8") as f:
+        for prot, seq in registros:
+            f.write(f">{prot}\n{seq}\n")
+    with fasta.open("rb") as f:
+        assert f.read().index(b">cruza") == fasta_utils.BLOQUE - 100
+
+    limpio = tmp_path / "grande.clean.faa"
+    assert normalizar_fasta(fasta, limpio) == (len(registros), 0)
+    assert list(leer_fasta(limpio))[-1] == ("cruza", "ACDEFGHIKL" * 60)
+    assert list(leer_fasta(limpio)) == registros_esperados(registros)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""Ventanas, lotes por longitud y recombinación de length_batching (sin GPU)."""
+
+import pytest
+
+from length_batching import (SEPARADOR_VENTANA, agrupar_por_longitud, leer_manifiesto, preparar_lotes,
+                             recombinar_directorio, recombinar_tabla, trocear, ventanas)
+
+
+# ventanas =====================================================================
+def test_sin_partir_hasta_max_len():
+    assert ventanas(100, 100, 10) == [(0, 100)]
+    assert ventanas(5, 100, 10) == [(0, 5)]
+    assert ventanas(1000, 0, 10) == [(0, 1000)]  # max_len 0 = sin ventanas
+
+
+def test_ventanas_solapadas_cubren_todo():
+    assert ventanas(10, 4, 1) == [(0, 4), (3, 7), (6, 10)]
+    tramos = ventanas(2500, 1000, 200)
+    assert tramos[0][0] == 0 and tramos[-1][1] == 2500
+    assert all(fin - inicio == 1000 for inicio, fin in tramos)
+    for (_, fin_anterior), (inicio, _) in zip(tramos, tramos[1:]):
+        assert fin_anterior - inicio >= 200  # al menos el solape (la última puede solapar más)
+
+
+def test_una_mas_que_max_len_da_dos_ventanas():
+    assert ventanas(101, 100, 10) == [(0, 100), (1, 101)]
+
+
+def test_solape_no_menor_que_la_ventana():
+    with pytest.raises(ValueError):
+        ventanas(500, 100, 100)
+
+
+def test_trocear_ids_y_trozos():
+    piezas = trocear([("corta", "ACDE"), ("larga", "ABCDEFGHIJ")], 4, 1)
+    assert [p.id for p, _ in piezas] == ["corta", f"larga{SEPARADOR_VENTANA}1",
+                                         f"larga{SEPARADOR_VENTANA}2", f"larga{SEPARADOR_VENTANA}3"]
+    assert [seq for _, seq in piezas] == ["ACDE", "ABCD", "DEFG", "GHIJ"]
+    assert [(p.prot, p.orden, p.ventana) for p, _ in piezas][1:] == [("larga", 1, 0), ("larga", 1, 1), ("larga", 1, 2)]
+
+
+# lotes ========================================================================
+def test_lote_justo_en_el_presupuesto():
+    # 4 x 25 = 100 cabe; con una quinta (5 x 25) no
+    assert agrupar_por_longitud([25] * 5, 100) == [[0, 1, 2, 3], [4]]
+
+
+def test_lotes_de_mas_larga_a_mas_corta_sin_pasar_del_presupuesto():
+    longitudes = [10, 300, 50, 50, 20, 300, 5]
+    lotes = agrupar_por_longitud(longitudes, 600)
+    assert sorted(i for lote in lotes for i in lote) == list(range(len(longitudes)))
+    assert lotes[0] == [1, 5]
+    for lote in lotes:
+        assert len(lote) * max(longitudes[i] for i in lote) <= 600
+
+
+def test_secuencia_mayor_que_el_presupuesto_va_sola():
+    assert agrupar_por_longitud([1000, 10, 10], 100) == [[0], [1, 2]]
+
+
+def test_preparar_lotes_y_manifiesto(tmp_path):
+    fasta = tmp_path / "in.faa"
+    fasta.write_text(">a\nMKV\n>b\nMKVLAAGGHHKK\n>c\nMK\n")
+    out, mf = tmp_path / "lotes.faa", tmp_path / "lotes.tsv"
+    assert preparar_lotes(fasta, out, mf, presupuesto=8, max_len=8, solape=2) == (3, 4, 3)
+    piezas = leer_manifiesto(mf)
+    assert [p.id for p in piezas][0].startswith("b" + SEPARADOR_VENTANA)  # más largas primero
+    assert {p.prot for p in piezas} == {"a", "b", "c"}
+    assert out.read_text().count(">") == 4
+
+
+# recombinación ================================================================
+@pytest.fixture
+def manifiesto(tmp_path):
+    fasta = tmp_path / "in.faa"
+    fasta.write_text(">p1\nMKVLAAGGHH\n>p2\nMK\n")  # p1 se parte en ventanas de 6
+    mf = tmp_path / "lotes.tsv"
+    preparar_lotes(fasta, tmp_path / "lotes.faa", mf, presupuesto=100, max_len=6, solape=2)
+    return mf
+
+
+def test_formato_lista_une_las_ventanas(tmp_path, manifiesto):
+    v1, v2 = f"p1{SEPARADOR_VENTANA}1", f"p1{SEPARADOR_VENTANA}2"
+    tabla = tmp_path / "topgo.tsv"
+    tabla.write_text(f"{v2}\tGO:3, GO:1\np2\tGO:9\n{v1}\tGO:1, GO:2\n")
+    recombinar_tabla(tabla, tmp_path / "out.tsv", manifiesto)
+    assert (tmp_path / "out.tsv").read_text() == "p1\tGO:3, GO:1, GO:2\np2\tGO:9\n"  # orden de aparición
+
+
+def test_varias_columnas_sin_lineas_repetidas(tmp_path, manifiesto):
+    v1, v2 = f"p1{SEPARADOR_VENTANA}1", f"p1{SEPARADOR_VENTANA}2"
+    tabla = tmp_path / "pares.tsv"
+    tabla.write_text(f"#cabecera\n{v1}\tGO:1\t0.9\n{v2}\tGO:1\t0.9\n{v2}\tGO:1\t0.5\n"
+                     f"p2\tGO:9\t0.1\np2\tGO:9\t0.1\n")
+    recombinar_tabla(tabla, tmp_path / "out.tsv", manifiesto)
+    # las partidas se deduplican; las no partidas se dejan tal cual
+    assert (tmp_path / "out.tsv").read_text() == ("#cabecera\np1\tGO:1\t0.9\np1\tGO:1\t0.5\n"
+                                                 "p2\tGO:9\t0.1\np2\tGO:9\t0.1\n")
+
+
+def test_recombinar_directorio_copia_lo_demas(tmp_path, manifiesto):
+    origen = tmp_path / "outputs"
+    (origen / "sub").mkdir(parents=True)
+    (origen / "sub" / "t.tsv").write_text(f"p1{SEPARADOR_VENTANA}1\tGO:1\np2\tGO:2\n")
+    (origen / "info.json").write_text("{}")
+    recombinar_directorio(origen, tmp_path / "final", manifiesto)
+    assert (tmp_path / "final" / "sub" / "t.tsv").read_text() == "p1\tGO:1\np2\tGO:2\n"
+    assert (tmp_path / "final" / "info.json").read_text() == "{}"